@@ -1,10 +1,17 @@
 import streamlit as st
 import plotly.graph_objects as go
-import networkx as nx
-import pandas as pd
 import numpy as np
+import os
 import time
-from simulation.model import BancoModel
+import parametros as p
+from simulation.estadisticas import AgregadorReplicas, CriterioPrecision
+from simulation.perfilado import InformePerfil, Perfilador
+from simulation.red import CACHE_TOPOLOGIAS, DISPOSICIONES
+from simulation.cache_resultados import CacheResultados
+from simulation.runner import ejecutar_replicas, iterar_replicas_adaptativo, plan_replicas
+from simulation.segundo_plano import BufferFotogramas, SimulacionEnSegundoPlano
+from simulation.sensibilidad import SuperficieQuiebra
+from simulation.trayectorias import DIRECTORIO_TRAYECTORIAS, TrayectoriaGrabada, listar_trayectorias
 
 st.set_page_config(page_title="Stress Test Lab v2 - Human Impact", layout="wide")
 st.markdown("""
@@ -37,21 +44,136 @@ st.markdown("""
     </style>
 """, unsafe_allow_html=True)
 # --- FUNCIONES AUXILIARES ---
-def get_color_fuga(agente):
-    if not agente.alcance_noticia:
+def get_color_fuga(alcance, fuga):
+    if not alcance:
         return 'rgb(34, 139, 34)'
-    fuga = agente.porcentaje_retirado
     if fuga < 0.05:
         return 'rgb(255, 165, 0)'
     sensibilidad = min((fuga - 0.05) / 0.20, 1.0)
     return f'rgb(255, {int(165 * (1 - sensibilidad))}, 0)'
 
-def get_color_no_cliente(agente):
-    if not agente.alcance_noticia:
+def get_color_no_cliente(alcance, fuga):
+    if not alcance:
         return 'rgb(100, 100, 100)'
-    intensidad = np.nan_to_num(agente.porcentaje_retirado)
+    intensidad = np.nan_to_num(fuga)
     return f'rgb({int(100 * (1 - intensidad))}, {int(150 + (105 * intensidad))}, 255)'
 
+def trazas_nodos_clasicas(estado, pos, representacion):
+    # Dibujo nodo a nodo (una sola traza con color, tamaño y texto por nodo) desde estado_nodos()
+    node_x, node_y, colors, text, sizes, symbols = [], [], [], [], [], []
+    for i, (tipo, alcance, fuga, saldo) in enumerate(zip(estado["tipo"].tolist(), estado["alcance"].tolist(),
+                                                         estado["fuga"].tolist(), estado["saldo"].tolist())):
+        x, y = pos[i]
+        node_x.append(x); node_y.append(y)
+        if tipo == NO_CLIENTE:
+            colors.append(get_color_no_cliente(alcance, fuga)); sizes.append(11); symbols.append("diamond")
+            text.append(
+            f"<b>📢 OPINIÓN PÚBLICA (No-Cliente)</b><br>"
+            f"Estado: {'Difundiendo' if alcance else 'Inactivo'}<br>"
+            f"Intensidad Rumor: {fuga*100:.1f}%"
+        )
+        else:
+            colors.append(get_color_fuga(alcance, fuga)); sizes.append(15 if fuga > 0.1 else 13); symbols.append("circle")
+            text.append(
+            f"<b>🏦 CLIENTE ({p.TIPOS_NODO[tipo]})</b><br>"
+            f"Población: {int(representacion):,}<br>"
+            f"Fuga: {fuga*100:.1f}%<br>"
+            f"Saldo: {saldo:,.0f}€"
+        )
+
+    return [go.Scatter(x=node_x, y=node_y, mode='markers', hoverinfo='text', text=text,
+                       marker=dict(color=colors, size=sizes, symbol=symbols, line=dict(color='white', width=0.5)),showlegend=False)]
+
+# --- DIBUJO RÁPIDO DE LA RED (WebGL) ---
+# Mismos colores que get_color_fuga / get_color_no_cliente, pero como escalas de color sobre
+# un valor numérico por nodo: -1 = no informado, [0, 1] = intensidad de la fuga o del rumor
+ESCALA_CLIENTE = [[0.0, 'rgb(34, 139, 34)'], [0.4999, 'rgb(34, 139, 34)'], [0.5, 'rgb(255, 165, 0)'], [1.0, 'rgb(255, 0, 0)']]
+ESCALA_NO_CLIENTE = [[0.0, 'rgb(100, 150, 255)'], [1.0, 'rgb(0, 255, 255)']]
+# Redibujar antes de k turnos si informadas, huidas o caja se han movido más que esta fracción
+UMBRAL_REDIBUJO = 0.05
+NO_CLIENTE = p.TIPOS_NODO.index("No-Cliente")
+
+def punto_leyenda(nombre, color, simbolo):
+    return go.Scatter(x=[None], y=[None], mode='markers', marker=dict(size=8, color=color, symbol=simbolo), # Tamaño 8 para que sea más pequeño
+                      name=nombre, showlegend=True)
+
+# La leyenda no cambia entre turnos: se crea una sola vez
+LEYENDA_GRAFO = [
+    punto_leyenda('Cliente: Tranquilo', 'rgb(34, 139, 34)', 'circle'),
+    punto_leyenda('Cliente: Alerta (Fuga < 5%)', 'rgb(255, 165, 0)', 'circle'),
+    punto_leyenda('Cliente: Fuga Crítica', 'rgb(255, 0, 0)', 'circle'),
+    punto_leyenda('Opinión: Inactiva', 'rgb(100, 100, 100)', 'diamond'),
+    punto_leyenda('Opinión: Difundiendo', 'rgb(100, 150, 255)', 'diamond'),
+]
+
+def layout_grafo(t):
+    return dict(
+        title=f"Red de Influencia Social | Turno: {t}",
+        template="plotly_dark",
+        height=600,
+        margin=dict(b=0, l=0, r=0, t=40),
+        showlegend=True,
+        legend=dict(
+            yanchor="top",
+            y=0.99,
+            xanchor="left",
+            x=0.0,              # Pegado al borde izquierdo
+            bgcolor="rgba(0,0,0,0.4)", 
+            font=dict(size=9),  # Texto pequeño
+            itemsizing='constant',
+            itemwidth=30,       # Símbolos más compactos
+            tracegroupgap=0     # Espacio mínimo entre grupos
+        ),
+        xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
+        yaxis=dict(showgrid=False, zeroline=False, showticklabels=False)
+    )
+
+def trazas_aristas_rapidas(topologia, pos):
+    # Todas las aristas en una sola traza WebGL, construida desde la adyacencia CSR (una vez por réplica).
+    # Coordenadas redondeadas: el JSON que Streamlit envía en cada redibujo pesa bastante menos
+    origen = np.repeat(np.arange(topologia.n), np.diff(topologia.indptr))
+    destino = topologia.indices
+    una_vez = origen < destino
+    origen, destino = origen[una_vez], destino[una_vez]
+    separador = np.full(len(origen), np.nan)
+    edge_x = np.column_stack([pos[origen, 0], pos[destino, 0], separador]).ravel().round(4)
+    edge_y = np.column_stack([pos[origen, 1], pos[destino, 1], separador]).ravel().round(4)
+    return go.Scattergl(x=edge_x, y=edge_y, line=dict(width=0.4, color='#555'), mode='lines', hoverinfo='none', showlegend=False)
+
+def trazas_nodos_rapidas(estado, pos, representacion):
+    # Una traza WebGL por tipo de cliente y por estado de la opinión pública. El texto de
+    # hover es una plantilla por traza (Plotly la rellena al pasar el ratón con customdata)
+    # en vez de una cadena HTML por nodo y turno.
+    tipo, alcance, fuga = estado["tipo"], estado["alcance"], np.nan_to_num(estado["fuga"])
+    trazas = []
+    for codigo, nombre in enumerate(p.TIPOS_NODO):
+        if codigo == NO_CLIENTE:
+            continue
+        idx = np.flatnonzero(tipo == codigo)
+        if not len(idx):
+            continue
+        valor = np.where(alcance[idx], np.where(fuga[idx] < 0.05, 0.0, np.minimum((fuga[idx] - 0.05) / 0.20, 1.0)), -1.0)
+        trazas.append(go.Scattergl(
+            x=pos[idx, 0], y=pos[idx, 1], mode='markers', showlegend=False,
+            customdata=np.column_stack([fuga[idx] * 100, estado["saldo"][idx]]),
+            hovertemplate=f"<b>🏦 CLIENTE ({nombre})</b><br>Población: {int(representacion):,}<br>"
+                          "Fuga: %{customdata[0]:.1f}%<br>Saldo: %{customdata[1]:,.0f}€<extra></extra>",
+            marker=dict(color=valor, colorscale=ESCALA_CLIENTE, cmin=-1, cmax=1, size=np.where(fuga[idx] > 0.1, 15, 13),
+                        symbol='circle', line=dict(color='white', width=0.5))))
+
+    no_cliente = tipo == NO_CLIENTE
+    for informado, estado_rumor in ((False, "Inactivo"), (True, "Difundiendo")):
+        idx = np.flatnonzero(no_cliente & (alcance == informado))
+        if not len(idx):
+            continue
+        color = dict(color=fuga[idx], colorscale=ESCALA_NO_CLIENTE, cmin=0, cmax=1) if informado else dict(color='rgb(100, 100, 100)')
+        trazas.append(go.Scattergl(
+            x=pos[idx, 0], y=pos[idx, 1], mode='markers', showlegend=False, customdata=fuga[idx] * 100,
+            hovertemplate=f"<b>📢 OPINIÓN PÚBLICA (No-Cliente)</b><br>Estado: {estado_rumor}<br>"
+                          "Intensidad Rumor: %{customdata:.1f}%<extra></extra>",
+            marker=dict(**color, size=11, symbol='diamond', line=dict(color='white', width=0.5))))
+    return trazas
+
 # --- SIDEBAR: CONFIGURACIÓN ---
 st.markdown("""<style>.sidebar-title { margin-top: -55px; }</style>""", unsafe_allow_html=True)
 
@@ -71,18 +193,104 @@ validez = st.sidebar.slider("Credibilidad del Medio", 0.0, 1.0, 0.9)
 difusion = st.sidebar.slider("% Difusión Inicial (Alcance)", 0.0, 1.0, 0.4)
 
 st.sidebar.header("⏱️ Control de Simulación")
-velocidad = st.sidebar.slider("Segundos por turno", 0.0, 2.0, 0.1)
+# Reproducir: recorre una corrida grabada (main.py --grabar o la casilla de grabación) sin volver a simular
+reproducir = st.sidebar.radio("Modo", ["Simular", "Reproducir grabación"], horizontal=True) == "Reproducir grabación"
+velocidad = st.sidebar.slider("Segundos por fotograma", 0.0, 2.0, 0.1)
+# Desacoplada: el cálculo no espera a la animación, que muestra el turno más reciente en cada fotograma
+paso_a_paso = st.sidebar.selectbox("Animación", ["Desacoplada (cálculo a máxima velocidad)", "Paso a paso (todos los turnos)"], index=0).startswith("Paso")
 max_turnos = st.sidebar.slider("Turnos máximos", 5, 500, 150)
 n_simulaciones_objetivo = st.sidebar.slider("Nº de Simulaciones a promediar", 1, 50, 5)
+# Réplicas adaptativas: se simula hasta que los IC 95% de la prob. de quiebra y del turno
+# medio de colapso son más estrechos que las tolerancias (con un máximo de simulaciones)
+adaptativo = st.sidebar.checkbox("Réplicas adaptativas (hasta alcanzar precisión)", value=False)
+if adaptativo:
+    tol_prob = st.sidebar.slider("Tolerancia Prob. Quiebra (± puntos %)", 1, 20, 5) / 100
+    tol_turno = st.sidebar.slider("Tolerancia Turno Colapso (± turnos)", 0.5, 10.0, 2.0)
+    max_simulaciones = st.sidebar.slider("Máximo de Simulaciones", 10, 500, 200)
+# Con la misma semilla los escenarios comparados comparten red y población; "comunes" alinea además
+# los sorteos de difusión (y con ellos el orden de activación) y "antitéticas" los empareja (u y 1-u)
+REDUCCIONES_VARIANZA = {"Ninguna": None, "Sorteos de difusión comunes": "comun", "Réplicas antitéticas (difusión)": "antitetico"}
+reduccion_varianza = st.sidebar.selectbox(
+    "Reducción de varianza", list(REDUCCIONES_VARIANZA), index=0,
+    help="Comunes: mismos sorteos de difusión al comparar escenarios con la misma semilla. "
+         "Antitéticas: medido con n = 200, no reduce la varianza de forma apreciable (la correlación "
+         "dentro de cada pareja no se distingue de 0); no empeora el IC, pero tampoco ahorra réplicas.")
+# Réplicas ya simuladas (mismos parámetros, semilla y código) se recuperan del disco sin volver a simularlas
+usar_cache = st.sidebar.checkbox("Reutilizar resultados guardados (caché en disco)", value=True)
+
+@st.cache_resource
+def obtener_cache():
+    return CacheResultados()
+
+if usar_cache and st.sidebar.button("Vaciar caché de resultados"):
+    obtener_cache().vaciar()
+semilla = int(st.sidebar.number_input("Semilla", value=42, step=1))
+modo_paralelo = st.sidebar.checkbox("Ejecución paralela (sin animación)", value=False)
+# Estado de cada agente turno a turno en resultados/trayectorias/<fecha>/replica_XXX (solo animada)
+grabar_trayectorias = not modo_paralelo and st.sidebar.checkbox("Grabar trayectorias (para reproducirlas)", value=False)
+activacion_selectiva = st.sidebar.checkbox("Activación selectiva (omitir agentes inactivos)", value=False)
+perfilar = st.sidebar.checkbox("Perfilar fases del turno (informe de tiempos)", value=False)
+modo_dibujo = st.sidebar.selectbox("Dibujo de la red", ["Rápido (WebGL)", "Clásico"], index=0)
+dibujo_rapido = modo_dibujo == "Rápido (WebGL)"
+if dibujo_rapido:
+    redibujar_cada = st.sidebar.slider("Redibujar cada k turnos", 1, 20, 1)
 
 st.sidebar.header("👥 Estructura de la Población")
 n_agentes = st.sidebar.slider("Nº Total de Nodos (Red)", 50, 1000, 200)
+# 'muestreado' y 'grados' evitan el spring_layout completo en redes grandes
+disposicion = st.sidebar.selectbox("Disposición del grafo", DISPOSICIONES, index=0)
 p_externos = st.sidebar.slider("% de No-Clientes", 0.0, 0.5, 0.2)
 
 st.sidebar.header("💰 Estructura Bancaria")
 dep_input = st.sidebar.number_input("Depósitos Totales (€)", value=10000000)
 encaje = st.sidebar.slider("% Liquidez Inmediata (Caja)", 0.01, 0.30, 0.10)
 
+# --- SUPERFICIE DE QUIEBRA (consulta instantánea, sin simular) ---
+# Se construye aparte con: python main.py --superficie resultados/superficie.joblib
+st.sidebar.header("📈 Superficie de Quiebra")
+ruta_superficie = st.sidebar.text_input("Fichero de superficie", "resultados/superficie.joblib")
+
+@st.cache_resource
+def cargar_superficie(ruta, modificado):
+    # 'modificado' invalida la caché si se regenera el fichero
+    return SuperficieQuiebra.cargar(ruta)
+
+if os.path.exists(ruta_superficie):
+    superficie = cargar_superficie(ruta_superficie, os.path.getmtime(ruta_superficie))
+    estimacion = superficie.consultar(score, validez, difusion, encaje)
+    st.sidebar.metric("Prob. de Quiebra estimada", f"{estimacion['prob_quiebra']*100:.0f}% ± {estimacion['prob_std']*100:.0f}")
+    turno_estimado = estimacion["turno_colapso"]
+    st.sidebar.metric("Turno Medio Colapso estimado",
+                      f"{turno_estimado:.1f} ± {estimacion['turno_std']:.1f}" if estimacion["prob_quiebra"] > 0.05 and np.isfinite(turno_estimado) else "N/A")
+    # La app simula con BancoModel: una superficie del motor vectorizado no es su estimación
+    if not superficie.compatible({"n": n_agentes, "total_depositos": dep_input, "p_no_clientes": p_externos,
+                                   "activacion_selectiva": activacion_selectiva}, motor="mesa"):
+        st.sidebar.warning(f"La superficie se construyó con {superficie.params_base} y el motor {superficie.motor}; "
+                           "con otra red, banco o motor la estimación es solo orientativa.")
+else:
+    st.sidebar.caption("Sin superficie: genérala con main.py --superficie para estimar la quiebra sin simular.")
+
+# --- REPRODUCCIÓN DE TRAYECTORIAS GRABADAS ---
+@st.cache_resource
+def abrir_trayectoria(ruta, modificado):
+    # 'modificado' (tamaño de las series) reabre la grabación si sigue creciendo
+    return TrayectoriaGrabada(ruta)
+
+trayectoria = None
+if reproducir:
+    st.sidebar.header("🎞️ Reproducción")
+    directorio_grabaciones = st.sidebar.text_input("Directorio de grabaciones", DIRECTORIO_TRAYECTORIAS)
+    grabaciones = listar_trayectorias(directorio_grabaciones)
+    if grabaciones:
+        ruta_grabacion = st.sidebar.selectbox("Grabación", grabaciones,
+                                              format_func=lambda r: os.path.relpath(r, directorio_grabaciones))
+        trayectoria = abrir_trayectoria(ruta_grabacion, os.path.getsize(os.path.join(ruta_grabacion, "series.bin")))
+        if len(trayectoria):
+            turno_reproduccion = st.sidebar.slider("Turno", 0, len(trayectoria) - 1, 0)
+        st.sidebar.caption(f"{trayectoria.n:,} nodos, {len(trayectoria)} turnos grabados.")
+    else:
+        st.sidebar.caption("No hay grabaciones: marca 'Grabar trayectorias' al simular o usa main.py --grabar.")
+
 
 
 # --- ÁREA PRINCIPAL ---
@@ -100,189 +308,198 @@ placeholder_grafo = col_graph.empty()
 placeholder_metricas = col_stats.empty()
 placeholder_informe_final = st.empty()
 
-# --- LÓGICA ---
-if p_boton.button("Lanzar Simulación Progresiva", use_container_width=True):
-    historico_series = []
-    todos_los_datos_agentes = []
-    
-    for sim_iter in range(n_simulaciones_objetivo):
-        
-        model = BancoModel(n_agentes, dep_input, encaje, score, validez, difusion, p_no_clientes=p_externos)
-        pos = nx.spring_layout(model.G, seed=42) 
-        
-        # Pre-generar las líneas de la red (Estructura fija durante el run)
-        edge_x, edge_y = [], []
-        for edge in model.G.edges():
-            x0, y0 = pos[edge[0]]
-            x1, y1 = pos[edge[1]]
-            edge_x.extend([x0, x1, None])
-            edge_y.extend([y0, y1, None])
-        edge_trace = go.Scatter(x=edge_x, y=edge_y, line=dict(width=0.4, color='#555'), mode='lines', hoverinfo='none',showlegend=False)
-
-        stats_data = {"paso": [], "liquidez": [], "huidas": [], "informadas": []}
-
-        for t in range(max_turnos):
-            model.step()
-            agentes = model.schedule.agents
-            liq_actual = model.liquidez_banco
-            
-            fuga_total = sum(a.porcentaje_retirado for a in agentes if a.tipo != "No-Cliente")
-            personas_huidas = fuga_total * model.representacion_por_nodo
-            nodos_inf = sum(1 for a in agentes if a.alcance_noticia)
-            personas_inf = nodos_inf * model.representacion_por_nodo
-            intensidad_rumor = (sum(a.porcentaje_retirado for a in agentes if a.tipo == "No-Cliente") / 
-                                sum(1 for a in agentes if a.tipo == "No-Cliente")) if p_externos > 0 else 0
-
-            stats_data["paso"].append(t)
-            stats_data["liquidez"].append(liq_actual)
-            stats_data["huidas"].append(personas_huidas)
-            stats_data["informadas"].append(personas_inf)
-
-            p_titulo.markdown(
-            f"""
-            <div style='margin-top: -15px; margin-bottom: 5px;'>
-                <p style='margin: 0px; font-size: 36px; font-weight: 600; color: white;'>
-                    Lanzando Simulación {sim_iter + 1}/{n_simulaciones_objetivo} ...
-                </p>
-            </div>
-            """, 
-            unsafe_allow_html=True
-            )
+def trazas_aristas(topologia, pos):
+    # Líneas de la red (estructura fija durante cada réplica)
+    if dibujo_rapido:
+        return trazas_aristas_rapidas(topologia, pos)
+    edge_x, edge_y = [], []
+    for edge in topologia.G.edges():
+        x0, y0 = pos[edge[0]]
+        x1, y1 = pos[edge[1]]
+        edge_x.extend([x0, x1, None])
+        edge_y.extend([y0, y1, None])
+    return go.Scatter(x=edge_x, y=edge_y, line=dict(width=0.4, color='#555'), mode='lines', hoverinfo='none',showlegend=False)
+
+def dibujar_turno(t, edge_trace, pos, estado, representacion, resumen, poblacion, serie):
+    # 1. Dibujar Grafo 
+    trazas_nodos = trazas_nodos_rapidas if dibujo_rapido else trazas_nodos_clasicas
+    node_traces = trazas_nodos(estado, pos, representacion)
+
+    # --- FIGURA DEL GRAFO ---
+    fig_grafo = go.Figure(data=[edge_trace] + node_traces + LEYENDA_GRAFO)
+    fig_grafo.update_layout(**layout_grafo(t))
+    if dibujo_rapido:
+        fig_grafo.update_layout(uirevision="grafo")  # Conserva el zoom entre redibujos
+
+    placeholder_grafo.plotly_chart(fig_grafo, use_container_width=True)
+
+    # 2. Métricas y Gráfico Rojo
+    with placeholder_metricas.container():
+        st.metric("Clientes que han huido", f"{int(resumen['huidas']):,}")
+        st.metric("Alcance Poblacional", f"{(resumen['informadas'] / poblacion)*100:.1f}%")
+        st.metric("Intensidad Rumor", f"{resumen['intensidad_rumor']*100:.1f}%")
+
+        fig_liq = go.Figure(go.Scatter(x=serie["paso"][:t + 1], y=serie["liquidez"][:t + 1], fill='tozeroy', line=dict(color="#FF0000")))
+        fig_liq.update_layout(title="Fuga de Depósitos (Caja)", template="plotly_dark", height=300, margin=dict(l=20, r=20, t=40, b=20))
+        st.plotly_chart(fig_liq, use_container_width=True)
 
-            # 1. Dibujar Grafo 
-            node_x, node_y, colors, text, sizes, symbols = [], [], [], [], [], []
-            for a in agentes:
-                x, y = pos[a.unique_id]
-                node_x.append(x); node_y.append(y)
-                if a.tipo == "No-Cliente":
-                    colors.append(get_color_no_cliente(a)); sizes.append(11); symbols.append("diamond")
-                    text.append(
-                    f"<b>📢 OPINIÓN PÚBLICA (No-Cliente)</b><br>"
-                    f"Estado: {'Difundiendo' if a.alcance_noticia else 'Inactivo'}<br>"
-                    f"Intensidad Rumor: {a.porcentaje_retirado*100:.1f}%"
-                )
-                else:
-                    colors.append(get_color_fuga(a)); sizes.append(15 if a.porcentaje_retirado > 0.1 else 13); symbols.append("circle")
-                    text.append(
-                    f"<b>🏦 CLIENTE ({a.tipo})</b><br>"
-                    f"Población: {int(model.representacion_por_nodo):,}<br>"
-                    f"Fuga: {a.porcentaje_retirado*100:.1f}%<br>"
-                    f"Saldo: {a.saldo:,.0f}€"
+# --- LÓGICA ---
+if reproducir:
+    # Cada turno se lee de los ficheros mapeados en memoria: mover el slider no simula nada
+    if trayectoria is not None and len(trayectoria):
+        p_titulo.markdown(f"### Reproducción: {os.path.basename(trayectoria.directorio)} ({len(trayectoria)} turnos)")
+        topologia = trayectoria.topologia()
+        pos = topologia.posiciones(disposicion)
+        edge_trace = trazas_aristas(topologia, pos)
+        animar = p_boton.button("Reproducir desde el turno", use_container_width=True)
+        turnos_a_dibujar = range(turno_reproduccion, len(trayectoria), redibujar_cada if dibujo_rapido else 1) if animar else [turno_reproduccion]
+        for t in turnos_a_dibujar:
+            dibujar_turno(t, edge_trace, pos, trayectoria.estado(t), trayectoria.meta["representacion_por_nodo"],
+                          trayectoria.resumen(t), trayectoria.meta["poblacion_objetivo"], trayectoria.series)
+            if animar:
+                time.sleep(velocidad)
+    else:
+        p_titulo.markdown("### Sin grabación que reproducir")
+
+elif p_boton.button("Lanzar Simulación Progresiva", use_container_width=True):
+    # Cada réplica terminada se pliega en estadísticos acumulados (no se guardan las series)
+    agregador = AgregadorReplicas(max_turnos)
+    params_modelo = dict(n=n_agentes, total_depositos=dep_input, encaje=encaje, news_score=score,
+                         news_validez=validez, news_difusion=difusion, p_no_clientes=p_externos,
+                         activacion_selectiva=activacion_selectiva)
+    # Mismo plan (semilla y sorteos) por réplica en los dos modos: la ejecución paralela reproduce la animada
+    sorteo_difusion = REDUCCIONES_VARIANZA[reduccion_varianza]
+    n_maximo = max_simulaciones if adaptativo else n_simulaciones_objetivo
+    plan = plan_replicas(semilla, n_maximo, sorteo_difusion)
+    criterio = CriterioPrecision(tol_prob, tol_turno, max_replicas=n_maximo,
+                                 tam_unidad=2 if sorteo_difusion == "antitetico" else 1) if adaptativo else None
+    cache = obtener_cache() if usar_cache else None
+    # Perfilado opcional: fases del turno (modelo y agentes) más construcción y dibujo de la app
+    perfilador = Perfilador() if perfilar else None
+    informe_perfil = InformePerfil()
+
+    if modo_paralelo:
+        if adaptativo:
+            p_titulo.markdown(f"### Ejecutando simulaciones en paralelo hasta alcanzar la precisión (máx. {n_maximo}) ...")
+            resultados = iterar_replicas_adaptativo(params_modelo, max_turnos, criterio, seed=semilla, perfilar=perfilar,
+                                                    sorteo_difusion=sorteo_difusion, cache=cache)
+        else:
+            p_titulo.markdown(f"### Ejecutando {n_simulaciones_objetivo} simulaciones en paralelo ...")
+            resultados = ejecutar_replicas(params_modelo, max_turnos, n_simulaciones_objetivo, seed=semilla, perfilar=perfilar,
+                                           sorteo_difusion=sorteo_difusion, cache=cache)
+        for r in resultados:
+            agregador.agregar(r["series"], r["agentes"])
+            poblacion_objetivo = r["poblacion_objetivo"]
+            if r["perfil"] is not None:
+                informe_perfil.combinar(r["perfil"])
+
+    if not modo_paralelo:
+        # Las réplicas corren en un hilo aparte a máxima velocidad; este hilo solo dibuja los
+        # fotogramas que publica, a su ritmo. Paso a paso, el hilo espera a que se dibuje cada turno.
+        buffer = BufferFotogramas(capacidad=1 if paso_a_paso else 32, bloquear=paso_a_paso)
+        grabar = os.path.join(DIRECTORIO_TRAYECTORIAS, time.strftime("%Y%m%d-%H%M%S")) if grabar_trayectorias else None
+        trabajador = SimulacionEnSegundoPlano(params_modelo, plan, max_turnos, buffer, agregador,
+                                              criterio=criterio, cache=cache, perfilador=perfilador, grabar=grabar)
+        p_titulo.markdown("### Lanzando simulaciones ...")
+        trabajador.start()
+        replica_dibujada = None
+        try:
+            while not trabajador.terminada():
+                fotograma = buffer.tomar()
+                if fotograma is None:
+                    continue
+                t = fotograma["turno"]
+                resumen = fotograma["resumen"]
+                liq_actual = resumen["liquidez"]
+                personas_huidas = resumen["huidas"]
+                personas_inf = resumen["informadas"]
+                poblacion_replica = fotograma["poblacion_objetivo"]
+
+                p_titulo.markdown(
+                f"""
+                <div style='margin-top: -15px; margin-bottom: 5px;'>
+                    <p style='margin: 0px; font-size: 36px; font-weight: 600; color: white;'>
+                        Lanzando Simulación {fotograma["replica"] + 1}/{n_maximo}{" (máx.)" if adaptativo else ""} ...
+                    </p>
+                </div>
+                """, 
+                unsafe_allow_html=True
                 )
 
-            node_trace = go.Scatter(x=node_x, y=node_y, mode='markers', hoverinfo='text', text=text,
-                                   marker=dict(color=colors, size=sizes, symbol=symbols, line=dict(color='white', width=0.5)),showlegend=False)
-
-            legend_traces = [
-                go.Scatter(x=[None], y=[None], mode='markers',
-                        marker=dict(size=8, color='rgb(34, 139, 34)', symbol='circle'), # Tamaño 8 para que sea más pequeño
-                        name='Cliente: Tranquilo', showlegend=True),
-                go.Scatter(x=[None], y=[None], mode='markers',
-                        marker=dict(size=8, color='rgb(255, 165, 0)', symbol='circle'),
-                        name='Cliente: Alerta (Fuga < 5%)', showlegend=True),
-                go.Scatter(x=[None], y=[None], mode='markers',
-                        marker=dict(size=8, color='rgb(255, 0, 0)', symbol='circle'),
-                        name='Cliente: Fuga Crítica', showlegend=True),
-                go.Scatter(x=[None], y=[None], mode='markers',
-                        marker=dict(size=8, color='rgb(100, 100, 100)', symbol='diamond'),
-                        name='Opinión: Inactiva', showlegend=True),
-                go.Scatter(x=[None], y=[None], mode='markers',
-                        marker=dict(size=8, color='rgb(100, 150, 255)', symbol='diamond'),
-                        name='Opinión: Difundiendo', showlegend=True),
-            ]
-            
-            fig_grafo = go.Figure(data=[edge_trace, node_trace] + legend_traces)
-
-            # --- FIGURA DEL GRAFO ---
-            fig_grafo = go.Figure(data=[edge_trace, node_trace] + legend_traces)
-
-            fig_grafo.update_layout(
-                title=f"Red de Influencia Social | Turno: {t}",
-                template="plotly_dark",
-                height=600,
-                margin=dict(b=0, l=0, r=0, t=40),
-                showlegend=True,
-                legend=dict(
-                    yanchor="top",
-                    y=0.99,
-                    xanchor="left",
-                    x=0.0,              # Pegado al borde izquierdo
-                    bgcolor="rgba(0,0,0,0.4)", 
-                    font=dict(size=9),  # Texto pequeño
-                    itemsizing='constant',
-                    itemwidth=30,       # Símbolos más compactos
-                    tracegroupgap=0     # Espacio mínimo entre grupos
-                ),
-                xaxis=dict(showgrid=False, zeroline=False, showticklabels=False),
-                yaxis=dict(showgrid=False, zeroline=False, showticklabels=False)
-            )
-
-            placeholder_grafo.plotly_chart(fig_grafo, use_container_width=True)
-
-            # 2. Métricas y Gráfico Rojo
-            with placeholder_metricas.container():
-                st.metric("Clientes que han huido", f"{int(personas_huidas):,}")
-                st.metric("Alcance Poblacional", f"{(personas_inf / model.poblacion_objetivo)*100:.1f}%")
-                st.metric("Intensidad Rumor", f"{intensidad_rumor*100:.1f}%")
-                
-                fig_liq = go.Figure(go.Scatter(x=stats_data["paso"], y=stats_data["liquidez"], fill='tozeroy', line=dict(color="#FF0000")))
-                fig_liq.update_layout(title="Fuga de Depósitos (Caja)", template="plotly_dark", height=300, margin=dict(l=20, r=20, t=40, b=20))
-                st.plotly_chart(fig_liq, use_container_width=True)
-
-            time.sleep(velocidad)
-            if liq_actual <= 0: break
-    
-        # Capturamos el estado de los agentes al final de ESTA simulación específica
-        for a in model.schedule.agents:
-            if a.tipo != "No-Cliente":
-                if a.edad < 35: cat_edad = "1. Jóvenes (<35)"
-                elif a.edad < 60: cat_edad = "2. Adultos (35-60)"
-                else: cat_edad = "3. Séniors (>60)"
-                
-                todos_los_datos_agentes.append({
-                    "Simulacion": sim_iter,
-                    "Rango Edad": cat_edad,
-                    "Tipo": a.tipo,
-                    "Fuga %": a.porcentaje_retirado * 100,
-                    "Sexo": a.sexo,
-                    "Protegido FGD": "Sí" if a.protegido_fgd else "No"
-                })
-        # ---------------------------------------
+                # En el modo rápido solo se redibuja cada k turnos, si el estado agregado ha cambiado
+                # bastante desde el último dibujo o en el último turno de la simulación
+                if dibujo_rapido and fotograma["replica"] == replica_dibujada and not fotograma["fin"]:
+                    turno_dibujado, inf_dibujadas, huidas_dibujadas, liq_dibujada = dibujado
+                    cambio = max(abs(personas_inf - inf_dibujadas) / poblacion_replica,
+                                 abs(personas_huidas - huidas_dibujadas) / poblacion_replica,
+                                 abs(liq_actual - liq_dibujada) / fotograma["liquidez_inicial"])
+                    if t - turno_dibujado < redibujar_cada and cambio < UMBRAL_REDIBUJO:
+                        continue
+                dibujado = (t, personas_inf, personas_huidas, liq_actual)
+
+                if perfilador is not None:
+                    t_fase = perfilador.reloj()
+
+                # Pre-generar las líneas de la red (Estructura fija durante cada réplica)
+                if fotograma["replica"] != replica_dibujada:
+                    replica_dibujada = fotograma["replica"]
+                    topologia = fotograma["topologia"]
+                    nueva = disposicion not in topologia.posiciones_calculadas
+                    pos = topologia.posiciones(disposicion)
+                    if nueva:  # Al disco (resultados/redes): el siguiente rerun no la recalcula
+                        CACHE_TOPOLOGIAS.guardar(topologia)
+                    edge_trace = trazas_aristas(topologia, pos)
+
+                dibujar_turno(t, edge_trace, pos, fotograma["estado"], fotograma["representacion_por_nodo"],
+                              resumen, poblacion_replica, fotograma["series"])
+                if perfilador is not None:
+                    perfilador.marcar("dibujo", t_fase)
+
+                time.sleep(velocidad)
+        finally:
+            # También si Streamlit corta el script (nuevo clic, cambio de un slider)
+            trabajador.detener()
+            trabajador.join()
+        if trabajador.error is not None:
+            raise trabajador.error
+        poblacion_objetivo = trabajador.poblacion_objetivo
+
+    if perfilador is not None:
+        informe_perfil.combinar(perfilador.informe())
         
-        historico_series.append(stats_data)
 
     # --- INFORME FINAL PROMEDIADO ---
     with placeholder_informe_final.container():
         st.markdown("---")
-        st.header(f"Informe Agregado de Riesgo ({n_simulaciones_objetivo} simulaciones)")
-        
-        # 1. Procesamiento de datos estadísticos temporales
-        max_t = max(len(s["paso"]) for s in historico_series)
-        turnos_quiebra = [len(s["paso"]) for s in historico_series if s['liquidez'][-1] <= 0]
-        prob_quiebra = (len(turnos_quiebra) / n_simulaciones_objetivo) * 100
-        turno_medio_colapso = np.mean(turnos_quiebra) if turnos_quiebra else 0
-        
-        def get_avg(key, pad_val=0):
-            matrix = []
-            for s in historico_series:
-                vals = s[key]
-                # Padding para normalizar la duración de las simulaciones
-                padding = [vals[-1] if pad_val is None else pad_val] * (max_t - len(vals))
-                matrix.append(vals + padding)
-            return np.mean(matrix, axis=0)
-
-        avg_huidas = get_avg("huidas", None)
-        avg_inf = get_avg("informadas", None)
-        avg_liq = get_avg("liquidez", 0)
-
-        # 2. Procesamiento de datos de agentes (PROMEDIO REAL DE TODAS LAS SIMULACIONES)
-        # Se asume que has guardado 'todos_los_datos_agentes' en el bucle principal
-        df_global = pd.DataFrame(todos_los_datos_agentes)
-        
-        resumen_edad = df_global.groupby("Rango Edad")["Fuga %"].mean().reset_index()
-        resumen_tipo = df_global.groupby("Tipo")["Fuga %"].mean().reset_index()
-        resumen_sexo = df_global.groupby("Sexo")["Fuga %"].mean()
+        st.header(f"Informe Agregado de Riesgo ({agregador.n_replicas} simulaciones)")
+        if criterio is not None:
+            estado_precision = "Precisión alcanzada" if criterio.alcanzado() else "Máximo de simulaciones alcanzado"
+            st.caption(f"{estado_precision}: IC 95% Prob. de Quiebra ± {criterio.semiancho_prob()*100:.1f} puntos, "
+                       f"Turno Medio Colapso ± {criterio.semiancho_turno():.1f} turnos.")
         
+        # 1. Estadísticos temporales acumulados (media, IC 95% y cuantiles P5/P50/P95 por turno)
+        turnos_quiebra, conteo_quiebras = agregador.turnos_quiebra()
+        prob_quiebra = agregador.prob_quiebra() * 100
+        turno_medio_colapso = agregador.turno_quiebra.media if agregador.n_quiebras else 0
+
+        avg_huidas = agregador.media("huidas")
+        avg_inf = agregador.media("informadas")
+        avg_liq = agregador.media("liquidez")
+
+        # 2. Fuga final por segmento (media de todos los clientes de todas las simulaciones)
+        resumen_edad = agregador.tabla_segmento("Rango Edad")
+        resumen_tipo = agregador.tabla_segmento("Tipo")
+        resumen_sexo = agregador.tabla_segmento("Sexo").set_index("Sexo")["Fuga %"]
+        resumen_fgd = agregador.tabla_segmento("Protegido FGD").set_index("Protegido FGD")["Fuga %"]
+
+        def error_segmento(tabla):
+            # Semiancho del IC 95% de la fuga media de cada segmento
+            return dict(type="data", array=1.96 * tabla["Desv %"] / np.sqrt(tabla["N"]), visible=True)
+
+        def banda(fig, inferior, superior, nombre, color):
+            fig.add_trace(go.Scatter(y=superior, line=dict(width=0), showlegend=False, hoverinfo="skip"))
+            fig.add_trace(go.Scatter(y=inferior, line=dict(width=0), fill="tonexty", fillcolor=color, name=nombre))
+
         st.markdown("<div style='padding: 15px;'></div>", unsafe_allow_html=True)
         
         st.markdown("### 1. Estadísticas Básicas")
@@ -290,11 +507,11 @@ if p_boton.button("Lanzar Simulación Progresiva", use_container_width=True):
         # 3. Métricas de Cabecera
         col1, col2, col3, col4, col5 = st.columns(5)
         col1.metric("Media Fugados Total", f"{int(avg_huidas[-1]):,}")
-        col2.metric("Alcance Poblacional Medio", f"{(avg_inf[-1] / model.poblacion_objetivo)*100:.1f}%")
+        col2.metric("Alcance Poblacional Medio", f"{(avg_inf[-1] / poblacion_objetivo)*100:.1f}%")
         col3.metric("Prob. de Quiebra", f"{prob_quiebra:.0f}%", 
                   delta="Riesgo Crítico" if prob_quiebra > 50 else None, delta_color="inverse")
         col4.metric("Turno Medio Colapso", f"{turno_medio_colapso:.1f}" if turno_medio_colapso > 0 else "N/A")
-        col5.metric("Supervivencia Media", f"{(np.mean([len(s['paso']) for s in historico_series]) / max_turnos)*100:.1f}%")
+        col5.metric("Supervivencia Media", f"{(agregador.duracion.media / max_turnos)*100:.1f}%")
         
         st.markdown("<div style='padding: 15px;'></div>", unsafe_allow_html=True)
 
@@ -307,6 +524,7 @@ if p_boton.button("Lanzar Simulación Progresiva", use_container_width=True):
                 go.Bar(
                     x=resumen_edad["Rango Edad"], 
                     y=resumen_edad["Fuga %"], 
+                    error_y=error_segmento(resumen_edad),
                     marker_color=['#636EFA', '#EF553B', '#00CC96']
                 )
             ])
@@ -322,6 +540,7 @@ if p_boton.button("Lanzar Simulación Progresiva", use_container_width=True):
                 go.Bar(
                     x=resumen_tipo["Tipo"], 
                     y=resumen_tipo["Fuga %"], 
+                    error_y=error_segmento(resumen_tipo),
                     marker_color=['#00CC96', '#FFA15A', '#EF553B']
                 )
             ])
@@ -333,7 +552,7 @@ if p_boton.button("Lanzar Simulación Progresiva", use_container_width=True):
             for genero, valor in resumen_sexo.items():
                 st.write(f"{'Hombre' if genero == 'H' else 'Mujer'}: **{valor:.1f}%**")
             
-            avg_fgd = df_global[df_global['Protegido FGD'] == 'Sí']['Fuga %'].mean()
+            avg_fgd = resumen_fgd.get("Sí", np.nan)
             st.caption(f"Fuga media en protegidos FGD: {avg_fgd:.1f}%")
 
         st.markdown("<div style='padding: 15px;'></div>", unsafe_allow_html=True)
@@ -344,14 +563,15 @@ if p_boton.button("Lanzar Simulación Progresiva", use_container_width=True):
 
         with graf_izq:
             fig_final = go.Figure()
+            banda(fig_final, agregador.cuantil("huidas", 0.05), agregador.cuantil("huidas", 0.95), "Retirados P5-P95", "rgba(255,0,0,0.2)")
             fig_final.add_trace(go.Scatter(y=avg_inf, name="Media Informados", line=dict(dash='dash', color='orange')))
             fig_final.add_trace(go.Scatter(y=avg_huidas, name="Media Retirados", line=dict(width=4, color='red')))
             fig_final.update_layout(title="Dinámica Social: Información vs Acción (Media)", template="plotly_dark", height=400, xaxis_title="Turnos")
             st.plotly_chart(fig_final, use_container_width=True)
 
         with graf_der:
-            if turnos_quiebra:
-                fig_hist = go.Figure(data=[go.Histogram(x=turnos_quiebra, nbinsx=15, marker_color='#FF4B4B', opacity=0.7)])
+            if len(turnos_quiebra):
+                fig_hist = go.Figure(data=[go.Histogram(x=turnos_quiebra, y=conteo_quiebras, histfunc="sum", nbinsx=15, marker_color='#FF4B4B', opacity=0.7)])
                 fig_hist.update_layout(
                     title="Distribución Temporal de las Quiebras",
                     template="plotly_dark", height=400, xaxis_title="Turno de quiebra",
@@ -362,13 +582,21 @@ if p_boton.button("Lanzar Simulación Progresiva", use_container_width=True):
                 st.info("No hubo quiebras suficientes para generar el histograma.")
 
         fig_area = go.Figure()
-        fig_area.add_trace(go.Scatter(y=avg_liq, fill='tozeroy', name="Liquidez Media", line=dict(color="#00FFCC")))
+        banda(fig_area, agregador.cuantil("liquidez", 0.05), agregador.cuantil("liquidez", 0.95), "Liquidez P5-P95", "rgba(0,255,204,0.15)")
+        fig_area.add_trace(go.Scatter(y=agregador.cuantil("liquidez", 0.5), name="Liquidez Mediana", line=dict(color="#00FFCC", dash="dot")))
+        fig_area.add_trace(go.Scatter(y=avg_liq, name="Liquidez Media", line=dict(color="#00FFCC")))
         fig_area.update_layout(title="Salud Financiera Media (Reserva de Liquidez)", template="plotly_dark", height=350, xaxis_title="Turnos", yaxis_title="Euros (€)")
         st.plotly_chart(fig_area, use_container_width=True)
 
         st.info(f"💡 **Interpretación**: El turno medio de colapso ({turno_medio_colapso:.1f}) indica la velocidad de la corrida. " 
                 f"El segmento que más capital retira en promedio es **{resumen_tipo.loc[resumen_tipo['Fuga %'].idxmax(), 'Tipo']}**.")
 
+        if perfilar:
+            st.markdown("### 4. Perfil de Tiempos por Fase")
+            st.dataframe(informe_perfil.tabla(), use_container_width=True, hide_index=True)
+            st.caption("Tiempo acumulado en todas las simulaciones. '% del turno' es sobre el tiempo total de model.step(); "
+                       "construcción y dibujo quedan fuera del turno y pueden superar el 100%.")
+
 
 
 
@@ -0,0 +1,211 @@
+# benchmarks/bench_modelo.py
+# Línea base de rendimiento de BancoModel / ClienteCaixa (y de los motores de runner.MOTORES).
+#
+#   python benchmarks/bench_modelo.py                         # matriz completa (mesa y vectorizado)
+#   python benchmarks/bench_modelo.py --n 200 1000 --motores mesa
+#   python benchmarks/bench_modelo.py --n 1000000 --motores vectorizado eventos --difusion 0.0002 --encaje 0.3 --max-turnos 300
+#   python benchmarks/bench_modelo.py --n 1000000 --motores vectorizado particionado --particiones 4
+#   python benchmarks/bench_modelo.py --guardar-baseline      # fija la referencia
+#   python benchmarks/bench_modelo.py --baseline benchmarks/baseline.json --umbral 0.2
+#
+# Cada caso se ejecuta en un proceso nuevo para que el pico de RSS sea solo suyo.
+# Mide: construcción del modelo (red + agentes), un step() y la corrida completa hasta
+# la quiebra o max_turnos; de cada medida se queda con el mínimo de --repeticiones.
+# Con --baseline marca como regresión todo caso cuyo tiempo empeore más que el umbral
+# (y más de --minimo-s en absoluto) y termina con código 1 (útil en las ejecuciones nocturnas).
+# Un caso que falla (excepción, proceso muerto por falta de memoria o más de --timeout
+# segundos) se anota con su error y también hace terminar con código 1.
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import platform
+import queue
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+N_NODOS = (200, 1000, 10000, 100000)
+DIFUSIONES = (0.05, 0.8)        # Difusión baja y alta
+ENCAJES = (0.01, 0.30)          # Extremos del slider "% Liquidez Inmediata (Caja)"
+MOTORES = ("mesa", "vectorizado", "eventos", "particionado")
+MOTORES_POR_DEFECTO = ("mesa", "vectorizado")
+METRICAS = ("init_s", "step_s", "corrida_s")
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+
+
+def medir_caso(caso, max_turnos, repeticiones, particiones, cola):
+    try:
+        cola.put(medir(caso, max_turnos, repeticiones, particiones))
+    except Exception as error:
+        cola.put(dict(caso, error=f"{type(error).__name__}: {error}"))
+
+
+def medir(caso, max_turnos, repeticiones, particiones):
+    import numpy as np
+    from simulation.runner import MOTORES as CLASES
+
+    params = dict(n=caso["n"], total_depositos=10000000, encaje=caso["encaje"], news_score=0.8,
+                  news_validez=0.9, news_difusion=caso["difusion"], p_no_clientes=0.2)
+    if caso["motor"] == "particionado":
+        params["particiones"] = particiones
+    Modelo = CLASES[caso["motor"]]
+    init_s = step_s = corrida_s = float("inf")
+
+    for _ in range(repeticiones):
+        # Construcción: red + agentes, sin caché de topologías
+        t0 = time.perf_counter()
+        model = Modelo(**params, seed=1)
+        init_s = min(init_s, time.perf_counter() - t0)
+
+        # Un step aislado (el primero, con toda la población activa)
+        t0 = time.perf_counter()
+        model.step()
+        step_s = min(step_s, time.perf_counter() - t0)
+        cerrar(model)
+
+        # Corrida completa hasta la quiebra o max_turnos (con un modelo nuevo)
+        model = Modelo(**params, seed=1)
+        t0 = time.perf_counter()
+        turnos = 0
+        for turnos in range(1, max_turnos + 1):
+            model.step()
+            if model.liquidez_banco <= 0 or not model.running:
+                break
+        corrida_s = min(corrida_s, time.perf_counter() - t0)
+        cerrar(model)
+
+    return (dict(caso, init_s=init_s, step_s=step_s, corrida_s=corrida_s, turnos=turnos,
+                  turnos_por_s=turnos / corrida_s if corrida_s > 0 else float("inf"),
+                  quiebra=bool(model.liquidez_banco <= 0),
+                  rss_pico_mb=resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                  numpy=np.__version__))
+
+
+def cerrar(model):
+    if hasattr(model, "cerrar"):  # Motor particionado: termina sus procesos
+        model.cerrar()
+
+
+def ejecutar_caso(caso, max_turnos, repeticiones, particiones=2, timeout=1800):
+    # Espera el resultado a trozos para notar si el proceso muere sin dejarlo en la cola
+    ctx = mp.get_context("spawn")
+    cola = ctx.Queue()
+    proceso = ctx.Process(target=medir_caso, args=(caso, max_turnos, repeticiones, particiones, cola))
+    proceso.start()
+    limite = time.monotonic() + timeout
+    resultado = None
+    while resultado is None:
+        try:
+            resultado = cola.get(timeout=1)
+        except queue.Empty:
+            if proceso.exitcode is not None:
+                resultado = dict(caso, error=f"el proceso terminó sin resultado (código {proceso.exitcode})")
+            elif time.monotonic() > limite:
+                proceso.kill()
+                resultado = dict(caso, error=f"sin resultado tras {timeout} s")
+    proceso.join()
+    return resultado
+
+
+def commit_actual():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(BASELINE)).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def comparar(resultados, baseline, umbral, minimo_s):
+    # Devuelve las filas de comparación y el número de regresiones
+    referencia = {(c["motor"], c["n"], c["difusion"], c["encaje"]): c for c in baseline["casos"]}
+    filas, regresiones = [], 0
+    for caso in resultados["casos"]:
+        if "error" in caso:
+            continue
+        base = referencia.get((caso["motor"], caso["n"], caso["difusion"], caso["encaje"]))
+        if base is None or "error" in base:
+            continue
+        for metrica in METRICAS:
+            ratio = caso[metrica] / base[metrica] if base[metrica] > 0 else float("inf")
+            regresion = ratio > 1 + umbral and caso[metrica] - base[metrica] > minimo_s
+            regresiones += regresion
+            filas.append((caso["motor"], caso["n"], caso["difusion"], caso["encaje"], metrica,
+                          base[metrica], caso[metrica], ratio, regresion))
+    return filas, regresiones
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmarks de construcción, step y corrida completa")
+    parser.add_argument("--n", type=int, nargs="+", default=list(N_NODOS))
+    parser.add_argument("--motores", nargs="+", choices=MOTORES, default=list(MOTORES_POR_DEFECTO))
+    parser.add_argument("--difusion", type=float, nargs="+", default=list(DIFUSIONES))
+    parser.add_argument("--encaje", type=float, nargs="+", default=list(ENCAJES))
+    parser.add_argument("--max-turnos", type=int, default=150)
+    parser.add_argument("--particiones", type=int, default=2, help="Procesos del motor particionado")
+    parser.add_argument("--timeout", type=float, default=1800, help="Segundos máximos por caso antes de darlo por fallido")
+    parser.add_argument("--repeticiones", type=int, default=3, help="Se guarda el mínimo de cada medida")
+    parser.add_argument("--salida", default=None, help="Fichero JSON de resultados (por defecto benchmarks/resultados/<fecha>.json)")
+    parser.add_argument("--baseline", default=None, help="JSON de referencia con el que comparar")
+    parser.add_argument("--guardar-baseline", action="store_true", help=f"Guarda los resultados como {BASELINE}")
+    parser.add_argument("--umbral", type=float, default=0.2, help="Empeoramiento relativo que cuenta como regresión")
+    parser.add_argument("--minimo-s", type=float, default=0.005, help="Diferencias absolutas menores se consideran ruido")
+    args = parser.parse_args(argv)
+
+    resultados = {
+        "meta": {"fecha": datetime.now().isoformat(timespec="seconds"), "commit": commit_actual(),
+                 "python": platform.python_version(), "plataforma": platform.platform(),
+                 "cpus": os.cpu_count(), "max_turnos": args.max_turnos, "repeticiones": args.repeticiones,
+                 "particiones": args.particiones},
+        "casos": [],
+    }
+
+    for motor, n, difusion, encaje in itertools.product(args.motores, args.n, args.difusion, args.encaje):
+        caso = ejecutar_caso({"motor": motor, "n": n, "difusion": difusion, "encaje": encaje},
+                             args.max_turnos, args.repeticiones, args.particiones, args.timeout)
+        resultados["casos"].append(caso)
+        if "error" in caso:
+            print(f"{motor:12s} n={n:<7d} difusion={difusion:<5} encaje={encaje:<5} FALLIDO: {caso['error']}", flush=True)
+            continue
+        print(f"{motor:12s} n={n:<7d} difusion={difusion:<5} encaje={encaje:<5} "
+              f"init={caso['init_s']:8.3f}s step={caso['step_s']:8.4f}s corrida={caso['corrida_s']:8.3f}s "
+              f"({caso['turnos']} turnos, {caso['turnos_por_s']:.1f} t/s) rss={caso['rss_pico_mb']:.0f}MB", flush=True)
+
+    salida = args.salida or os.path.join(os.path.dirname(BASELINE), "resultados",
+                                         datetime.now().strftime("%Y%m%d_%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(salida)), exist_ok=True)
+    with open(salida, "w", encoding="utf-8") as f:
+        json.dump(resultados, f, indent=2)
+    print(f"Resultados en {salida}")
+
+    if args.guardar_baseline:
+        with open(BASELINE, "w", encoding="utf-8") as f:
+            json.dump(resultados, f, indent=2)
+        print(f"Baseline actualizada en {BASELINE}")
+
+    fallidos = sum("error" in caso for caso in resultados["casos"])
+    ruta_baseline = args.baseline or (BASELINE if os.path.exists(BASELINE) and not args.guardar_baseline else None)
+    if ruta_baseline:
+        with open(ruta_baseline, encoding="utf-8") as f:
+            filas, regresiones = comparar(resultados, json.load(f), args.umbral, args.minimo_s)
+        print(f"\nComparación con {ruta_baseline} (umbral {args.umbral:.0%})")
+        for motor, n, difusion, encaje, metrica, base, actual, ratio, regresion in filas:
+            marca = "  REGRESIÓN" if regresion else ""
+            print(f"{motor:12s} n={n:<7d} dif={difusion:<5} enc={encaje:<5} {metrica:10s} "
+                  f"{base:9.4f}s -> {actual:9.4f}s  x{ratio:5.2f}{marca}")
+        if regresiones:
+            print(f"{regresiones} regresiones")
+            return 1
+    if fallidos:
+        print(f"{fallidos} casos fallidos")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
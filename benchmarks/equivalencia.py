@@ -0,0 +1,146 @@
+# benchmarks/equivalencia.py
+# Comprobación de los motores que prometen los mismos números que BancoModelVectorizado.
+#
+#   python benchmarks/equivalencia.py                  # todas las comprobaciones
+#   python benchmarks/equivalencia.py --motores lotes --n 2000
+#
+# Cada comprobación corre los dos motores con la misma semilla y compara series y estado
+# final de los agentes con igualdad exacta (bit a bit, no con tolerancia). El motor por
+# eventos sortea la llegada de la noticia de otra forma: se comprueba dándole al vectorizado
+# los mismos turnos de llegada. Termina con
+# código 1 si alguna no coincide (útil en las ejecuciones nocturnas junto a bench_modelo.py).
+import argparse
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from simulation.instantanea import aplicar_cambios
+from simulation.model_eventos import BancoModelEventos
+from simulation.model_vectorizado import BancoModelVectorizado
+from simulation.red import obtener_topologia
+from simulation.runner import ejecutar_escenarios, ejecutar_replica, plan_replicas
+
+PARAMS = dict(total_depositos=10000000, p_no_clientes=0.2)
+# Escenarios del lote: quiebra rápida, quiebra lenta y sin quiebra
+ESCENARIOS = [
+    dict(news_score=0.8, news_validez=0.9, news_difusion=0.4, encaje=0.10),
+    dict(news_score=0.6, news_validez=0.7, news_difusion=0.05, encaje=0.20),
+    dict(news_score=0.2, news_validez=0.5, news_difusion=0.02, encaje=0.30),
+]
+
+
+def diferencias(nombre, a, b):
+    # Claves de series y agentes que no son idénticas entre dos resultados de runner
+    fallos = []
+    for grupo in ("series", "agentes"):
+        for clave in a[grupo]:
+            if not np.array_equal(np.asarray(a[grupo][clave]), np.asarray(b[grupo][clave])):
+                fallos.append(f"{nombre}: {grupo}[{clave}] distinto")
+    return fallos
+
+
+def comprobar_lotes(n, max_turnos, plan):
+    # runner.ejecutar_escenarios (BancoModelLotes) frente a ejecutar_replica(..., "vectorizado")
+    fallos = []
+    for seed, extra in plan:
+        lote = ejecutar_escenarios(dict(PARAMS, n=n, **extra), ESCENARIOS, max_turnos, seed)
+        for i, (escenario, resultado) in enumerate(zip(ESCENARIOS, lote)):
+            referencia = ejecutar_replica(dict(PARAMS, n=n, **escenario, **extra), max_turnos, seed, "vectorizado")
+            fallos += diferencias(f"lotes seed={seed} {extra or ''} escenario {i}", resultado, referencia)
+    return fallos
+
+
+def comprobar_particionado(n, max_turnos, plan, particiones=(2, 3)):
+    # BancoModelParticionado con varios nº de procesos frente al motor vectorizado
+    fallos = []
+    for seed, extra in plan:
+        for escenario in ESCENARIOS[:2]:
+            params = dict(PARAMS, n=n, **escenario, **extra)
+            referencia = ejecutar_replica(params, max_turnos, seed, "vectorizado")
+            for p in particiones:
+                resultado = ejecutar_replica(dict(params, particiones=p), max_turnos, seed, "particionado")
+                fallos += diferencias(f"particionado P={p} seed={seed} {extra or ''} {escenario}", resultado, referencia)
+    return fallos
+
+
+class LlegadasFijas:
+    # Sustituye al rng_difusion del motor vectorizado: en el turno t sortea 0 (se entera) para
+    # los nodos cuya llegada en el motor por eventos es t y 1 para el resto
+    def __init__(self, model_eventos):
+        self.llegada = np.full(len(model_eventos.saldo), np.inf)
+        self.llegada[model_eventos.orden_llegada] = model_eventos.turno_llegada
+        self.antitetico = model_eventos.sorteo_difusion == "antitetico"
+        self.turno = 0
+
+    def random(self, n):
+        self.turno += 1
+        u = np.where(self.llegada == self.turno, 0.0, 1.0)
+        return 1 - u if self.antitetico else u  # El motor vectorizado vuelve a aplicar 1 - u
+
+
+def comprobar_eventos(n, max_turnos, plan):
+    # BancoModelEventos frente al vectorizado con los mismos turnos de llegada, turno a turno.
+    # Solo con sorteo_difusion: sin él, el motor por eventos toma una semilla del generador
+    # del modelo y la ventanilla ya no baraja igual. La difusión lenta pasa por el camino
+    # disperso (pocos despiertos); las demás, por la evaluación completa. La inyección de
+    # caja a mitad de corrida calma a clientes que luego hay que volver a despertar.
+    fallos = []
+    lenta = dict(news_score=0.6, news_validez=0.7, news_difusion=0.002, encaje=0.30)
+    casos = [(escenario, None) for escenario in ESCENARIOS + [lenta]] + [(lenta, dict(encaje=0.60))]
+    for seed, extra in plan:
+        if not extra:
+            continue
+        topologia = obtener_topologia(n, seed=seed)
+        for escenario, intervencion in casos:
+            params = dict(PARAMS, n=n, **escenario, **extra, seed=seed, topologia=topologia)
+            eventos, vectorizado = BancoModelEventos(**params), BancoModelVectorizado(**params)
+            vectorizado.rng_difusion = LlegadasFijas(eventos)
+            nombre = f"eventos seed={seed} {extra} {escenario} {intervencion or ''}"
+            for t in range(max_turnos):
+                if intervencion and t == max_turnos // 3:
+                    aplicar_cambios(eventos, **intervencion)
+                    aplicar_cambios(vectorizado, **intervencion)
+                eventos.step()
+                vectorizado.step()
+                a, b = eventos.resumen_turno(), vectorizado.resumen_turno()
+                distintos = [k for k in ("liquidez", "depositos", "huidas", "informadas") if a[k] != b[k]]
+                # intensidad_rumor, salvo redondeo: no se suman los restos de float32 de los nodos que no cambian
+                if not np.isclose(a["intensidad_rumor"], b["intensidad_rumor"], rtol=1e-6, atol=1e-9):
+                    distintos.append("intensidad_rumor")
+                distintos += [k for k, v in eventos.estado_nodos().items() if not np.array_equal(v, vectorizado.estado_nodos()[k])]
+                if distintos:
+                    fallos.append(f"{nombre}: turno {t} {', '.join(distintos)} distinto")
+                    break
+                if b["liquidez"] <= 0:
+                    break
+    return fallos
+
+
+COMPROBACIONES = {"lotes": comprobar_lotes, "particionado": comprobar_particionado, "eventos": comprobar_eventos}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Equivalencia exacta de motores con BancoModelVectorizado")
+    parser.add_argument("--motores", nargs="+", choices=sorted(COMPROBACIONES), default=sorted(COMPROBACIONES))
+    parser.add_argument("--n", type=int, default=3000)
+    parser.add_argument("--max-turnos", type=int, default=120)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    # Sorteos propios, comunes y la pareja antitética (mismos planes que runner)
+    plan = plan_replicas(args.seed, 1) + plan_replicas(args.seed, 1, "comun") + plan_replicas(args.seed, 2, "antitetico")[1:]
+    total = 0
+    for motor in args.motores:
+        fallos = COMPROBACIONES[motor](args.n, args.max_turnos, plan)
+        print(f"{motor:12s} {'OK' if not fallos else f'{len(fallos)} diferencias'}", flush=True)
+        for fallo in fallos:
+            print("  " + fallo)
+        total += len(fallos)
+    return 1 if total else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
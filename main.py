@@ -0,0 +1,276 @@
+# main.py
+# Ejecución sin interfaz: barridos de escenarios para stress tests nocturnos.
+#
+#   python main.py --news-score 0.5 0.8 --encaje 0.05 0.10 0.20 --replicas 20 --salida resultados/
+#   python main.py --escenarios escenarios.json --formato parquet --salida resultados/
+#   python main.py --superficie resultados/superficie.joblib --replicas 10   # superficie de quiebra para app.py
+#   python main.py --news-score 0.2 0.4 0.6 0.8 --motor vectorizado --lotes 10   # escenarios en lote
+#   python main.py --n 10000 --max-turnos 500 --replicas 1 --motor vectorizado --grabar resultados/trayectorias/n10k
+#   python main.py --n 3000000 --replicas 1 --motor particionado --particiones 8   # una red enorme en 8 procesos
+#   python main.py --n 1000000 --news-difusion 0.0002 --motor eventos   # difusión lenta: solo se simula a los activos
+#
+# Se escriben dos tablas en streaming según terminan las réplicas:
+#   ejecuciones.*  una fila por réplica (parámetros, turnos, quiebra, estado final)
+#   turnos.*       una fila por réplica y turno (liquidez, huidas, informadas)
+import argparse
+import csv
+import importlib.util
+import itertools
+import json
+import os
+
+import numpy as np
+
+import parametros as p
+from simulation.runner import MOTORES, iterar_lotes, iterar_replicas, plan_replicas
+from simulation.sensibilidad import construir_superficie
+
+# Parámetros de BancoModel que se pueden barrer y su valor por defecto (los de app.py)
+PARAMETROS_BARRIDO = {
+    "news_score": 0.8,
+    "news_validez": 0.9,
+    "news_difusion": 0.4,
+    "encaje": 0.10,
+    "p_no_clientes": 0.2,
+    "n": 200,
+}
+COLUMNAS_TURNO = ["escenario", "replica", "turno", "liquidez", "huidas", "informadas"]
+
+
+def leer_escenarios(ruta):
+    # JSON (lista de objetos) o CSV con una columna por parámetro; lo que falte toma el valor por defecto
+    if ruta.endswith(".json"):
+        with open(ruta, encoding="utf-8") as f:
+            filas = json.load(f)
+    else:
+        with open(ruta, newline="", encoding="utf-8") as f:
+            filas = list(csv.DictReader(f))
+
+    for fila in filas:
+        escenario = dict(PARAMETROS_BARRIDO)
+        for clave, valor in fila.items():
+            if clave not in PARAMETROS_BARRIDO:
+                raise ValueError(f"Parámetro desconocido en {ruta}: {clave}")
+            escenario[clave] = leer_n(valor, ruta) if clave == "n" else float(valor)
+        yield escenario
+
+
+def leer_n(valor, ruta):
+    # Los CSV exportados con pandas u hojas de cálculo suelen escribir 1000 como "1000.0"
+    n = float(valor)
+    if not n.is_integer():
+        raise ValueError(f"n debe ser entero en {ruta}: {valor}")
+    return int(n)
+
+
+def rejilla_escenarios(args):
+    # Producto cartesiano perezoso de los valores pasados por línea de comandos
+    valores = [getattr(args, clave) for clave in PARAMETROS_BARRIDO]
+    for combinacion in itertools.product(*valores):
+        yield dict(zip(PARAMETROS_BARRIDO, combinacion))
+
+
+class EscritorCSV:
+    def __init__(self, ruta, columnas):
+        self.f = open(ruta, "w", newline="", encoding="utf-8")
+        self.writer = csv.DictWriter(self.f, fieldnames=columnas)
+        self.writer.writeheader()
+
+    def escribir(self, filas):
+        self.writer.writerows(filas)
+        self.f.flush()
+
+    def cerrar(self):
+        self.f.close()
+
+
+class EscritorParquet:
+    # Acumula filas y las vuelca como row groups; pyarrow solo hace falta si se pide parquet
+    def __init__(self, ruta, columnas, filas_por_bloque=50000):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa, self.pq = pa, pq
+        self.ruta = ruta
+        self.columnas = columnas
+        self.filas_por_bloque = filas_por_bloque
+        self.buffer = []
+        self.writer = None
+
+    def escribir(self, filas):
+        self.buffer.extend(filas)
+        if len(self.buffer) >= self.filas_por_bloque:
+            self._volcar()
+
+    def _volcar(self):
+        if not self.buffer:
+            return
+        tabla = self.pa.Table.from_pylist(self.buffer).select(self.columnas)
+        if self.writer is None:
+            # Una columna que en el primer bloque solo trae nulos (turno_quiebra sin quiebras) se guarda como float
+            esquema = self.pa.schema([
+                self.pa.field(c.name, self.pa.float64() if self.pa.types.is_null(c.type) else c.type)
+                for c in tabla.schema
+            ])
+            self.writer = self.pq.ParquetWriter(self.ruta, esquema)
+        self.writer.write_table(tabla.cast(self.writer.schema))
+        self.buffer = []
+
+    def cerrar(self):
+        self._volcar()
+        if self.writer is not None:
+            self.writer.close()
+
+
+def filas_resultado(etiqueta, resultado, motor):
+    escenario_id, escenario, replica = etiqueta
+    series = resultado["series"]
+    liquidez = series["liquidez"]
+    turnos = len(liquidez)
+    quiebra = bool(turnos and liquidez[-1] <= 0)
+
+    fila_ejecucion = {
+        "escenario": escenario_id,
+        **escenario,
+        "motor": motor,  # Los motores no son intercambiables: mesa y vectorizado dan resultados distintos
+        "replica": replica,
+        "seed": resultado["seed"],
+        "turnos": turnos,
+        "quiebra": quiebra,
+        "turno_quiebra": turnos if quiebra else None,
+        "liquidez_final": float(liquidez[-1]) if turnos else None,
+        "huidas_final": float(series["huidas"][-1]) if turnos else None,
+        "informadas_final": float(series["informadas"][-1]) if turnos else None,
+        "fuga_media_clientes": float(np.mean(resultado["agentes"]["fuga"])) if len(resultado["agentes"]["fuga"]) else 0.0,
+    }
+    filas_turno = [
+        {"escenario": escenario_id, "replica": replica, "turno": t,
+         "liquidez": float(series["liquidez"][t]), "huidas": float(series["huidas"][t]),
+         "informadas": float(series["informadas"][t])}
+        for t in range(turnos)
+    ]
+    return fila_ejecucion, filas_turno
+
+
+def parsear_argumentos(argv=None):
+    parser = argparse.ArgumentParser(description="Stress Test Lab sin interfaz: barrido de escenarios de corrida bancaria")
+    parser.add_argument("--escenarios", help="Fichero .json o .csv con un escenario por fila (sustituye a la rejilla)")
+    for clave, defecto in PARAMETROS_BARRIDO.items():
+        parser.add_argument("--" + clave.replace("_", "-"), dest=clave, nargs="+",
+                            type=int if clave == "n" else float, default=[defecto])
+    parser.add_argument("--total-depositos", type=float, default=10000000)
+    parser.add_argument("--max-turnos", type=int, default=150)
+    parser.add_argument("--replicas", type=int, default=5, help="Réplicas por escenario")
+    parser.add_argument("--seed", type=int, default=42, help="Semilla maestra (mismas semillas en todos los escenarios)")
+    parser.add_argument("--motor", choices=sorted(MOTORES), default="mesa")
+    parser.add_argument("--activacion-selectiva", action="store_true",
+                        help="Motor mesa: activar solo agentes que pueden cambiar y parar en el punto fijo")
+    parser.add_argument("--sorteo-difusion", choices=p.SORTEOS_DIFUSION, default=None,
+                        help="Sorteos de difusión comunes entre escenarios o antitéticos por parejas de réplicas "
+                             "(antitéticos: sin reducción de varianza apreciable medida con n = 200)")
+    parser.add_argument("--procesos", type=int, default=None)
+    parser.add_argument("--particiones", type=int, default=None, metavar="P",
+                        help="Motor particionado: procesos entre los que se reparte cada red (por defecto, uno por CPU)")
+    parser.add_argument("--lotes", type=int, default=None, metavar="B",
+                        help="Motor vectorizado: avanza juntos hasta B escenarios con la misma red y población")
+    parser.add_argument("--grabar", metavar="DIR",
+                        help="Graba el estado de cada agente turno a turno (una trayectoria por réplica) para reproducirlo en app.py")
+    parser.add_argument("--formato", choices=["csv", "parquet"], default="csv")
+    parser.add_argument("--salida", default="resultados")
+
+    # Modo superficie: en lugar del barrido se construye el sustituto de sensibilidad.py
+    # sobre (news_score, news_validez, news_difusion, encaje) con el primer valor de n y p_no_clientes
+    parser.add_argument("--superficie", help="Construye la superficie de quiebra y la guarda en este fichero .joblib")
+    parser.add_argument("--diseno", choices=["lhs", "sobol"], default="lhs")
+    parser.add_argument("--puntos-iniciales", type=int, default=40)
+    parser.add_argument("--rondas", type=int, default=4, help="Rondas de puntos adaptativos")
+    parser.add_argument("--puntos-por-ronda", type=int, default=10)
+    return parser.parse_args(argv)
+
+
+def main_superficie(args):
+    params_base = {"n": args.n[0], "total_depositos": args.total_depositos, "p_no_clientes": args.p_no_clientes[0]}
+    if args.activacion_selectiva:
+        params_base["activacion_selectiva"] = True
+    superficie = construir_superficie(params_base, n_inicial=args.puntos_iniciales, rondas=args.rondas,
+                                      por_ronda=args.puntos_por_ronda, n_replicas=args.replicas,
+                                      max_turnos=args.max_turnos, seed=args.seed, metodo=args.diseno,
+                                      motor=args.motor, procesos=args.procesos)
+    os.makedirs(os.path.dirname(args.superficie) or ".", exist_ok=True)
+    superficie.guardar(args.superficie)
+    print(f"Superficie guardada en {args.superficie} ({len(superficie.X)} puntos)")
+
+
+def main(argv=None):
+    args = parsear_argumentos(argv)
+    if args.activacion_selectiva and args.motor != "mesa":
+        raise SystemExit("--activacion-selectiva solo está disponible con --motor mesa")
+    if args.formato == "parquet" and not args.superficie and importlib.util.find_spec("pyarrow") is None:
+        # Antes de simular: sin pyarrow el fallo llegaría al escribir la primera fila
+        raise SystemExit("--formato parquet necesita pyarrow (pip install pyarrow), o usa --formato csv")
+    if args.superficie:
+        return main_superficie(args)
+    escenarios = leer_escenarios(args.escenarios) if args.escenarios else rejilla_escenarios(args)
+    plan = plan_replicas(args.seed, args.replicas, args.sorteo_difusion)
+    if args.lotes and args.motor != "vectorizado":
+        raise SystemExit("--lotes solo está disponible con --motor vectorizado")
+    if args.lotes and args.grabar:
+        raise SystemExit("--grabar no está disponible con --lotes")
+
+    def parametros(escenario):
+        params = dict(escenario, total_depositos=args.total_depositos)
+        if args.activacion_selectiva:
+            params["activacion_selectiva"] = True
+        if args.motor == "particionado" and args.particiones:
+            params["particiones"] = args.particiones
+        return params
+
+    def tareas():
+        for escenario_id, escenario in enumerate(escenarios):
+            for replica, (seed, extra) in enumerate(plan):
+                yield (escenario_id, escenario, replica), dict(parametros(escenario), **extra), seed
+
+    def directorio_trayectoria(etiqueta):
+        escenario_id, _, replica = etiqueta
+        return os.path.join(args.grabar, f"escenario{escenario_id:04d}_replica{replica:03d}")
+
+    def tareas_por_semilla():
+        # En lotes: réplica a réplica, y dentro de cada una los escenarios que comparten red y
+        # población (mismo n y p_no_clientes) seguidos, para que caigan en el mismo lote
+        numerados = sorted(enumerate(escenarios), key=lambda e: (e[1]["n"], e[1]["p_no_clientes"]))
+        for replica, (seed, extra) in enumerate(plan):
+            for escenario_id, escenario in numerados:
+                yield (escenario_id, escenario, replica), dict(parametros(escenario), **extra), seed
+
+    os.makedirs(args.salida, exist_ok=True)
+    Escritor = EscritorParquet if args.formato == "parquet" else EscritorCSV
+    columnas_ejecucion = (["escenario"] + list(PARAMETROS_BARRIDO) +
+                          ["motor", "replica", "seed", "turnos", "quiebra", "turno_quiebra", "liquidez_final",
+                           "huidas_final", "informadas_final", "fuga_media_clientes"])
+    ejecuciones = Escritor(os.path.join(args.salida, f"ejecuciones.{args.formato}"), columnas_ejecucion)
+    turnos = Escritor(os.path.join(args.salida, f"turnos.{args.formato}"), COLUMNAS_TURNO)
+
+    completadas = 0
+    try:
+        if args.lotes:
+            resultados = iterar_lotes(tareas_por_semilla(), args.max_turnos, args.lotes, args.procesos)
+        else:
+            # El motor particionado ya reparte cada réplica entre procesos: las réplicas van de una en una
+            procesos = 1 if args.motor == "particionado" else args.procesos
+            resultados = iterar_replicas(tareas(), args.max_turnos, args.motor, procesos,
+                                         grabar=directorio_trayectoria if args.grabar else None)
+        for etiqueta, resultado in resultados:
+            fila_ejecucion, filas_turno = filas_resultado(etiqueta, resultado, args.motor)
+            ejecuciones.escribir([fila_ejecucion])
+            turnos.escribir(filas_turno)
+            completadas += 1
+            if completadas % 100 == 0:
+                print(f"{completadas} réplicas completadas", flush=True)
+    finally:
+        ejecuciones.cerrar()
+        turnos.cerrar()
+    print(f"Barrido terminado: {completadas} réplicas en {args.salida}")
+
+
+if __name__ == "__main__":
+    main()
@@ -18,11 +18,17 @@ REDUCCION_PANICO_FGD = 0.5  # Los protegidos tienen la mitad de miedo
 # Representa años de antigüedad o vinculación (hipoteca, nómina)
 RANGO_FIDELIDAD = (0.1, 0.9) # 0.1: nuevo cliente, 0.9: cliente muy fiel
 
+# --- AVERSIÓN AL RIESGO ---
+RANGO_AVERSION = (0.2, 0.8)  # Base aleatoria, luego se suma el factor generacional
+
 # --- LÓGICA DE SALDOS (€) ---
 SALDO_RETAIL_RANGO = (1000, 15000)
 SALDO_EMPRESA_RANGO = (50000, 200000)
 DISTRIBUCION_TIPOS = ["Retail", "VIP", "Empresa"]
 PROBABILIDADES_TIPOS = [0.75, 0.20, 0.05]
+TIPOS_NODO = DISTRIBUCION_TIPOS + ["No-Cliente"]  # Códigos compactos: índice en esta lista
+# Saldo de cada nodo como múltiplo (mínimo, máximo) del saldo promedio por nodo cliente
+RANGOS_SALDO_TIPO = {"Retail": (0.5, 1.2), "VIP": (1.5, 3.0), "Empresa": (4.0, 8.0)}
 
 # --- UMBRALES DE COMPORTAMIENTO ---
 # Parámetros cliente
@@ -36,4 +42,8 @@ x0_NO_CLIENTE = 0.45
 # --- PESOS DE LA DECISIÓN (Suman 1.0) ---
 PESO_NOTICIA = 0.4   # Impacto de los medios
 PESO_SOCIAL = 0.5    # Lo que hacen sus vecinos (efecto rebaño)
-PESO_LIQUIDEZ = 0.1  # Salud financiera real del banco
\ No newline at end of file
+PESO_LIQUIDEZ = 0.1  # Salud financiera real del banco
+# --- SORTEOS DE DIFUSIÓN (REDUCCIÓN DE VARIANZA) ---
+# "comun": mismo uniforme por nodo y turno en todos los escenarios con la misma semilla
+# "antitetico": el complementario 1-u, para la réplica pareja
+SORTEOS_DIFUSION = ("comun", "antitetico")
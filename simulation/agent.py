@@ -3,7 +3,7 @@ import numpy as np
 import parametros as p
 
 class ClienteCaixa(Agent):
-    def __init__(self, unique_id, model, saldo, tipo):
+    def __init__(self, unique_id, model, saldo, tipo, edad=None, aversion=None, sexo=None, fidelidad=None):
         super().__init__(unique_id, model)
         self.unique_id = unique_id
         
@@ -15,34 +15,51 @@ class ClienteCaixa(Agent):
         self.tipo = tipo
         
         # Parámetros de comportamiento
-        self.edad = int(np.clip(self.random.gauss(p.EDAD_MEDIA, p.EDAD_DESVIACION) , 18, 90))
+        # BancoModel los pasa ya muestreados en lote (poblacion.generar_poblacion); si no
+        # llegan, el agente los sortea por su cuenta
+        self.edad = edad if edad is not None else int(np.clip(self.random.gauss(p.EDAD_MEDIA, p.EDAD_DESVIACION) , 18, 90))
         self.digitalizacion = 1.0 - (self.edad / p.EDAD_MAXIMA)
         factor_generacional = (self.edad / p.EDAD_MAXIMA) * 0.5
-        self.aversion = np.clip(self.random.uniform(0.2, 0.8) + factor_generacional, 0, 1)
-        self.sexo = self.random.choices(p.DISTRIBUCION_SEXO, p.PROBABILIDADES_SEXO)[0]
-        self.fidelidad = self.random.uniform(p.RANGO_FIDELIDAD[0], p.RANGO_FIDELIDAD[1])
+        if aversion is None:
+            aversion = np.clip(self.random.uniform(*p.RANGO_AVERSION) + factor_generacional, 0, 1)
+        self.aversion = aversion
+        self.sexo = sexo if sexo is not None else self.random.choices(p.DISTRIBUCION_SEXO, p.PROBABILIDADES_SEXO)[0]
+        self.fidelidad = fidelidad if fidelidad is not None else self.random.uniform(p.RANGO_FIDELIDAD[0], p.RANGO_FIDELIDAD[1])
         self.protegido_fgd = self.saldo_por_persona <= p.UMBRAL_FGD
         self.alcance_noticia = False
+        self.vecinos = ()  # Se rellena en BancoModel.__init__ una vez colocados todos los agentes
 
 
     def step(self):
+        # Perfilado opcional por fases (perfilado.py): sin perfilador solo cuesta los 'is not None'
+        perf = self.model.perfilador
+        if perf is not None:
+            t = perf.reloj()
+
         # 1. DIFUSIÓN (Común)
         if not self.alcance_noticia:
-            if self.random.random() < (self.model.noticia_difusion * self.digitalizacion):
+            # Con sorteo_difusion el número sale del array del turno (comunes/antitéticos entre réplicas)
+            uniformes = self.model.uniformes_difusion
+            sorteo = self.random.random() if uniformes is None else uniformes[self.unique_id]
+            if sorteo < (self.model.noticia_difusion * self.digitalizacion):
                 self.alcance_noticia = True
+                self.model.nodos_informados += 1
+        if perf is not None:
+            t = perf.marcar("difusion", t)
         
         if not self.alcance_noticia:
             return
 
         # 2. CONTAGIO SOCIAL (Los vecinos miran cuánto pánico hay alrededor)
-        vecinos_ids = list(self.model.G.neighbors(self.pos))
-        vecinos_agentes = [self.model.grid.get_cell_list_contents([v])[0] for v in vecinos_ids]
+        vecinos_agentes = self.vecinos  # índice precalculado en BancoModel.__init__
         
         # IMPORTANTE: Los vecinos se asustan por el 'porcentaje_retirado' de otros 
         if vecinos_agentes:
             fuga_vecinos = sum(v.porcentaje_retirado for v in vecinos_agentes) / len(vecinos_agentes)
         else:
             fuga_vecinos = 0
+        if perf is not None:
+            t = perf.marcar("vecinos", t)
 
         # 3. LÓGICA PARA NO-CLIENTES (Vector de propagación puro)
         if self.tipo == "No-Cliente":
@@ -53,7 +70,11 @@ class ClienteCaixa(Agent):
             score_opinion = np.clip(score_opinion, 0, 1)
 
             # Su 'porcentaje_retirado' NO es dinero, es su 'Nivel de Escándalo'
-            self.porcentaje_retirado = 1 / (1 + np.exp(-p.K_RUIDO_NO_CLIENTE * (score_opinion - p.x0_NO_CLIENTE)))
+            escandalo = 1 / (1 + np.exp(-p.K_RUIDO_NO_CLIENTE * (score_opinion - p.x0_NO_CLIENTE)))
+            self.model.suma_rumor += escandalo - self.porcentaje_retirado
+            self.porcentaje_retirado = escandalo
+            if perf is not None:
+                perf.marcar("opinion", t)
             return
 
         # 4. LÓGICA PARA CLIENTES 
@@ -71,9 +92,13 @@ class ClienteCaixa(Agent):
         score_final = score_final * (1 - (1*self.fidelidad)) # Reduce hasta un 30% el pánico si es muy fiel
         score_final = np.clip(score_final, 0, 1)
         meta_fuga = 1 / (1 + np.exp(-p.K_RUIDO_CLIENTE * (score_final - p.x0_CLIENTE)))
+        if perf is not None:
+            t = perf.marcar("cliente", t)
         
         if meta_fuga > self.porcentaje_retirado:
             self.ejecutar_retirada_progresiva(meta_fuga)
+            if perf is not None:
+                perf.marcar("retirada", t)
 
     def ejecutar_retirada_progresiva(self, meta_fuga):
         # Calculamos cuánto dinero extra representa ese incremento de pánico
@@ -89,5 +114,6 @@ class ClienteCaixa(Agent):
             # Actualizamos el estado interno del agente
             self.saldo -= monto_real
             self.porcentaje_retirado += (monto_real / self.saldo_inicial)
+            self.model.fuga_total += (monto_real / self.saldo_inicial)
             
  
\ No newline at end of file
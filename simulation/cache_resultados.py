@@ -0,0 +1,110 @@
+# simulation/cache_resultados.py
+import functools
+import glob
+import hashlib
+import json
+import os
+
+import numpy as np
+
+# --- CACHÉ DE RESULTADOS EN DISCO ---
+# Una entrada por réplica: series por turno y resumen final de los agentes, indexados por un
+# hash de (parámetros del modelo, max_turnos, semilla, motor, versión del código). El plan de
+# réplicas es estable (la réplica i tiene siempre la misma semilla), así que pedir más
+# réplicas de un escenario ya visto solo simula las que faltan.
+# Las entradas menos usadas se borran cuando el directorio supera max_bytes (LRU por mtime).
+
+DIRECTORIO_CACHE = os.path.join("resultados", "cache")
+MAX_BYTES_CACHE = 512 * 1024 ** 2
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@functools.lru_cache(maxsize=None)
+def version_codigo():
+    # Hash del código que determina los resultados (simulation/*.py y parametros.py):
+    # cualquier cambio en el modelo invalida la caché sin tener que acordarse de vaciarla
+    h = hashlib.sha256()
+    for ruta in sorted(glob.glob(os.path.join(RAIZ, "simulation", "*.py"))) + [os.path.join(RAIZ, "parametros.py")]:
+        with open(ruta, "rb") as f:
+            h.update(os.path.basename(ruta).encode())
+            h.update(f.read())
+    return h.hexdigest()[:16]
+
+
+def normalizar(valor):
+    # 10000000 y 1e7 (o 200 y 200.0) son el mismo escenario
+    if isinstance(valor, (bool, np.bool_, str)) or valor is None:
+        return valor
+    return float(valor)
+
+
+class CacheResultados:
+    def __init__(self, directorio=DIRECTORIO_CACHE, max_bytes=MAX_BYTES_CACHE):
+        self.directorio = directorio
+        self.max_bytes = max_bytes
+        os.makedirs(directorio, exist_ok=True)
+        self.tamanos = {ruta: os.path.getsize(ruta) for ruta in glob.glob(os.path.join(directorio, "*.npz"))}
+
+    def clave(self, params, max_turnos, seed, motor="mesa"):
+        contenido = json.dumps({
+            "params": {k: normalizar(v) for k, v in sorted(params.items())},
+            "max_turnos": int(max_turnos),
+            "seed": int(seed),
+            "motor": motor,
+            "version": version_codigo(),
+        }, sort_keys=True)
+        return hashlib.sha256(contenido.encode()).hexdigest()[:32]
+
+    def _ruta(self, clave):
+        return os.path.join(self.directorio, f"{clave}.npz")
+
+    def obtener(self, clave):
+        ruta = self._ruta(clave)
+        try:
+            with np.load(ruta, allow_pickle=False) as datos:
+                resultado = {
+                    "seed": int(datos["seed"]),
+                    "series": {k[len("series_"):]: datos[k] for k in datos.files if k.startswith("series_")},
+                    "agentes": {k[len("agentes_"):]: datos[k] for k in datos.files if k.startswith("agentes_")},
+                    "poblacion_objetivo": int(datos["poblacion_objetivo"]),
+                    "perfil": None,
+                }
+        except (FileNotFoundError, OSError, ValueError, KeyError):
+            # Sin entrada, o un fichero a medio escribir por otro proceso: se vuelve a simular
+            return None
+        os.utime(ruta)  # Uso reciente para la política LRU
+        return resultado
+
+    def guardar(self, clave, resultado):
+        ruta = self._ruta(clave)
+        arrays = {"seed": np.asarray(resultado["seed"]), "poblacion_objetivo": np.asarray(resultado["poblacion_objetivo"])}
+        arrays.update({f"series_{k}": np.asarray(v) for k, v in resultado["series"].items()})
+        arrays.update({f"agentes_{k}": np.asarray(v) for k, v in resultado["agentes"].items()})
+        # Escritura atómica: otro proceso nunca ve una entrada a medias
+        temporal = f"{ruta}.{os.getpid()}.tmp"
+        with open(temporal, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(temporal, ruta)
+        self.tamanos[ruta] = os.path.getsize(ruta)
+        self.recortar()
+
+    def recortar(self):
+        total = sum(self.tamanos.values())
+        if total <= self.max_bytes:
+            return
+        for ruta in sorted(self.tamanos, key=lambda r: os.path.getmtime(r) if os.path.exists(r) else 0):
+            if total <= self.max_bytes:
+                break
+            total -= self.tamanos.pop(ruta)
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+
+    def vaciar(self):
+        for ruta in list(self.tamanos):
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+        self.tamanos = {}
@@ -0,0 +1,235 @@
+# simulation/estadisticas.py
+import numpy as np
+import pandas as pd
+import parametros as p
+
+# --- AGREGACIÓN EN STREAMING ENTRE RÉPLICAS ---
+# Cada réplica terminada se incorpora a estadísticos acumulados y se descarta; la memoria
+# depende de max_turnos y del número de segmentos, nunca del número de réplicas.
+
+SERIES = ("liquidez", "huidas", "informadas")
+CUANTILES = (0.05, 0.5, 0.95)
+Z_95 = 1.96
+
+
+def rango_edad(edad):
+    # Mismos tramos que el informe de app.py
+    return np.where(edad < 35, "1. Jóvenes (<35)", np.where(edad < 60, "2. Adultos (35-60)", "3. Séniors (>60)"))
+
+
+class CuantilP2:
+    # Estimador P² (Jain y Chlamtac, 1985) de un cuantil sin guardar las observaciones.
+    # Vectorizado: mantiene un estimador independiente por cada posición (un turno).
+    def __init__(self, q, tamano):
+        self.q = q
+        self.n_obs = 0
+        self.alturas = np.zeros((tamano, 5))
+        self.posiciones = np.tile(np.arange(1.0, 6.0), (tamano, 1))
+        self.deseadas = np.tile(np.array([1, 1 + 2 * q, 1 + 4 * q, 3 + 2 * q, 5]), (tamano, 1))
+        self.incrementos = np.array([0, q / 2, q, (1 + q) / 2, 1])
+
+    def agregar(self, x):
+        h, npos = self.alturas, self.posiciones
+        if self.n_obs < 5:
+            # Las cinco primeras observaciones inicializan los marcadores
+            h[:, self.n_obs] = x
+            self.n_obs += 1
+            if self.n_obs == 5:
+                h.sort(axis=1)
+            return
+        self.n_obs += 1
+
+        # Celda en la que cae x y ajuste de los extremos
+        k = np.clip((x[:, None] >= h).sum(axis=1) - 1, 0, 3)
+        h[:, 0] = np.minimum(h[:, 0], x)
+        h[:, 4] = np.maximum(h[:, 4], x)
+        npos += np.arange(5)[None, :] > k[:, None]
+        self.deseadas += self.incrementos
+
+        filas = np.arange(len(x))
+        for i in (1, 2, 3):
+            d = self.deseadas[:, i] - npos[:, i]
+            sube = (d >= 1) & (npos[:, i + 1] - npos[:, i] > 1)
+            baja = (d <= -1) & (npos[:, i - 1] - npos[:, i] < -1)
+            mover = sube | baja
+            if not mover.any():
+                continue
+            s = np.where(sube, 1.0, -1.0)
+            n_ant, n_i, n_sig = npos[:, i - 1], npos[:, i], npos[:, i + 1]
+            h_ant, h_i, h_sig = h[:, i - 1], h[:, i], h[:, i + 1]
+
+            # Predicción parabólica; si se sale del intervalo de los vecinos, lineal
+            parabolica = h_i + s / (n_sig - n_ant) * (
+                (n_i - n_ant + s) * (h_sig - h_i) / (n_sig - n_i) +
+                (n_sig - n_i - s) * (h_i - h_ant) / (n_i - n_ant)
+            )
+            j = i + s.astype(int)
+            lineal = h_i + s * (h[filas, j] - h_i) / (npos[filas, j] - n_i)
+            nueva = np.where((h_ant < parabolica) & (parabolica < h_sig), parabolica, lineal)
+
+            h[mover, i] = nueva[mover]
+            npos[mover, i] += s[mover]
+
+    def valor(self):
+        if self.n_obs == 0:
+            return np.full(len(self.alturas), np.nan)
+        if self.n_obs <= 5:
+            return np.percentile(self.alturas[:, :self.n_obs], self.q * 100, axis=1)
+        return self.alturas[:, 2].copy()
+
+
+class Welford:
+    # Media y varianza acumuladas (algoritmo de Welford); funciona con escalares o arrays
+    def __init__(self, forma=()):
+        self.n = 0
+        self.media = np.zeros(forma)
+        self.m2 = np.zeros(forma)
+
+    def agregar(self, x):
+        self.n += 1
+        delta = x - self.media
+        self.media = self.media + delta / self.n
+        self.m2 = self.m2 + delta * (x - self.media)
+
+    def combinar(self, n, media, m2):
+        # Fusiona un lote ya resumido (n, media, m2) con la fórmula de Chan et al.
+        if n == 0:
+            return
+        total = self.n + n
+        delta = media - self.media
+        self.media = self.media + delta * n / total
+        self.m2 = self.m2 + m2 + delta ** 2 * self.n * n / total
+        self.n = total
+
+    def varianza(self):
+        return self.m2 / (self.n - 1) if self.n > 1 else np.zeros_like(self.media)
+
+    def semiancho_ic(self):
+        return Z_95 * np.sqrt(self.varianza() / self.n) if self.n else np.zeros_like(self.media)
+
+
+class AgregadorReplicas:
+    def __init__(self, max_turnos, cuantiles=CUANTILES):
+        self.max_turnos = max_turnos
+        self.n_replicas = 0
+        self.longitud_maxima = 0
+        self.por_turno = {clave: Welford(max_turnos) for clave in SERIES}
+        self.cuantiles = {clave: {q: CuantilP2(q, max_turnos) for q in cuantiles} for clave in ("liquidez", "huidas")}
+
+        # Quiebras: conteo por turno (para el histograma) y media del turno de colapso
+        self.quiebras_por_turno = np.zeros(max_turnos + 1, dtype=np.int64)
+        self.turno_quiebra = Welford()
+        self.duracion = Welford()
+
+        # Fuga final de los clientes por segmento: {dimensión: {categoría: Welford}}
+        self.segmentos = {"Rango Edad": {}, "Tipo": {}, "Sexo": {}, "Protegido FGD": {}}
+
+    def agregar(self, series, agentes):
+        # series: {"liquidez", "huidas", "informadas"} de una réplica; agentes: resumen_agentes()
+        turnos = len(series["liquidez"])
+        self.n_replicas += 1
+        self.longitud_maxima = max(self.longitud_maxima, turnos)
+        self.duracion.agregar(turnos)
+
+        for clave in SERIES:
+            # Relleno como el informe original: la liquidez de una réplica quebrada vale 0 después
+            # de la quiebra, huidas e informadas se quedan en su último valor
+            valores = np.asarray(series[clave], dtype=float)
+            relleno = 0.0 if clave == "liquidez" else (valores[-1] if turnos else 0.0)
+            completa = np.concatenate([valores, np.full(self.max_turnos - turnos, relleno)])
+            self.por_turno[clave].agregar(completa)
+            for estimador in self.cuantiles.get(clave, {}).values():
+                estimador.agregar(completa)
+
+        if turnos and series["liquidez"][-1] <= 0:
+            self.quiebras_por_turno[turnos] += 1
+            self.turno_quiebra.agregar(turnos)
+
+        fuga = np.asarray(agentes["fuga"], dtype=float) * 100
+        categorias = {
+            "Rango Edad": rango_edad(agentes["edad"]),
+            "Tipo": np.array(p.TIPOS_NODO)[agentes["tipo"]],
+            "Sexo": np.array(p.DISTRIBUCION_SEXO)[agentes["sexo"]],
+            "Protegido FGD": np.where(agentes["protegido_fgd"], "Sí", "No"),
+        }
+        for dimension, etiquetas in categorias.items():
+            for categoria in np.unique(etiquetas):
+                valores = fuga[etiquetas == categoria]
+                acumulado = self.segmentos[dimension].setdefault(str(categoria), Welford())
+                acumulado.combinar(len(valores), valores.mean(), ((valores - valores.mean()) ** 2).sum())
+
+    # --- CONSULTAS ---
+    def media(self, clave):
+        return self.por_turno[clave].media[:self.longitud_maxima]
+
+    def cuantil(self, clave, q):
+        return self.cuantiles[clave][q].valor()[:self.longitud_maxima]
+
+    @property
+    def n_quiebras(self):
+        return int(self.quiebras_por_turno.sum())
+
+    def prob_quiebra(self):
+        return self.n_quiebras / self.n_replicas if self.n_replicas else 0.0
+
+    def turnos_quiebra(self):
+        # (turnos, nº de réplicas quebradas en cada uno) para el histograma
+        turnos = np.flatnonzero(self.quiebras_por_turno)
+        return turnos, self.quiebras_por_turno[turnos]
+
+    def tabla_segmento(self, dimension):
+        filas = [
+            {dimension: categoria, "Fuga %": w.media, "Desv %": float(np.sqrt(w.varianza())), "N": w.n}
+            for categoria, w in sorted(self.segmentos[dimension].items())
+        ]
+        return pd.DataFrame(filas, columns=[dimension, "Fuga %", "Desv %", "N"])
+
+
+class CriterioPrecision:
+    # Parada de las réplicas adaptativas: se sigue simulando hasta que el IC 95% de la
+    # probabilidad de quiebra y el del turno medio de colapso son más estrechos que las
+    # tolerancias (en ± puntos de probabilidad y ± turnos), o hasta max_replicas.
+    # Con réplicas antitéticas la unidad es la pareja: la varianza se mide sobre la media de
+    # cada pareja, que es donde se nota la correlación negativa.
+    def __init__(self, tol_prob, tol_turno, min_replicas=6, max_replicas=200, tam_unidad=1):
+        self.tol_prob = tol_prob
+        self.tol_turno = tol_turno
+        self.min_replicas = max(min_replicas, 2 * tam_unidad)
+        self.max_replicas = max_replicas
+        self.tam_unidad = tam_unidad
+        self.n_replicas = 0
+        self.prob = Welford()    # Indicador de quiebra (medio por unidad)
+        self.turno = Welford()   # Turno de colapso de cada réplica quebrada
+        self.unidad = []
+
+    def agregar(self, series):
+        liquidez = series["liquidez"]
+        quiebra = bool(len(liquidez) and liquidez[-1] <= 0)
+        self.n_replicas += 1
+        if quiebra:
+            self.turno.agregar(len(liquidez))
+        self.unidad.append(float(quiebra))
+        if len(self.unidad) == self.tam_unidad:
+            self.prob.agregar(np.mean(self.unidad))
+            self.unidad = []
+
+    def semiancho_prob(self):
+        if self.prob.n < 2:
+            return np.inf
+        if self.prob.m2 == 0:
+            # Todas las unidades iguales (0% o 100% de quiebras): regla del tres
+            return 3 / self.n_replicas
+        return float(self.prob.semiancho_ic())
+
+    def semiancho_turno(self):
+        # Sin quiebras (o con una sola) no hay turno medio que precisar
+        if self.turno.n < 2:
+            return 0.0 if self.turno.n == 0 else np.inf
+        return float(self.turno.semiancho_ic())
+
+    def alcanzado(self):
+        return (self.n_replicas >= self.min_replicas and not self.unidad and
+                self.semiancho_prob() <= self.tol_prob and self.semiancho_turno() <= self.tol_turno)
+
+    def terminado(self):
+        return self.alcanzado() or (self.n_replicas >= self.max_replicas and not self.unidad)
@@ -0,0 +1,224 @@
+# simulation/instantanea.py
+import json
+
+import numpy as np
+import parametros as p
+
+from .model import BancoModel
+from .model_eventos import BancoModelEventos
+from .model_particionado import BancoModelParticionado
+from .model_vectorizado import BancoModelVectorizado
+from .red import Topologia
+
+# --- INSTANTÁNEAS: GUARDAR, BIFURCAR Y REANUDAR ---
+# Una instantánea es un dict de arrays con el estado completo de un modelo (agentes, banco,
+# contadores, generador aleatorio y red) que se guarda tal cual con np.savez. Restaurarla
+# crea un modelo nuevo que sigue exactamente donde se quedó el original; antes de seguir se
+# pueden cambiar encaje o los parámetros de la noticia. Así varias intervenciones desde el
+# turno 40 comparten el prefijo y solo cuestan los turnos que faltan.
+
+# Escalares del banco y contadores incrementales (mismos nombres en los dos motores)
+ESCALARES = ("liquidez_banco", "liquidez_inicial", "prestamos_activos", "depositos_totales", "coeficiente_reserva",
+             "noticia_score", "noticia_validez", "noticia_difusion", "representacion_por_nodo", "poblacion_objetivo",
+             "fuga_total", "nodos_informados", "suma_rumor", "n_no_clientes", "running")
+# Estado numérico de cada agente (en BancoModel se guarda en float64 para reanudar bit a bit)
+CAMPOS_AGENTE = ("saldo_inicial", "saldo", "porcentaje_retirado", "edad", "digitalizacion", "aversion", "fidelidad")
+# Conjuntos de ActivacionSelectiva
+CONJUNTOS_ACTIVACION = ("activos", "pendientes_noticia", "clientes_atentos")
+# Agenda de BancoModelEventos: turnos de llegada de la noticia y eventos del turno siguiente
+AGENDA_EVENTOS = ("orden_llegada", "turno_llegada", "cursor_llegada", "cambiados", "pendientes",
+                  "liquidez_evaluada", "noticia_evaluada", "difusion_programada")
+
+
+def empaquetar(valores):
+    return np.packbits(np.asarray(valores, dtype=bool), bitorder="little")
+
+
+def desempaquetar(bits, n):
+    return np.unpackbits(bits, count=n, bitorder="little").view(bool)
+
+
+def capturar(model):
+    # Foto en memoria del estado completo; es barata (O(n)) y no altera el modelo
+    estado = {clave: np.asarray(getattr(model, clave)) for clave in ESCALARES}
+    estado["sorteo_difusion"] = np.asarray(model.sorteo_difusion or "")
+    if model.rng_difusion is not None:
+        estado["rng_difusion"] = np.asarray(json.dumps(model.rng_difusion.bit_generator.state))
+
+    if isinstance(model, BancoModelParticionado):
+        # Su estado vive repartido en memoria compartida entre procesos
+        raise ValueError("El motor particionado no admite instantáneas; usa el vectorizado (mismos resultados)")
+    if isinstance(model, BancoModelVectorizado):
+        pob = model.poblacion
+        estado["motor"] = np.asarray("eventos" if isinstance(model, BancoModelEventos) else "vectorizado")
+        for campo in CAMPOS_AGENTE:
+            estado[campo] = getattr(pob, campo).copy()
+        estado["tipo"], estado["sexo"] = pob.tipo.copy(), pob.sexo.copy()
+        estado["alcance_noticia"] = pob.alcance_noticia.bits.copy()
+        estado["protegido_fgd"] = pob.protegido_fgd.bits.copy()
+        estado["indptr"], estado["indices"] = model.indptr, model.indices
+        estado["turno"] = np.asarray(model.turno)
+        estado["rng"] = np.asarray(json.dumps(model.rng.bit_generator.state))
+        if isinstance(model, BancoModelEventos):
+            for clave in AGENDA_EVENTOS:
+                estado[f"agenda_{clave}"] = np.array(getattr(model, clave))
+            estado["agenda_clientes_informados"] = model.clientes_informados[:model.n_clientes_informados].copy()
+            if model.rng_difusion is None:  # Si no, las llegadas usan rng_difusion, que ya se guarda
+                estado["rng_llegadas"] = np.asarray(json.dumps(model.rng_llegadas.bit_generator.state))
+        return estado
+
+    agentes = model.schedule.agents
+    estado["motor"] = np.asarray("mesa")
+    for campo in CAMPOS_AGENTE:
+        estado[campo] = np.array([getattr(a, campo) for a in agentes], dtype=float)
+    estado["tipo"] = np.array([p.TIPOS_NODO.index(a.tipo) for a in agentes], dtype=np.uint8)
+    estado["sexo"] = np.array([p.DISTRIBUCION_SEXO.index(a.sexo) for a in agentes], dtype=np.uint8)
+    estado["alcance_noticia"] = empaquetar([a.alcance_noticia for a in agentes])
+    estado["protegido_fgd"] = empaquetar([a.protegido_fgd for a in agentes])
+
+    # La red se guarda con el orden de vecinos que usa cada agente: la media del pánico
+    # suma en ese orden y cambiarlo movería el último decimal
+    grados = np.array([len(a.vecinos) for a in agentes], dtype=np.int64)
+    estado["indptr"] = np.concatenate([[0], np.cumsum(grados)])
+    estado["indices"] = np.array([v.unique_id for a in agentes for v in a.vecinos], dtype=np.int32)
+
+    estado["turno"] = np.asarray(model.schedule.steps)
+    version, interno, gauss = model.random.getstate()
+    estado["rng"] = np.asarray(interno, dtype=np.uint32)
+    estado["rng_gauss"] = np.asarray(np.nan if gauss is None else gauss)
+
+    selectiva = getattr(model.schedule, "activos", None) is not None
+    estado["activacion_selectiva"] = np.asarray(hasattr(model.schedule, "activos"))
+    estado["activacion_iniciada"] = np.asarray(selectiva)
+    for nombre in CONJUNTOS_ACTIVACION:
+        conjunto = getattr(model.schedule, nombre, None) or ()
+        estado[nombre] = np.array(sorted(conjunto), dtype=np.int64)
+    return estado
+
+
+def guardar_instantanea(model_o_estado, ruta):
+    estado = model_o_estado if isinstance(model_o_estado, dict) else capturar(model_o_estado)
+    np.savez(ruta, **estado)
+
+
+def cargar_instantanea(ruta):
+    with np.load(ruta, allow_pickle=False) as datos:
+        return {clave: datos[clave] for clave in datos.files}
+
+
+def topologia_de(estado):
+    # Reconstruye la red desde la adyacencia guardada (solo si no se pasa una Topologia)
+    return Topologia(None, estado["indptr"], estado["indices"])
+
+
+def restaurar(estado, topologia=None, **cambios):
+    # Crea un modelo nuevo con el estado de la instantánea. 'topologia' permite compartir la
+    # red ya cargada entre muchas bifurcaciones; 'cambios' (encaje, news_score, news_validez,
+    # news_difusion) se aplican antes del siguiente step.
+    if topologia is None:
+        topologia = topologia_de(estado)
+    n = topologia.n
+    # Los valores de construcción se sobrescriben enseguida con los de la instantánea
+    params = dict(n=n, total_depositos=float(estado["liquidez_inicial"] + estado["prestamos_activos"]),
+                  encaje=float(estado["coeficiente_reserva"]), news_score=float(estado["noticia_score"]),
+                  news_validez=float(estado["noticia_validez"]), news_difusion=float(estado["noticia_difusion"]),
+                  seed=0, topologia=topologia, sorteo_difusion=str(estado["sorteo_difusion"]) or None)
+
+    if str(estado["motor"]) in ("vectorizado", "eventos"):
+        Modelo = BancoModelEventos if str(estado["motor"]) == "eventos" else BancoModelVectorizado
+        model = Modelo(**params, poblacion_objetivo=int(estado["poblacion_objetivo"]))
+        pob = model.poblacion
+        for campo in CAMPOS_AGENTE + ("tipo", "sexo"):
+            getattr(pob, campo)[:] = estado[campo]
+        pob.alcance_noticia.bits[:] = estado["alcance_noticia"]
+        pob.protegido_fgd.bits[:] = estado["protegido_fgd"]
+        model.indptr, model.indices = estado["indptr"], estado["indices"]
+        model.actualizar_factores_cliente()
+        model.turno = int(estado["turno"])
+        model.rng.bit_generator.state = json.loads(str(estado["rng"]))
+        if isinstance(model, BancoModelEventos):
+            restaurar_agenda(model, estado)
+    else:
+        model = BancoModel(**params, activacion_selectiva=bool(estado["activacion_selectiva"]))
+        agentes = model.schedule.agents
+        columnas = {campo: estado[campo].tolist() for campo in CAMPOS_AGENTE}
+        tipos, sexos = estado["tipo"].tolist(), estado["sexo"].tolist()
+        alcance = desempaquetar(estado["alcance_noticia"], n).tolist()
+        protegido = desempaquetar(estado["protegido_fgd"], n).tolist()
+        indptr, indices = estado["indptr"].tolist(), estado["indices"].tolist()
+        representacion = float(estado["representacion_por_nodo"])
+
+        for i, a in enumerate(agentes):
+            for campo, valores in columnas.items():
+                setattr(a, campo, valores[i])
+            a.edad = int(a.edad)
+            a.tipo = p.TIPOS_NODO[tipos[i]]
+            a.sexo = p.DISTRIBUCION_SEXO[sexos[i]]
+            a.alcance_noticia = alcance[i]
+            a.protegido_fgd = protegido[i]
+            a.saldo_por_persona = a.saldo_inicial / representacion
+            a.vecinos = tuple(agentes[j] for j in indices[indptr[i]:indptr[i + 1]])
+
+        model.schedule.steps = model.schedule.time = int(estado["turno"])
+        gauss = float(estado["rng_gauss"])
+        model.random.setstate((3, tuple(estado["rng"].tolist()), None if np.isnan(gauss) else gauss))
+        if bool(estado["activacion_iniciada"]):
+            for nombre in CONJUNTOS_ACTIVACION:
+                setattr(model.schedule, nombre, set(estado[nombre].tolist()))
+
+    for clave in ESCALARES:
+        valor = estado[clave].item()
+        setattr(model, clave, valor)
+    if "rng_difusion" in estado:
+        model.rng_difusion.bit_generator.state = json.loads(str(estado["rng_difusion"]))
+
+    aplicar_cambios(model, **cambios)
+    return model
+
+
+def aplicar_cambios(model, encaje=None, news_score=None, news_validez=None, news_difusion=None):
+    # Intervenciones a mitad de corrida
+    if not any(v is not None for v in (encaje, news_score, news_validez, news_difusion)):
+        return
+    if news_score is not None:
+        model.noticia_score = news_score
+    if news_validez is not None:
+        model.noticia_validez = news_validez
+    if news_difusion is not None:
+        model.noticia_difusion = news_difusion
+    if encaje is not None:
+        # Nuevo coeficiente de caja sobre los depósitos actuales: inyección (o retirada) de
+        # liquidez a costa de los préstamos. liquidez_inicial no cambia, así que una caja por
+        # encima de la inicial también calma el miedo_banco de los clientes.
+        ajuste = (encaje - model.coeficiente_reserva) * model.depositos_totales
+        ajuste = max(ajuste, -model.liquidez_banco)
+        model.liquidez_banco += ajuste
+        model.prestamos_activos -= ajuste
+        model.coeficiente_reserva = encaje
+
+    # Con otros parámetros el punto fijo alcanzado puede dejar de serlo: todos vuelven a activarse
+    model.running = True
+    if getattr(model, "schedule", None) is not None and hasattr(model.schedule, "activos"):
+        model.schedule.activos = None
+
+
+def restaurar_agenda(model, estado):
+    # Derivados de la población ya restaurada y agenda tal cual se guardó
+    model.cliente = model.es_cliente
+    model.informado = model.alcance_noticia.copy()
+    for clave in AGENDA_EVENTOS:
+        valor = estado[f"agenda_{clave}"]
+        setattr(model, clave, valor.copy() if valor.ndim else valor.item())
+    model.noticia_evaluada = tuple(model.noticia_evaluada.tolist())
+    iniciales = estado["agenda_clientes_informados"]
+    model.clientes_informados = np.empty(int(np.count_nonzero(model.cliente)), dtype=np.int64)
+    model.clientes_informados[:len(iniciales)] = iniciales
+    model.n_clientes_informados = len(iniciales)
+    if "rng_llegadas" in estado:
+        model.rng_llegadas.bit_generator.state = json.loads(str(estado["rng_llegadas"]))
+
+
+def bifurcar(model, **cambios):
+    # Copia independiente del modelo (compartiendo la red) con los cambios aplicados
+    topologia = model.topologia
+    return restaurar(capturar(model), topologia=topologia, **cambios)
@@ -1,12 +1,16 @@
-import networkx as nx
 from mesa import Model
 from mesa.time import RandomActivation
-from mesa.space import NetworkGrid
 from .agent import ClienteCaixa
+from .poblacion import generar_poblacion
+from .red import obtener_topologia
+from .scheduler import ActivacionSelectiva
 import numpy as np
+import parametros as p
 
 class BancoModel(Model):
-    def __init__(self, n, total_depositos, encaje, news_score, news_validez, news_difusion, p_no_clientes=0.2):
+    def __init__(self, n, total_depositos, encaje, news_score, news_validez, news_difusion, p_no_clientes=0.2, seed=None,
+                 activacion_selectiva=False, topologia=None, perfilador=None, sorteo_difusion=None, semilla_difusion=None):
+        # 'seed' lo consume Mesa en Model.__new__ para sembrar self.random
         super().__init__()
         
         # --- LÓGICA FINANCIERA: SOLVENCIA VS LIQUIDEZ ---
@@ -24,48 +28,126 @@ class BancoModel(Model):
         self.noticia_validez = news_validez
         self.noticia_difusion = news_difusion
 
+        # Perfilado por fases opcional (perfilado.Perfilador); lo consultan step() y ClienteCaixa.step
+        self.perfilador = perfilador
+
         # --- RED SOCIAL (SMALL WORLD) ---
-        self.G = nx.powerlaw_cluster_graph(n, 3, 0.5)
-        self.grid = NetworkGrid(self.G)
-        self.schedule = RandomActivation(self)
+        # Con una Topologia ya construida (red.py) se reutiliza la red en lugar de generarla.
+        # Sin ella se construye igual que en la caché (a partir de 'seed', sin sorteos de
+        # self.random): pasar la topología es solo un atajo y no cambia los resultados.
+        # Los agentes leen a sus vecinos del CSR: no hace falta grid ni grafo de networkx.
+        if topologia is None:
+            topologia = obtener_topologia(n, seed=seed)
+        self.topologia = topologia
+        # Con activación selectiva solo se ejecutan los agentes que pueden cambiar en el turno
+        self.schedule = ActivacionSelectiva(self) if activacion_selectiva else RandomActivation(self)
 
         self.poblacion_objetivo = 3000000
         self.representacion_por_nodo = self.poblacion_objetivo / n
 
         # --- CREACIÓN DE AGENTES (CLÚSTERES) ---
-        n_clientes_estimados = n * (1 - p_no_clientes)
-        
-        for i, node in enumerate(self.G.nodes()):
-            es_cliente = self.random.random() > p_no_clientes
-            
-            if es_cliente:
-                tipo = self.random.choices(["Retail", "VIP", "Empresa"], [75, 20, 5])[0]
-                
-                # Cada nodo representa un fragmento del total de depósitos
-                saldo_promedio_nodo = self.depositos_totales / n_clientes_estimados
-                
-                if tipo == 'Empresa':
-                    # Las empresas gestionan clústeres de capital mucho más grandes
-                    saldo = self.random.uniform(saldo_promedio_nodo * 4, saldo_promedio_nodo * 8)
-                elif tipo == 'VIP':
-                    saldo = self.random.uniform(saldo_promedio_nodo * 1.5, saldo_promedio_nodo * 3)
-                else:
-                    saldo = self.random.uniform(saldo_promedio_nodo * 0.5, saldo_promedio_nodo * 1.2)
-            else:
-                tipo = "No-Cliente"
-                saldo = 0
-        
-            # El agente ahora recibe el "saldo" como el patrimonio inicial del clúster
-            a = ClienteCaixa(i, self, saldo, tipo)
+        # Tipo, saldo y rasgos de todos los nodos se muestrean en lote (poblacion.py) con un
+        # generador de NumPy sembrado desde self.random; los agentes solo los reciben
+        rng = np.random.default_rng(self.random.getrandbits(64))
+        pob = generar_poblacion(n, total_depositos, p_no_clientes, rng, self.representacion_por_nodo)
+        saldos, tipos = pob.saldo_inicial.tolist(), pob.tipo.tolist()
+        edades, aversiones = pob.edad.tolist(), pob.aversion.tolist()
+        sexos, fidelidades = pob.sexo.tolist(), pob.fidelidad.tolist()
+
+        for i in range(n):
+            # El agente recibe el "saldo" como el patrimonio inicial del clúster
+            a = ClienteCaixa(i, self, saldos[i], p.TIPOS_NODO[tipos[i]], edad=edades[i], aversion=aversiones[i],
+                             sexo=p.DISTRIBUCION_SEXO[sexos[i]], fidelidad=fidelidades[i])
+            a.pos = i
             self.schedule.add(a)
-            self.grid.place_agent(a, node)
+
+        # --- ÍNDICE DE VECINOS ---
+        # La red es fija durante toda la corrida: cada agente guarda una tupla con sus
+        # vecinos (mismo orden que el CSR) y no vuelve a consultar la red
+        agentes = self.schedule.agents
+        indptr, indices = topologia.indptr.tolist(), topologia.indices.tolist()
+        for i, a in enumerate(agentes):
+            a.vecinos = tuple(agentes[j] for j in indices[indptr[i]:indptr[i + 1]])
+
+        # --- CONTADORES INCREMENTALES ---
+        # Se actualizan en el punto donde cambia cada agente (ClienteCaixa.step y
+        # ejecutar_retirada_progresiva), así el balance y las métricas de cada turno
+        # no necesitan recorrer toda la población.
+        # El pasivo real es la suma de los saldos repartidos; desde aquí solo baja con las retiradas
+        self.depositos_totales = sum(a.saldo for a in self.schedule.agents if a.tipo != "No-Cliente")
+        self.fuga_total = 0.0        # Suma de porcentaje_retirado de los clientes
+        self.nodos_informados = 0    # Nodos con alcance_noticia
+        self.suma_rumor = 0.0        # Suma de porcentaje_retirado de los No-Clientes
+        self.n_no_clientes = sum(1 for a in self.schedule.agents if a.tipo == "No-Cliente")
+
+        # --- SORTEOS DE DIFUSIÓN (REDUCCIÓN DE VARIANZA) ---
+        # Por defecto cada agente sortea con self.random, cuyo consumo depende del escenario.
+        # Con sorteo_difusion los sorteos salen de un generador propio: un uniforme por nodo y
+        # turno, el mismo en todos los escenarios con la misma semilla ("comun") o su
+        # complementario 1-u para la réplica pareja ("antitetico"). semilla_difusion fija la
+        # semilla de ese generador; por defecto sale de la del modelo.
+        self.sorteo_difusion = sorteo_difusion
+        self.uniformes_difusion = None
+        self.rng_difusion = None
+        if sorteo_difusion is not None:
+            if sorteo_difusion not in p.SORTEOS_DIFUSION:
+                raise ValueError(f"sorteo_difusion desconocido: {sorteo_difusion}")
+            self.rng_difusion = np.random.default_rng(self.random.getrandbits(64) if semilla_difusion is None else semilla_difusion)
+
+    @property
+    def G(self):
+        # Grafo de networkx bajo demanda (dibujo clásico, análisis); la simulación usa el CSR
+        return self.topologia.G
 
     def step(self):
+        perf = self.perfilador
+        if perf is not None:
+            t_turno = perf.reloj()
+
+        if self.rng_difusion is not None:
+            u = self.rng_difusion.random(len(self.schedule.agents))
+            self.uniformes_difusion = 1 - u if self.sorteo_difusion == "antitetico" else u
+
         self.schedule.step()
+        if perf is not None:
+            t = perf.reloj()
         
         # Seguridad financiera: la liquidez no puede ser negativa
         if self.liquidez_banco < 0:
             self.liquidez_banco = 0
-            
-        # Actualizamos depósitos totales basado en lo que realmente queda en el banco
-        self.depositos_totales = sum(a.saldo for a in self.schedule.agents if a.tipo != "No-Cliente")
\ No newline at end of file
+
+        if perf is not None:
+            perf.marcar("reconciliacion", t)
+            perf.marcar("turno", t_turno)
+
+    def resumen_turno(self):
+        # Foto O(1) del estado agregado tras el último step
+        return {
+            "liquidez": self.liquidez_banco,
+            "depositos": self.depositos_totales,
+            "huidas": self.fuga_total * self.representacion_por_nodo,
+            "informadas": self.nodos_informados * self.representacion_por_nodo,
+            "intensidad_rumor": self.suma_rumor / self.n_no_clientes if self.n_no_clientes else 0,
+        }
+
+    def resumen_agentes(self):
+        # Estado final de los clientes en arrays compactos (tipo y sexo como códigos de parametros.py)
+        clientes = [a for a in self.schedule.agents if a.tipo != "No-Cliente"]
+        return {
+            "edad": np.array([a.edad for a in clientes], dtype=np.int16),
+            "tipo": np.array([p.TIPOS_NODO.index(a.tipo) for a in clientes], dtype=np.uint8),
+            "sexo": np.array([p.DISTRIBUCION_SEXO.index(a.sexo) for a in clientes], dtype=np.uint8),
+            "protegido_fgd": np.array([a.protegido_fgd for a in clientes], dtype=bool),
+            "fuga": np.array([a.porcentaje_retirado for a in clientes], dtype=float),
+        }
+
+    def estado_nodos(self):
+        # Estado de todos los nodos en orden de unique_id (el de las posiciones de la red),
+        # para que app.py dibuje con arrays en vez de recorrer los agentes
+        agentes = self.schedule.agents
+        return {
+            "tipo": np.array([p.TIPOS_NODO.index(a.tipo) for a in agentes], dtype=np.uint8),
+            "alcance": np.array([a.alcance_noticia for a in agentes], dtype=bool),
+            "fuga": np.array([a.porcentaje_retirado for a in agentes], dtype=float),
+            "saldo": np.array([a.saldo for a in agentes], dtype=float),
+        }
\ No newline at end of file
@@ -0,0 +1,182 @@
+import numpy as np
+import parametros as p
+from .model_vectorizado import BancoModelVectorizado, sigmoide
+
+
+def vecinos_de(indptr, indices, nodos):
+    # Vecinos (con repeticiones) de una lista de nodos, leídos del CSR sin bucles de Python
+    inicio = indptr[nodos]
+    grados = indptr[nodos + 1] - inicio
+    desplazamiento = np.repeat(inicio - (np.cumsum(grados) - grados), grados)
+    return indices[np.arange(int(grados.sum())) + desplazamiento]
+
+
+class BancoModelEventos(BancoModelVectorizado):
+    # Motor por eventos: mismo estado y misma regla que BancoModelVectorizado, pero cada turno
+    # solo se recalcula a los agentes cuyo resultado puede cambiar. Con difusión lenta casi toda
+    # la red sigue sin enterarse durante cientos de turnos y el coste del turno pasa de O(n) a
+    # O(agentes activos).
+    # - Llegada de la noticia: con probabilidad q = difusion × digitalizacion por turno, el turno
+    #   en que un nodo se entera es geométrico. Se sortea una vez por nodo y se guardan los
+    #   nodos ordenados por turno de llegada; cada turno solo se leen los que llegan en él.
+    # - Despiertos: los que se acaban de enterar, los vecinos de quien cambió su
+    #   porcentaje_retirado el turno anterior, los que pidieron retirar y, si la caja se movió,
+    #   todos los clientes informados (su miedo_banco depende de la caja). El resto daría el
+    #   mismo resultado que en su última evaluación.
+    # Con los mismos turnos de llegada los resultados son idénticos, bit a bit, a los del motor
+    # vectorizado (intensidad_rumor salvo redondeo: no se suman los restos de float32 de los
+    # nodos que no cambian). Con la misma semilla las llegadas no son las mismas, solo su ley.
+    def __init__(self, n, total_depositos, encaje, news_score, news_validez, news_difusion, p_no_clientes=0.2, seed=None, topologia=None,
+                 poblacion_objetivo=3000000, perfilador=None, sorteo_difusion=None, semilla_difusion=None):
+        super().__init__(n, total_depositos, encaje, news_score, news_validez, news_difusion, p_no_clientes, seed, topologia,
+                         poblacion_objetivo, perfilador, sorteo_difusion, semilla_difusion)
+        # Los turnos de llegada salen del generador de la difusión (sorteos comunes o
+        # antitéticos entre réplicas) o de uno propio; self.rng queda para la ventanilla
+        self.rng_llegadas = self.rng_difusion or np.random.default_rng(self.rng.integers(2**63))
+
+        self.cliente = self.es_cliente  # El tipo de los nodos no cambia durante la corrida
+        self.informado = self.alcance_noticia.copy()
+        # Clientes informados en orden de llegada (buffer que solo crece: O(llegadas) por turno)
+        self.clientes_informados = np.empty(int(np.count_nonzero(self.cliente)), dtype=np.int64)
+        iniciales = np.flatnonzero(self.informado & self.cliente)
+        self.clientes_informados[:len(iniciales)] = iniciales
+        self.n_clientes_informados = len(iniciales)
+
+        # Agenda de eventos pendientes para el turno siguiente
+        self.cambiados = np.empty(0, dtype=np.int64)
+        self.pendientes = np.empty(0, dtype=np.int64)
+        self.liquidez_evaluada = self.liquidez_banco
+        self.noticia_evaluada = (self.noticia_score, self.noticia_validez)
+        self.programar_llegadas()
+
+    def programar_llegadas(self):
+        # Turno de llegada de la noticia a cada nodo aún sin informar, a partir del turno actual
+        # (la geométrica no tiene memoria: se puede volver a sortear si cambia la difusión)
+        sin_informar = np.flatnonzero(~self.informado)
+        q = (self.noticia_difusion * self.digitalizacion[sin_informar]).astype(np.float64)
+        u = self.rng_llegadas.random(len(sin_informar))
+        if self.sorteo_difusion != "antitetico":
+            u = 1 - u  # En (0, 1]: log(u) siempre finito
+        with np.errstate(divide="ignore", invalid="ignore"):
+            # P(llegada > t) = (1-q)^t  =>  llegada = ceil(log(u) / log(1-q))
+            espera = np.ceil(np.log(u) / np.log1p(-np.minimum(q, 1)))
+        espera = np.where(q >= 1, 1, np.where(q > 0, np.maximum(espera, 1), np.inf))
+
+        orden = np.argsort(espera, kind="stable")
+        self.orden_llegada = sin_informar[orden]
+        self.turno_llegada = self.turno + espera[orden]
+        self.cursor_llegada = 0
+        self.difusion_programada = self.noticia_difusion
+
+    def step(self):
+        perf = self.perfilador
+        if perf is not None:
+            t_turno = t = perf.reloj()
+        turno = self.turno + 1
+
+        # 0. CAMBIOS DESDE FUERA (instantanea.aplicar_cambios, app): se reprograma o se despierta a todos
+        if self.noticia_difusion != self.difusion_programada:
+            self.programar_llegadas()
+        despertar_todos = (self.noticia_score, self.noticia_validez) != self.noticia_evaluada
+        self.noticia_evaluada = (self.noticia_score, self.noticia_validez)
+
+        # 1. DIFUSIÓN: los nodos cuyo turno de llegada es este
+        fin = int(np.searchsorted(self.turno_llegada, turno, side="right"))
+        nuevos = np.sort(self.orden_llegada[self.cursor_llegada:fin])
+        self.cursor_llegada = fin
+        if len(nuevos):
+            self.informado[nuevos] = True
+            np.bitwise_or.at(self.poblacion.alcance_noticia.bits, nuevos >> 3, (1 << (nuevos & 7)).astype(np.uint8))
+            self.nodos_informados += len(nuevos)
+            nuevos_clientes = nuevos[self.cliente[nuevos]]
+            k = self.n_clientes_informados
+            self.clientes_informados[k:k + len(nuevos_clientes)] = nuevos_clientes
+            self.n_clientes_informados += len(nuevos_clientes)
+        if perf is not None:
+            t = perf.marcar("difusion", t)
+
+        # 2. DESPIERTOS Y CONTAGIO SOCIAL: media del pánico de los vecinos solo para ellos,
+        # con el estado del inicio del turno (misma fila de W que en el motor vectorizado)
+        n = len(self.informado)
+        caja_movida = self.liquidez_banco != self.liquidez_evaluada
+        grado_cambiados = int((self.indptr[self.cambiados + 1] - self.indptr[self.cambiados]).sum())
+        candidatos = len(nuevos) + grado_cambiados + len(self.pendientes) + (self.n_clientes_informados if caja_movida else 0)
+        if despertar_todos or candidatos * 4 >= n:
+            # Demasiados eventos: ordenarlos cuesta más que evaluar a todos los informados,
+            # que es lo que hace el motor vectorizado
+            despiertos = np.flatnonzero(self.informado)
+        else:
+            partes = [nuevos, vecinos_de(self.indptr, self.indices, self.cambiados), self.pendientes]
+            if caja_movida:
+                partes.append(self.clientes_informados[:self.n_clientes_informados])
+            despiertos = np.sort(np.concatenate(partes))
+            despiertos = despiertos[self.informado[despiertos] & np.r_[True, despiertos[1:] != despiertos[:-1]]]
+        self.liquidez_evaluada = self.liquidez_banco
+
+        if not len(despiertos):
+            # Turno sin eventos: nada cambia salvo el reloj
+            self.cambiados = self.pendientes = despiertos
+            self.turno += 1
+            self.comprobar_punto_fijo()
+            if perf is not None:
+                perf.marcar("turno", t_turno)
+            return
+
+        if len(despiertos) * 4 < n:
+            fuga_vecinos = self.W[despiertos] @ self.porcentaje_retirado
+        else:  # Con media red despierta sale más barato el producto completo
+            fuga_vecinos = (self.W @ self.porcentaje_retirado)[despiertos]
+        impacto_noticia = self.noticia_score * self.noticia_validez
+        es_cliente = self.cliente[despiertos]
+        if perf is not None:
+            t = perf.marcar("vecinos", t)
+
+        # 3. NO-CLIENTES DESPIERTOS: nivel de escándalo
+        opinion = despiertos[~es_cliente]
+        score_opinion = np.clip(impacto_noticia * p.PESO_NOTICIA + fuga_vecinos[~es_cliente] * p.PESO_SOCIAL, 0, 1)
+        escandalo = sigmoide(score_opinion, p.K_RUIDO_NO_CLIENTE, p.x0_NO_CLIENTE)
+        previo = self.porcentaje_retirado[opinion]
+        self.suma_rumor += (escandalo - previo).sum()
+        self.porcentaje_retirado[opinion] = escandalo
+        cambiados = [opinion[self.porcentaje_retirado[opinion] != previo]]
+        if perf is not None:
+            t = perf.marcar("opinion", t)
+
+        # 4. CLIENTES DESPIERTOS: meta de fuga y retirada contra la caja del banco
+        clientes = despiertos[es_cliente]
+        miedo_banco = 1.0 - (self.liquidez_banco / self.liquidez_inicial)
+        score_final = (
+            impacto_noticia * p.PESO_NOTICIA +
+            fuga_vecinos[es_cliente] * p.PESO_SOCIAL +
+            miedo_banco * p.PESO_LIQUIDEZ
+        ) * self.factor_cliente[clientes]
+        score_final = np.clip(score_final, 0, 1)
+        meta_fuga = sigmoide(score_final, p.K_RUIDO_CLIENTE, p.x0_CLIENTE)
+
+        quieren = meta_fuga > self.porcentaje_retirado[clientes]
+        agentes = clientes[quieren]
+        if perf is not None:
+            t = perf.marcar("cliente", t)
+        previo = self.porcentaje_retirado[agentes]
+        self.ejecutar_retiradas(agentes, meta_fuga[quieren])
+        cambiados.append(agentes[self.porcentaje_retirado[agentes] != previo])
+        if perf is not None:
+            t = perf.marcar("retirada", t)
+
+        # Seguridad financiera: la liquidez no puede ser negativa
+        if self.liquidez_banco < 0:
+            self.liquidez_banco = 0
+        self.cambiados = np.concatenate(cambiados)
+        self.pendientes = agentes  # Pueden seguir queriendo (caja agotada o restos de redondeo)
+        self.turno += 1
+        self.comprobar_punto_fijo()
+        if perf is not None:
+            perf.marcar("reconciliacion", t)
+            perf.marcar("turno", t_turno)
+
+    def comprobar_punto_fijo(self):
+        # Sin eventos pendientes ni llegadas por delante el estado ya no cambia
+        # (el runner completa la serie sin seguir simulando)
+        sin_llegadas = self.cursor_llegada == len(self.turno_llegada) or np.isinf(self.turno_llegada[self.cursor_llegada])
+        self.running = not (sin_llegadas and not len(self.cambiados) and not len(self.pendientes)
+                            and self.liquidez_banco == self.liquidez_evaluada)
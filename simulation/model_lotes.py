@@ -0,0 +1,237 @@
+import copy
+
+import numpy as np
+import parametros as p
+from .model_vectorizado import factores_cliente, sigmoide
+from .poblacion import generar_poblacion
+from .red import matriz_contagio, obtener_topologia
+
+# Parámetros que pueden cambiar de un escenario a otro del lote; el resto (red, población,
+# depósitos) es común
+PARAMETROS_ESCENARIO = ("news_score", "news_validez", "news_difusion", "encaje")
+
+
+class BancoModelLotes:
+    # B escenarios sobre la misma red y la misma población, avanzados a la vez. Red, población
+    # y matriz de contagio se construyen una sola vez; el estado dinámico lleva delante un eje
+    # de escenario: porcentaje_retirado, alcance_noticia y saldo son (B, n) y la caja y los
+    # contadores de cada escenario son arrays (B,).
+    # Cada escenario tiene su propio generador, copia del que generó la población, así el
+    # escenario b reproduce exactamente un BancoModelVectorizado con la misma semilla y sus
+    # parámetros.
+    def __init__(self, n, total_depositos, escenarios, encaje=None, news_score=None, news_validez=None, news_difusion=None,
+                 p_no_clientes=0.2, seed=None, topologia=None, poblacion_objetivo=3000000, perfilador=None,
+                 sorteo_difusion=None, semilla_difusion=None):
+        rng = np.random.default_rng(seed)
+        self.turno = 0
+
+        # --- PARÁMETROS DE CADA ESCENARIO ---
+        # Lo que un escenario no fija toma el valor común pasado como argumento
+        comunes = dict(encaje=encaje, news_score=news_score, news_validez=news_validez, news_difusion=news_difusion)
+        valores = {clave: [] for clave in PARAMETROS_ESCENARIO}
+        for escenario in escenarios:
+            desconocidos = set(escenario) - set(PARAMETROS_ESCENARIO)
+            if desconocidos:
+                raise ValueError(f"Parámetros que no pueden variar dentro de un lote: {sorted(desconocidos)}")
+            for clave in PARAMETROS_ESCENARIO:
+                valor = escenario.get(clave, comunes[clave])
+                if valor is None:
+                    raise ValueError(f"Falta {clave} en un escenario y no hay valor común")
+                valores[clave].append(valor)
+        self.coeficiente_reserva = np.array(valores["encaje"], dtype=float)
+        self.noticia_score = np.array(valores["news_score"], dtype=float)
+        self.noticia_validez = np.array(valores["news_validez"], dtype=float)
+        self.noticia_difusion = np.array(valores["news_difusion"], dtype=float)
+
+        # --- LÓGICA FINANCIERA: UNA CAJA POR ESCENARIO ---
+        self.liquidez_banco = total_depositos * self.coeficiente_reserva
+        self.liquidez_inicial = self.liquidez_banco.copy()
+        self.prestamos_activos = total_depositos - self.liquidez_banco
+
+        self.perfilador = perfilador
+
+        # --- RED SOCIAL Y POBLACIÓN COMPARTIDAS (mismos sorteos que BancoModelVectorizado) ---
+        if topologia is None:
+            topologia = obtener_topologia(n, seed=seed)
+        self.topologia = topologia
+        self.indptr, self.indices = topologia.indptr, topologia.indices
+        self.W = matriz_contagio(self.indptr, self.indices)
+
+        self.poblacion_objetivo = poblacion_objetivo
+        self.representacion_por_nodo = self.poblacion_objetivo / n
+        pob = self.poblacion = generar_poblacion(n, total_depositos, p_no_clientes, rng, self.representacion_por_nodo)
+        self.tipo, self.sexo, self.edad = pob.tipo, pob.sexo, pob.edad
+        self.saldo_inicial = pob.saldo_inicial
+        self.digitalizacion = pob.digitalizacion
+        self.es_cliente = pob.es_cliente
+        self.protegido_fgd = pob.protegido_fgd.como_bool()
+        self.factor_cliente = factores_cliente(pob)
+        # Probabilidad de enterarse de cada nodo en cada escenario (float32, como en BancoModelVectorizado)
+        self.umbral_difusion = self.noticia_difusion.astype(np.float32)[:, None] * self.digitalizacion
+
+        # --- ESTADO DINÁMICO (B, n) ---
+        b = len(escenarios)
+        self.saldo = np.tile(pob.saldo, (b, 1))
+        self.porcentaje_retirado = np.tile(pob.porcentaje_retirado, (b, 1))
+        self.alcance_noticia = np.tile(pob.alcance_noticia.como_bool(), (b, 1))
+
+        # --- CONTADORES INCREMENTALES POR ESCENARIO ---
+        self.depositos_totales = np.full(b, float(self.saldo_inicial[self.es_cliente].sum(dtype=np.float64)))
+        self.fuga_total = np.zeros(b)
+        self.nodos_informados = np.zeros(b, dtype=np.int64)
+        self.suma_rumor = np.zeros(b)
+        self.n_no_clientes = int(np.count_nonzero(~self.es_cliente))
+
+        # Un único generador de difusión: con la misma semilla todos los escenarios sacarían los mismos sorteos
+        self.sorteo_difusion = sorteo_difusion
+        self.rng_difusion = None
+        if sorteo_difusion is not None:
+            if sorteo_difusion not in p.SORTEOS_DIFUSION:
+                raise ValueError(f"sorteo_difusion desconocido: {sorteo_difusion}")
+            self.rng_difusion = np.random.default_rng(rng.integers(2**63) if semilla_difusion is None else semilla_difusion)
+        self.rngs = [copy.deepcopy(rng) for _ in range(b)]
+
+    @property
+    def n_escenarios(self):
+        return len(self.rngs)
+
+    @property
+    def G(self):
+        # Grafo de networkx bajo demanda (dibujo clásico, análisis); la simulación usa el CSR
+        return self.topologia.G
+
+    def step(self):
+        perf = self.perfilador
+        if perf is not None:
+            t_turno = t = perf.reloj()
+        n = len(self.saldo_inicial)
+
+        # 1. DIFUSIÓN: un sorteo por nodo y escenario
+        if self.rng_difusion is None:
+            sorteo = np.empty((self.n_escenarios, n))
+            for rng, fila in zip(self.rngs, sorteo):
+                rng.random(out=fila)
+        else:
+            sorteo = self.rng_difusion.random(n)
+            if self.sorteo_difusion == "antitetico":
+                sorteo = 1 - sorteo
+        nuevos = ~self.alcance_noticia & (sorteo < self.umbral_difusion)
+        self.alcance_noticia |= nuevos
+        self.nodos_informados += np.count_nonzero(nuevos, axis=1)
+        if perf is not None:
+            t = perf.marcar("difusion", t)
+
+        # 2. CONTAGIO SOCIAL: una media de vecinos por escenario con la matriz compartida (un
+        # producto matriz-vector por fila: scipy no lo hace más rápido como matriz-matriz).
+        # Los términos del score se calculan densos sobre (B, n) con los escalares de cada
+        # escenario en columna, y se extraen los nodos informados con índices planos b*n + i
+        fuga_vecinos = np.empty(self.porcentaje_retirado.shape)
+        for retirado_b, fila in zip(self.porcentaje_retirado, fuga_vecinos):
+            fila[:] = self.W @ retirado_b
+        social = fuga_vecinos * p.PESO_SOCIAL
+        noticia = (self.noticia_score * self.noticia_validez * p.PESO_NOTICIA)[:, None]
+        retirado = self.porcentaje_retirado.reshape(-1)
+        if perf is not None:
+            t = perf.marcar("vecinos", t)
+
+        # 3. NO-CLIENTES: nodos informados de todos los escenarios, ordenados escenario a escenario
+        opinion = np.flatnonzero(self.alcance_noticia & ~self.es_cliente)
+        score_opinion = np.clip((noticia + social).ravel()[opinion], 0, 1)
+        escandalo = sigmoide(score_opinion, p.K_RUIDO_NO_CLIENTE, p.x0_NO_CLIENTE)
+        cambio = escandalo - retirado[opinion]
+        for b, (ini, fin) in enumerate(self.tramos(opinion, n)):
+            self.suma_rumor[b] += cambio[ini:fin].sum()
+        retirado[opinion] = escandalo
+        if perf is not None:
+            t = perf.marcar("opinion", t)
+
+        # 4. CLIENTES: meta de fuga y retirada contra la caja de cada escenario
+        clientes = np.flatnonzero(self.alcance_noticia & self.es_cliente)
+        miedo_banco = 1.0 - (self.liquidez_banco / self.liquidez_inicial)
+        score_final = ((noticia + social + (miedo_banco * p.PESO_LIQUIDEZ)[:, None]) * self.factor_cliente).ravel()[clientes]
+        score_final = np.clip(score_final, 0, 1)
+        meta_fuga = sigmoide(score_final, p.K_RUIDO_CLIENTE, p.x0_CLIENTE)
+
+        quieren = meta_fuga > retirado[clientes]
+        if perf is not None:
+            t = perf.marcar("cliente", t)
+        # La cola de la ventanilla es secuencial dentro de cada escenario
+        for b, (ini, fin) in enumerate(self.tramos(clientes, n)):
+            q = quieren[ini:fin]
+            self.ejecutar_retiradas(b, clientes[ini:fin][q] - b * n, meta_fuga[ini:fin][q])
+        if perf is not None:
+            t = perf.marcar("retirada", t)
+
+        # Seguridad financiera: la liquidez no puede ser negativa
+        self.liquidez_banco[self.liquidez_banco < 0] = 0
+        self.turno += 1
+        if perf is not None:
+            perf.marcar("reconciliacion", t)
+            perf.marcar("turno", t_turno)
+
+    def tramos(self, planos, n):
+        # (inicio, fin) de cada escenario en un array ordenado de índices planos b*n + i
+        limites = np.searchsorted(planos, np.arange(self.n_escenarios + 1) * n)
+        return zip(limites[:-1], limites[1:])
+
+    def ejecutar_retiradas(self, b, agentes, meta_fuga):
+        # Misma ventanilla que BancoModelVectorizado.ejecutar_retiradas, sobre la fila del escenario b
+        if self.liquidez_banco[b] <= 0 or len(agentes) == 0:
+            return
+
+        orden = self.rngs[b].permutation(len(agentes))
+        agentes = agentes[orden]
+        porcentaje_retirado, saldo = self.porcentaje_retirado[b], self.saldo[b]
+        monto_a_retirar = (meta_fuga[orden] - porcentaje_retirado[agentes]) * self.saldo_inicial[agentes]
+
+        pedido_previo = np.cumsum(monto_a_retirar) - monto_a_retirar
+        caja_disponible = np.maximum(self.liquidez_banco[b] - pedido_previo, 0)
+        monto_real = np.minimum(monto_a_retirar, caja_disponible)
+
+        total_pagado = float(monto_real.sum())
+        self.liquidez_banco[b] -= total_pagado
+        self.depositos_totales[b] -= total_pagado
+
+        saldo[agentes] -= monto_real
+        retirado = monto_real / self.saldo_inicial[agentes]
+        porcentaje_retirado[agentes] += retirado
+        self.fuga_total[b] += float(retirado.sum())
+
+    def conservar(self, filas):
+        # Deja en el lote solo los escenarios indicados (p. ej. los que no han quebrado)
+        filas = np.asarray(filas)
+        for nombre in ("coeficiente_reserva", "noticia_score", "noticia_validez", "noticia_difusion",
+                       "liquidez_banco", "liquidez_inicial", "prestamos_activos", "depositos_totales",
+                       "fuga_total", "nodos_informados", "suma_rumor", "saldo", "porcentaje_retirado", "alcance_noticia",
+                       "umbral_difusion"):
+            setattr(self, nombre, getattr(self, nombre)[filas])
+        self.rngs = [self.rngs[i] for i in np.arange(self.n_escenarios)[filas]]
+
+    def resumen_turno(self):
+        # Igual que BancoModelVectorizado.resumen_turno, con un valor por escenario
+        return {
+            "liquidez": self.liquidez_banco.copy(),
+            "depositos": self.depositos_totales.copy(),
+            "huidas": self.fuga_total * self.representacion_por_nodo,
+            "informadas": self.nodos_informados * self.representacion_por_nodo,
+            "intensidad_rumor": self.suma_rumor / self.n_no_clientes if self.n_no_clientes else np.zeros(self.n_escenarios),
+        }
+
+    def resumen_agentes(self, b):
+        # Estado de los clientes del escenario b en el formato de BancoModel.resumen_agentes
+        c = self.es_cliente
+        return {
+            "edad": self.edad[c].astype(np.int16),
+            "tipo": self.tipo[c],
+            "sexo": self.sexo[c],
+            "protegido_fgd": self.protegido_fgd[c],
+            "fuga": self.porcentaje_retirado[b, c].astype(float),
+        }
+
+    def estado_nodos(self, b):
+        return {
+            "tipo": self.tipo,
+            "alcance": self.alcance_noticia[b].copy(),
+            "fuga": self.porcentaje_retirado[b].astype(float),
+            "saldo": self.saldo[b].astype(float),
+        }
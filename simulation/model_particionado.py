@@ -0,0 +1,297 @@
+# simulation/model_particionado.py
+import multiprocessing as mp
+import os
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+import parametros as p
+from scipy import sparse
+
+from .model_vectorizado import BancoModelVectorizado, sigmoide
+
+# --- UNA SOLA RED GRANDE REPARTIDA ENTRE PROCESOS ---
+# Con millones de nodos (un nodo por persona) una sola corrida no se acelera lanzando
+# réplicas en paralelo. Aquí la red se parte en P trozos (red.particionar) y cada trozo lo
+# avanza su propio proceso sobre arrays en memoria compartida:
+#   - cada proceso solo escribe el estado de sus nodos y solo lee, de los demás, el
+#     porcentaje_retirado de los nodos frontera con los que tiene aristas (fuga_frontera),
+#     que se publica al final de cada turno;
+#   - el coordinador (este proceso) guarda el generador aleatorio y la caja del banco: sortea
+#     la difusión para todos los nodos y liquida las retiradas de todos los trozos en una sola
+#     cola barajada, así la regla "primero en llegar, primero en cobrar" de
+#     ejecutar_retirada_progresiva se cumple entre trozos y no depende del reparto.
+# Con la misma semilla y topología los resultados son idénticos, bit a bit, a los de
+# BancoModelVectorizado, se use el número de procesos que se use.
+
+# Bits de 'marca': el nodo actualizó su opinión / quiere retirar en este turno
+OPINION = 1
+RETIRA = 2
+# Arrays compartidos por nodo (índice global) y su dtype
+ARRAYS_COMPARTIDOS = {
+    "porcentaje_retirado": np.float32,  # Estado de cada nodo (lo escribe su trozo)
+    "saldo": np.float32,
+    "alcance": bool,
+    "fuga_frontera": np.float32,        # porcentaje_retirado de los nodos frontera al inicio del turno
+    "sorteo": np.float64,               # Sorteo de difusión del turno (lo escribe el coordinador)
+    "marca": np.uint8,
+    "demanda": np.float64,              # Importe que quiere retirar cada cliente
+    "pagado": np.float64,               # Importe que le paga la caja en la liquidación
+    "delta_rumor": np.float64,          # Cambio de opinión de cada no-cliente actualizado
+}
+
+
+def abrir_compartidos(descripcion):
+    # En el proceso hijo: arrays sobre los bloques ya creados por el coordinador (que es quien
+    # los libera; con "spawn" los hijos comparten su resource_tracker)
+    bloques, arrays = [], {}
+    for clave, (nombre, dtype, forma) in descripcion.items():
+        bloque = shared_memory.SharedMemory(name=nombre)
+        bloques.append(bloque)
+        arrays[clave] = np.ndarray(forma, dtype=dtype, buffer=bloque.buf)
+    return bloques, arrays
+
+
+def liberar(procesos, conexiones, bloques):
+    # Cierre de los procesos y de la memoria compartida (también si el modelo se descarta sin cerrar())
+    for conexion in conexiones:
+        try:
+            conexion.send(("fin",))
+        except (BrokenPipeError, OSError):
+            pass
+    for proceso in procesos:
+        proceso.join(timeout=5)
+        if proceso.is_alive():
+            proceso.terminate()
+    for bloque in bloques:
+        try:
+            bloque.close()
+        except BufferError:  # Queda algún array apuntando al bloque: se libera al salir del proceso
+            pass
+        try:
+            bloque.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class Particion:
+    # Lo que necesita un trozo para avanzar: sus nodos, los vecinos de otros trozos (halo), las
+    # filas de la matriz de contagio con columnas locales (propios y después halo) y los atributos fijos
+    def __init__(self, model, parte, q):
+        propios = np.flatnonzero(parte == q)
+        filas = model.W[propios]
+        fuera = parte[filas.indices] != q
+        self.propios = propios
+        self.halo = np.unique(filas.indices[fuera])
+        local = np.full(len(parte), -1, dtype=np.int64)
+        local[propios] = np.arange(len(propios))
+        local[self.halo] = len(propios) + np.arange(len(self.halo))
+        self.W = sparse.csr_matrix((filas.data, local[filas.indices].astype(np.int32), filas.indptr),
+                                   shape=(len(propios), len(propios) + len(self.halo)))
+        # Nodos propios con algún vecino en otro trozo: son los que se publican cada turno
+        origen = np.repeat(np.arange(len(propios)), np.diff(filas.indptr))
+        self.frontera = np.unique(origen[fuera])
+        self.digitalizacion = model.digitalizacion[propios]
+        self.factor_cliente = model.factor_cliente[propios]
+        self.es_cliente = model.es_cliente[propios]
+        self.saldo_inicial = model.saldo_inicial[propios]
+
+
+def trabajar_particion(conexion, descripcion, particion):
+    # Bucle de un proceso hijo: "turno" (difusión, contagio, opinión y demanda de los clientes)
+    # y "liquidar" (aplicar lo que pagó la caja y publicar la frontera), hasta "fin"
+    bloques, a = abrir_compartidos(descripcion)
+    propios, halo, frontera = particion.propios, particion.halo, particion.frontera
+    es_cliente = particion.es_cliente
+    pendientes = np.empty(0, dtype=np.int64)
+    fuga = a["porcentaje_retirado"][propios]
+    try:
+        while True:
+            orden = conexion.recv()
+            try:
+                if orden[0] == "turno":
+                    _, difusion, score, validez, liquidez_banco, liquidez_inicial = orden
+                    a["marca"][propios] = 0
+
+                    # 1. DIFUSIÓN con el sorteo del coordinador
+                    alcance = a["alcance"][propios]
+                    nuevos = ~alcance & (a["sorteo"][propios] < (difusion * particion.digitalizacion))
+                    alcance |= nuevos
+                    a["alcance"][propios] = alcance
+
+                    # 2. CONTAGIO: propios y halo con el valor del inicio del turno
+                    fuga_vecinos = particion.W @ np.concatenate([fuga, a["fuga_frontera"][halo]])
+                    impacto_noticia = score * validez
+
+                    # 3. NO-CLIENTES
+                    opinion = np.flatnonzero(alcance & ~es_cliente)
+                    score_opinion = np.clip(impacto_noticia * p.PESO_NOTICIA + fuga_vecinos[opinion] * p.PESO_SOCIAL, 0, 1)
+                    escandalo = sigmoide(score_opinion, p.K_RUIDO_NO_CLIENTE, p.x0_NO_CLIENTE)
+                    a["delta_rumor"][propios[opinion]] = escandalo - fuga[opinion]
+                    a["marca"][propios[opinion]] |= OPINION
+                    fuga[opinion] = escandalo
+
+                    # 4. CLIENTES: solo la demanda; el pago lo decide el coordinador
+                    clientes = np.flatnonzero(alcance & es_cliente)
+                    miedo_banco = 1.0 - (liquidez_banco / liquidez_inicial)
+                    score_final = (
+                        impacto_noticia * p.PESO_NOTICIA +
+                        fuga_vecinos[clientes] * p.PESO_SOCIAL +
+                        miedo_banco * p.PESO_LIQUIDEZ
+                    ) * particion.factor_cliente[clientes]
+                    meta_fuga = sigmoide(np.clip(score_final, 0, 1), p.K_RUIDO_CLIENTE, p.x0_CLIENTE)
+                    quieren = meta_fuga > fuga[clientes]
+                    pendientes = clientes[quieren]
+                    a["demanda"][propios[pendientes]] = (meta_fuga[quieren] - fuga[pendientes]) * particion.saldo_inicial[pendientes]
+                    a["marca"][propios[pendientes]] |= RETIRA
+                    conexion.send(int(np.count_nonzero(nuevos)))
+
+                elif orden[0] == "liquidar":
+                    if orden[1] and len(pendientes):
+                        globales = propios[pendientes]
+                        monto_real = a["pagado"][globales]
+                        a["saldo"][globales] -= monto_real
+                        fuga[pendientes] += monto_real / particion.saldo_inicial[pendientes]
+                    a["porcentaje_retirado"][propios] = fuga
+                    a["fuga_frontera"][propios[frontera]] = fuga[frontera]
+                    conexion.send(True)
+
+                elif orden[0] == "fin":
+                    break
+            except Exception as error:  # Se relanza en el coordinador
+                conexion.send(error)
+    except EOFError:  # El coordinador ha desaparecido
+        pass
+    finally:
+        del a, fuga
+        for bloque in bloques:
+            bloque.close()
+
+
+class BancoModelParticionado(BancoModelVectorizado):
+    # Mismo modelo e interfaz que BancoModelVectorizado; 'particiones' procesos (por defecto
+    # uno por CPU) avanzan cada uno un trozo de la red. cerrar() (o salir del 'with') termina
+    # los procesos; el estado final sigue disponible en el modelo.
+    def __init__(self, n, total_depositos, encaje, news_score, news_validez, news_difusion, p_no_clientes=0.2, seed=None, topologia=None,
+                 poblacion_objetivo=3000000, perfilador=None, sorteo_difusion=None, semilla_difusion=None, particiones=None):
+        super().__init__(n, total_depositos, encaje, news_score, news_validez, news_difusion, p_no_clientes, seed, topologia,
+                         poblacion_objetivo, perfilador, sorteo_difusion, semilla_difusion)
+        self.particiones = particiones or os.cpu_count() or 1
+        pob = self.poblacion
+
+        # --- MEMORIA COMPARTIDA ---
+        self.bloques, self.compartidos = [], {}
+        for clave, dtype in ARRAYS_COMPARTIDOS.items():
+            bloque = shared_memory.SharedMemory(create=True, size=max(n * np.dtype(dtype).itemsize, 1))
+            self.bloques.append(bloque)
+            self.compartidos[clave] = np.ndarray(n, dtype=dtype, buffer=bloque.buf)
+        c = self.compartidos
+        c["porcentaje_retirado"][:] = pob.porcentaje_retirado
+        c["fuga_frontera"][:] = pob.porcentaje_retirado
+        c["saldo"][:] = pob.saldo
+        c["alcance"][:] = pob.alcance_noticia.como_bool()
+        # El estado vivo pasa a ser el compartido (mismos alias que en el motor vectorizado)
+        self.porcentaje_retirado = pob.porcentaje_retirado = c["porcentaje_retirado"]
+        self.saldo = pob.saldo = c["saldo"]
+        descripcion = {clave: (b.name, np.dtype(ARRAYS_COMPARTIDOS[clave]).str, (n,))
+                       for clave, b in zip(ARRAYS_COMPARTIDOS, self.bloques)}
+
+        # --- PARTICIÓN Y PROCESOS ---
+        self.parte = self.topologia.particion(self.particiones)
+        contexto = mp.get_context("spawn")
+        self.procesos, self.conexiones = [], []
+        for q in range(self.particiones):
+            padre, hijo = contexto.Pipe()
+            proceso = contexto.Process(target=trabajar_particion, args=(hijo, descripcion, Particion(self, self.parte, q)),
+                                       daemon=True)
+            proceso.start()
+            hijo.close()
+            self.procesos.append(proceso)
+            self.conexiones.append(padre)
+        self.W = None  # Cada trozo tiene sus filas; el coordinador no la necesita
+        self.finalizador = weakref.finalize(self, liberar, self.procesos, self.conexiones, self.bloques)
+
+    @property
+    def alcance_noticia(self):
+        if not self.compartidos:  # Ya cerrado
+            return self.poblacion.alcance_noticia.como_bool()
+        return self.compartidos["alcance"].copy()
+
+    def enviar(self, orden):
+        for conexion in self.conexiones:
+            conexion.send(orden)
+        respuestas = [conexion.recv() for conexion in self.conexiones]
+        for respuesta in respuestas:
+            if isinstance(respuesta, Exception):
+                self.cerrar()
+                raise respuesta
+        return respuestas
+
+    def step(self):
+        perf = self.perfilador
+        if perf is not None:
+            t_turno = t = perf.reloj()
+        c = self.compartidos
+
+        # 1. DIFUSIÓN: el sorteo de todos los nodos sale del generador del coordinador
+        if self.rng_difusion is None:
+            self.rng.random(out=c["sorteo"])
+        else:
+            self.rng_difusion.random(out=c["sorteo"])
+            if self.sorteo_difusion == "antitetico":
+                np.subtract(1, c["sorteo"], out=c["sorteo"])
+        if perf is not None:
+            t = perf.marcar("difusion", t)
+
+        # 2-4. Contagio, opinión y demanda de los clientes, en paralelo en cada trozo
+        nuevos = self.enviar(("turno", self.noticia_difusion, self.noticia_score, self.noticia_validez,
+                              self.liquidez_banco, self.liquidez_inicial))
+        self.nodos_informados += sum(nuevos)
+        opinion = np.flatnonzero(c["marca"] & OPINION)
+        self.suma_rumor += c["delta_rumor"][opinion].sum()
+        if perf is not None:
+            t = perf.marcar("cliente", t)
+
+        # 5. LIQUIDACIÓN: una sola cola, en orden de nodo y barajada, como en ejecutar_retiradas
+        agentes = np.flatnonzero(c["marca"] & RETIRA)
+        pagar = self.liquidez_banco > 0 and len(agentes) > 0
+        if pagar:
+            agentes = agentes[self.rng.permutation(len(agentes))]
+            monto_a_retirar = c["demanda"][agentes]
+            pedido_previo = np.cumsum(monto_a_retirar) - monto_a_retirar
+            caja_disponible = np.maximum(self.liquidez_banco - pedido_previo, 0)
+            monto_real = np.minimum(monto_a_retirar, caja_disponible)
+
+            total_pagado = float(monto_real.sum())
+            self.liquidez_banco -= total_pagado
+            self.depositos_totales -= total_pagado
+            c["pagado"][agentes] = monto_real
+            self.fuga_total += float((monto_real / self.saldo_inicial[agentes]).sum())
+        if perf is not None:
+            t = perf.marcar("retirada", t)
+
+        # Cada trozo aplica los pagos y publica su frontera para el turno siguiente
+        self.enviar(("liquidar", pagar))
+        if self.liquidez_banco < 0:
+            self.liquidez_banco = 0
+        self.turno += 1
+        if perf is not None:
+            perf.marcar("reconciliacion", t)
+            perf.marcar("turno", t_turno)
+
+    def cerrar(self):
+        if not self.finalizador.alive:
+            return
+        # El estado final se copia fuera de la memoria compartida antes de liberarla
+        pob = self.poblacion
+        self.porcentaje_retirado = pob.porcentaje_retirado = self.porcentaje_retirado.copy()
+        self.saldo = pob.saldo = self.saldo.copy()
+        pob.alcance_noticia.asignar(self.compartidos["alcance"])
+        self.compartidos = {}
+        self.finalizador()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        self.cerrar()
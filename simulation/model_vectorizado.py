@@ -0,0 +1,234 @@
+import numpy as np
+import parametros as p
+from .poblacion import generar_poblacion
+from .red import matriz_contagio, obtener_topologia
+
+NO_CLIENTE = p.TIPOS_NODO.index("No-Cliente")
+
+
+def sigmoide(x, k, x0):
+    return 1 / (1 + np.exp(-k * (x - x0)))
+
+
+def factores_cliente(pob):
+    # Parte fija del score de cada cliente: aversión, protección FGD, sexo y fidelidad
+    factor_proteccion = np.where(pob.protegido_fgd.como_bool(), p.REDUCCION_PANICO_FGD, 1.2)
+    es_mujer = pob.sexo == p.DISTRIBUCION_SEXO.index("M")
+    factor_sexo = np.where(es_mujer, p.FACTOR_M, p.FACTOR_H)
+    return ((1 + pob.aversion) * factor_proteccion * factor_sexo * (1 - pob.fidelidad)).astype(np.float32)
+
+
+class BancoModelVectorizado:
+    # Motor alternativo a BancoModel: el estado de todos los agentes vive en arrays de NumPy
+    # y cada turno se resuelve con operaciones sobre la población completa.
+    # Actualización síncrona: todos leen el pánico de los vecinos y la caja del inicio del
+    # turno, mientras que en BancoModel cada agente ve lo que ya hicieron los anteriores. No es
+    # un sustituto exacto: las quiebras llegan algo más tarde (ver README).
+    def __init__(self, n, total_depositos, encaje, news_score, news_validez, news_difusion, p_no_clientes=0.2, seed=None, topologia=None,
+                 poblacion_objetivo=3000000, perfilador=None, sorteo_difusion=None, semilla_difusion=None):
+        self.rng = np.random.default_rng(seed)
+        self.running = True
+        self.turno = 0
+
+        # --- LÓGICA FINANCIERA: SOLVENCIA VS LIQUIDEZ ---
+        # Caja y contadores siempre en float64 de Python: con la población en float32, un escalar
+        # de NumPy float32 (aquí o al sumar lo pagado) degradaría todo el libro a float32
+        self.depositos_totales = float(total_depositos)
+        self.coeficiente_reserva = float(encaje)
+        self.liquidez_banco = self.depositos_totales * self.coeficiente_reserva
+        self.liquidez_inicial = self.liquidez_banco
+        self.prestamos_activos = self.depositos_totales - self.liquidez_banco
+
+        # --- PARÁMETROS DE LA CRISIS ---
+        self.noticia_score = news_score
+        self.noticia_validez = news_validez
+        self.noticia_difusion = news_difusion
+
+        # Perfilado por fases opcional (perfilado.Perfilador), mismas fases que BancoModel
+        self.perfilador = perfilador
+
+        # --- RED SOCIAL (SMALL WORLD) ---
+        # Misma red que la caché para esta semilla (sin sorteos de self.rng: la población no
+        # depende de si la topología llega ya construida)
+        if topologia is None:
+            topologia = obtener_topologia(n, seed=seed)
+        self.topologia = topologia
+        self.indptr, self.indices = topologia.indptr, topologia.indices
+        self.W = matriz_contagio(self.indptr, self.indices)
+
+        # Con n == poblacion_objetivo cada nodo es una persona (representacion_por_nodo = 1)
+        self.poblacion_objetivo = poblacion_objetivo
+        self.representacion_por_nodo = self.poblacion_objetivo / n
+
+        # --- CREACIÓN DE AGENTES (POBLACIÓN COMPACTA) ---
+        # El estado vive en una Poblacion (poblacion.py); los arrays de abajo son alias, no copias
+        pob = self.poblacion = generar_poblacion(n, total_depositos, p_no_clientes, self.rng, self.representacion_por_nodo)
+
+        self.tipo, self.sexo, self.edad = pob.tipo, pob.sexo, pob.edad
+        self.saldo_inicial, self.saldo = pob.saldo_inicial, pob.saldo
+        self.porcentaje_retirado = pob.porcentaje_retirado
+        self.digitalizacion, self.aversion, self.fidelidad = pob.digitalizacion, pob.aversion, pob.fidelidad
+
+        self.actualizar_factores_cliente()
+
+        # --- CONTADORES INCREMENTALES (mismos que BancoModel) ---
+        self.depositos_totales = float(self.saldo[self.es_cliente].sum(dtype=np.float64))
+        self.fuga_total = 0.0
+        self.nodos_informados = 0
+        self.suma_rumor = 0.0
+        self.n_no_clientes = int(np.count_nonzero(~self.es_cliente))
+
+        # Sorteos de difusión con generador propio (mismo significado que en BancoModel)
+        self.sorteo_difusion = sorteo_difusion
+        self.rng_difusion = None
+        if sorteo_difusion is not None:
+            if sorteo_difusion not in p.SORTEOS_DIFUSION:
+                raise ValueError(f"sorteo_difusion desconocido: {sorteo_difusion}")
+            self.rng_difusion = np.random.default_rng(self.rng.integers(2**63) if semilla_difusion is None else semilla_difusion)
+
+    def actualizar_factores_cliente(self):
+        # Factores fijos del score de cliente (no cambian durante la corrida; se recalculan
+        # solo si se sustituye la población, p. ej. al restaurar una instantánea)
+        self.factor_cliente = factores_cliente(self.poblacion)
+
+    # Vistas booleanas de los campos compactos (los bitsets se desempaquetan al leerlos)
+    @property
+    def es_cliente(self):
+        return self.poblacion.es_cliente
+
+    @property
+    def alcance_noticia(self):
+        return self.poblacion.alcance_noticia.como_bool()
+
+    @property
+    def protegido_fgd(self):
+        return self.poblacion.protegido_fgd.como_bool()
+
+    @property
+    def agentes(self):
+        # Vistas con la misma interfaz que ClienteCaixa (una por nodo, se crean al recorrerlas)
+        return self.poblacion
+
+    @property
+    def G(self):
+        # Grafo de networkx bajo demanda (dibujo clásico, análisis); la simulación usa el CSR
+        return self.topologia.G
+
+    def step(self):
+        perf = self.perfilador
+        if perf is not None:
+            t_turno = t = perf.reloj()
+        n = len(self.saldo)
+        es_cliente = self.es_cliente
+
+        # 1. DIFUSIÓN: un sorteo por nodo, solo cuenta para los que aún no conocen la noticia
+        if self.rng_difusion is None:
+            sorteo = self.rng.random(n)
+        else:
+            sorteo = self.rng_difusion.random(n)
+            if self.sorteo_difusion == "antitetico":
+                sorteo = 1 - sorteo
+        alcance = self.alcance_noticia
+        nuevos = ~alcance & (sorteo < (self.noticia_difusion * self.digitalizacion))
+        alcance |= nuevos
+        self.poblacion.alcance_noticia.asignar(alcance)
+        self.nodos_informados += int(np.count_nonzero(nuevos))
+        if perf is not None:
+            t = perf.marcar("difusion", t)
+
+        # 2. CONTAGIO SOCIAL: media del pánico de los vecinos para todos los nodos a la vez.
+        # Todos leen el estado del inicio del turno (actualización síncrona).
+        fuga_vecinos = self.W @ self.porcentaje_retirado
+        impacto_noticia = self.noticia_score * self.noticia_validez
+        if perf is not None:
+            t = perf.marcar("vecinos", t)
+
+        # 3. NO-CLIENTES: nivel de escándalo
+        opinion = np.flatnonzero(alcance & ~es_cliente)
+        score_opinion = np.clip(impacto_noticia * p.PESO_NOTICIA + fuga_vecinos[opinion] * p.PESO_SOCIAL, 0, 1)
+        escandalo = sigmoide(score_opinion, p.K_RUIDO_NO_CLIENTE, p.x0_NO_CLIENTE)
+        self.suma_rumor += (escandalo - self.porcentaje_retirado[opinion]).sum()
+        self.porcentaje_retirado[opinion] = escandalo
+        if perf is not None:
+            t = perf.marcar("opinion", t)
+
+        # 4. CLIENTES: meta de fuga y retirada contra la caja del banco
+        clientes = np.flatnonzero(alcance & es_cliente)
+        miedo_banco = 1.0 - (self.liquidez_banco / self.liquidez_inicial)
+        score_final = (
+            impacto_noticia * p.PESO_NOTICIA +
+            fuga_vecinos[clientes] * p.PESO_SOCIAL +
+            miedo_banco * p.PESO_LIQUIDEZ
+        ) * self.factor_cliente[clientes]
+        score_final = np.clip(score_final, 0, 1)
+        meta_fuga = sigmoide(score_final, p.K_RUIDO_CLIENTE, p.x0_CLIENTE)
+
+        quieren = meta_fuga > self.porcentaje_retirado[clientes]
+        if perf is not None:
+            t = perf.marcar("cliente", t)
+        self.ejecutar_retiradas(clientes[quieren], meta_fuga[quieren])
+        if perf is not None:
+            t = perf.marcar("retirada", t)
+
+        # Seguridad financiera: la liquidez no puede ser negativa
+        if self.liquidez_banco < 0:
+            self.liquidez_banco = 0
+        self.turno += 1
+        if perf is not None:
+            perf.marcar("reconciliacion", t)
+            perf.marcar("turno", t_turno)
+
+    def resumen_turno(self):
+        # Misma foto O(1) que BancoModel.resumen_turno
+        return {
+            "liquidez": self.liquidez_banco,
+            "depositos": self.depositos_totales,
+            "huidas": self.fuga_total * self.representacion_por_nodo,
+            "informadas": self.nodos_informados * self.representacion_por_nodo,
+            "intensidad_rumor": self.suma_rumor / self.n_no_clientes if self.n_no_clientes else 0,
+        }
+
+    def resumen_agentes(self):
+        # Estado final de los clientes en el mismo formato que BancoModel.resumen_agentes
+        c = self.es_cliente
+        return {
+            "edad": self.edad[c].astype(np.int16),
+            "tipo": self.tipo[c],
+            "sexo": self.sexo[c],
+            "protegido_fgd": self.protegido_fgd[c],
+            "fuga": self.porcentaje_retirado[c].astype(float),
+        }
+
+    def estado_nodos(self):
+        # Mismo formato que BancoModel.estado_nodos
+        return {
+            "tipo": self.tipo,
+            "alcance": self.alcance_noticia,
+            "fuga": self.porcentaje_retirado.astype(float),
+            "saldo": self.saldo.astype(float),
+        }
+
+    def ejecutar_retiradas(self, agentes, meta_fuga):
+        # Ventanilla por orden de llegada: se baraja la cola de clientes y la caja paga
+        # completo a cada uno hasta agotarse (equivale a ejecutar_retirada_progresiva
+        # agente a agente en el orden de RandomActivation)
+        if self.liquidez_banco <= 0 or len(agentes) == 0:
+            return
+
+        orden = self.rng.permutation(len(agentes))
+        agentes = agentes[orden]
+        monto_a_retirar = (meta_fuga[orden] - self.porcentaje_retirado[agentes]) * self.saldo_inicial[agentes]
+
+        pedido_previo = np.cumsum(monto_a_retirar) - monto_a_retirar
+        caja_disponible = np.maximum(self.liquidez_banco - pedido_previo, 0)
+        monto_real = np.minimum(monto_a_retirar, caja_disponible)
+
+        # float(): ver __init__, la caja no puede pasar a float32
+        total_pagado = float(monto_real.sum())
+        self.liquidez_banco -= total_pagado
+        self.depositos_totales -= total_pagado
+
+        self.saldo[agentes] -= monto_real
+        retirado = monto_real / self.saldo_inicial[agentes]
+        self.porcentaje_retirado[agentes] += retirado
+        self.fuga_total += float(retirado.sum())
@@ -0,0 +1,68 @@
+# simulation/perfilado.py
+import time
+from collections import defaultdict
+
+import pandas as pd
+
+# --- PERFILADO POR FASES ---
+# Instrumentación opcional del turno. Los modelos guardan un Perfilador en model.perfilador
+# (None por defecto) y solo miden cuando existe: sin perfilador el coste es una comprobación
+# 'is not None' por fase.
+
+# Fases del turno en el orden en que ocurren dentro de ClienteCaixa.step / BancoModel.step
+FASES = ("difusion", "vecinos", "opinion", "cliente", "retirada", "reconciliacion")
+# Tiempo total de los turnos (BancoModel.step completo); lo que no cae en ninguna fase
+# es planificador, bucle de Python y el propio coste de medir
+TURNO = "turno"
+
+
+class Perfilador:
+    def __init__(self):
+        self.tiempo = defaultdict(float)
+        self.llamadas = defaultdict(int)
+        self.reloj = time.perf_counter
+
+    def marcar(self, fase, t0):
+        # Suma a la fase el tiempo desde t0 y devuelve el instante actual, así las fases
+        # consecutivas se encadenan con una sola lectura del reloj
+        t = self.reloj()
+        self.tiempo[fase] += t - t0
+        self.llamadas[fase] += 1
+        return t
+
+    def informe(self):
+        return InformePerfil(self.tiempo, self.llamadas)
+
+
+class InformePerfil:
+    # Foto de un Perfilador: se puede guardar, enviar entre procesos y sumar entre réplicas
+    def __init__(self, tiempo=None, llamadas=None):
+        self.tiempo = dict(tiempo or {})
+        self.llamadas = dict(llamadas or {})
+
+    def combinar(self, otro):
+        for fase, t in otro.tiempo.items():
+            self.tiempo[fase] = self.tiempo.get(fase, 0.0) + t
+            self.llamadas[fase] = self.llamadas.get(fase, 0) + otro.llamadas.get(fase, 0)
+        return self
+
+    def tabla(self):
+        # Una fila por fase, ordenadas por tiempo. El % es sobre el tiempo de los turnos;
+        # las fases de fuera del turno (construcción, dibujo) pueden superar el 100%.
+        total_turno = self.tiempo.get(TURNO, 0.0)
+        filas = []
+        for fase, t in self.tiempo.items():
+            if fase == TURNO:
+                continue
+            filas.append((fase, self.llamadas[fase], t))
+        if total_turno:
+            dentro = sum(t for fase, _, t in filas if fase in FASES)
+            filas.append(("planificador y resto", self.llamadas[TURNO], max(total_turno - dentro, 0.0)))
+
+        tabla = pd.DataFrame(filas, columns=["Fase", "Llamadas", "Tiempo (s)"])
+        tabla["µs/llamada"] = 1e6 * tabla["Tiempo (s)"] / tabla["Llamadas"].clip(lower=1)
+        tabla["% del turno"] = 100 * tabla["Tiempo (s)"] / total_turno if total_turno else float("nan")
+        return tabla.sort_values("Tiempo (s)", ascending=False, ignore_index=True)
+
+    def __str__(self):
+        return self.tabla().to_string(index=False, float_format=lambda x: f"{x:.4f}")
@@ -0,0 +1,171 @@
+# simulation/poblacion.py
+import numpy as np
+import parametros as p
+
+# --- POBLACIÓN COMPACTA (STRUCT OF ARRAYS) ---
+# Un ClienteCaixa de Mesa es un objeto con su propio __dict__ (cientos de bytes por agente),
+# por eso BancoModel agrupa los 3M de personas en clústeres (representacion_por_nodo).
+# Aquí cada campo es un array tipado compartido por toda la población:
+#   float32 para saldos y rasgos, uint8 para edad/tipo/sexo y un bit por persona para
+#   alcance_noticia y protegido_fgd (~30 bytes por persona en total).
+# Con eso el motor vectorizado puede trabajar con un nodo por persona.
+
+
+class Bitset:
+    # Array de booleanos empaquetado a 1 bit por elemento (orden de bits 'little')
+    __slots__ = ("bits", "n")
+
+    def __init__(self, n):
+        self.bits = np.zeros((n + 7) // 8, dtype=np.uint8)
+        self.n = n
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, i):
+        return bool((self.bits[i >> 3] >> (i & 7)) & 1)
+
+    def __setitem__(self, i, valor):
+        if valor:
+            self.bits[i >> 3] |= np.uint8(1 << (i & 7))
+        else:
+            self.bits[i >> 3] &= np.uint8(~(1 << (i & 7)) & 0xFF)
+
+    def como_bool(self):
+        return np.unpackbits(self.bits, count=self.n, bitorder="little").view(bool)
+
+    def asignar(self, valores):
+        self.bits[:] = np.packbits(np.asarray(valores, dtype=bool), bitorder="little")
+
+
+class Poblacion:
+    __slots__ = ("saldo_inicial", "saldo", "porcentaje_retirado", "edad", "digitalizacion",
+                 "aversion", "fidelidad", "tipo", "sexo", "alcance_noticia", "protegido_fgd")
+
+    def __init__(self, n):
+        self.saldo_inicial = np.zeros(n, dtype=np.float32)
+        self.saldo = np.zeros(n, dtype=np.float32)
+        self.porcentaje_retirado = np.zeros(n, dtype=np.float32)
+        self.edad = np.zeros(n, dtype=np.uint8)
+        self.digitalizacion = np.zeros(n, dtype=np.float32)
+        self.aversion = np.zeros(n, dtype=np.float32)
+        self.fidelidad = np.zeros(n, dtype=np.float32)
+        self.tipo = np.zeros(n, dtype=np.uint8)   # índice en p.TIPOS_NODO
+        self.sexo = np.zeros(n, dtype=np.uint8)   # índice en p.DISTRIBUCION_SEXO
+        self.alcance_noticia = Bitset(n)
+        self.protegido_fgd = Bitset(n)
+
+    def __len__(self):
+        return len(self.saldo)
+
+    def __getitem__(self, i):
+        return VistaAgente(self, i)
+
+    def __iter__(self):
+        return (VistaAgente(self, i) for i in range(len(self)))
+
+    @property
+    def es_cliente(self):
+        return self.tipo != p.TIPOS_NODO.index("No-Cliente")
+
+
+class VistaAgente:
+    # Vista ligera de una persona: lee y escribe directamente en los arrays de la Poblacion.
+    # Expone los mismos atributos que ClienteCaixa para reutilizar el código que los consume.
+    __slots__ = ("poblacion", "unique_id")
+
+    def __init__(self, poblacion, i):
+        self.poblacion = poblacion
+        self.unique_id = i
+
+    @property
+    def pos(self):
+        return self.unique_id
+
+    @property
+    def tipo(self):
+        return p.TIPOS_NODO[self.poblacion.tipo[self.unique_id]]
+
+    @property
+    def sexo(self):
+        return p.DISTRIBUCION_SEXO[self.poblacion.sexo[self.unique_id]]
+
+    @property
+    def edad(self):
+        return int(self.poblacion.edad[self.unique_id])
+
+    @property
+    def saldo_inicial(self):
+        return float(self.poblacion.saldo_inicial[self.unique_id])
+
+    @property
+    def saldo(self):
+        return float(self.poblacion.saldo[self.unique_id])
+
+    @saldo.setter
+    def saldo(self, valor):
+        self.poblacion.saldo[self.unique_id] = valor
+
+    @property
+    def porcentaje_retirado(self):
+        return float(self.poblacion.porcentaje_retirado[self.unique_id])
+
+    @porcentaje_retirado.setter
+    def porcentaje_retirado(self, valor):
+        self.poblacion.porcentaje_retirado[self.unique_id] = valor
+
+    @property
+    def digitalizacion(self):
+        return float(self.poblacion.digitalizacion[self.unique_id])
+
+    @property
+    def aversion(self):
+        return float(self.poblacion.aversion[self.unique_id])
+
+    @property
+    def fidelidad(self):
+        return float(self.poblacion.fidelidad[self.unique_id])
+
+    @property
+    def alcance_noticia(self):
+        return self.poblacion.alcance_noticia[self.unique_id]
+
+    @alcance_noticia.setter
+    def alcance_noticia(self, valor):
+        self.poblacion.alcance_noticia[self.unique_id] = valor
+
+    @property
+    def protegido_fgd(self):
+        return self.poblacion.protegido_fgd[self.unique_id]
+
+
+# --- GENERACIÓN EN LOTE ---
+def generar_poblacion(n, total_depositos, p_no_clientes, rng, representacion_por_nodo=1.0):
+    # Muestrea de una vez todos los campos demográficos y de saldo de los n nodos con un
+    # numpy.random.Generator sembrado, siguiendo las constantes de parametros.py.
+    # Misma lógica que ClienteCaixa.__init__ y la creación de agentes de BancoModel, pero sin
+    # un sorteo por agente y por campo.
+    pob = Poblacion(n)
+    no_cliente = p.TIPOS_NODO.index("No-Cliente")
+
+    # Tipo de nodo y saldo del clúster
+    es_cliente = rng.random(n) > p_no_clientes
+    tipo = rng.choice(len(p.DISTRIBUCION_TIPOS), size=n, p=p.PROBABILIDADES_TIPOS)
+    pob.tipo[:] = np.where(es_cliente, tipo, no_cliente)
+
+    # Sin clientes (p_no_clientes=1) no hay saldos que repartir: se quedan a cero
+    if es_cliente.any():
+        saldo_promedio_nodo = total_depositos / (n * (1 - p_no_clientes))
+        rangos = np.array([p.RANGOS_SALDO_TIPO[t] for t in p.DISTRIBUCION_TIPOS] + [(0.0, 0.0)])
+        pob.saldo_inicial[:] = rng.uniform(rangos[pob.tipo, 0], rangos[pob.tipo, 1]) * saldo_promedio_nodo
+        pob.saldo[:] = pob.saldo_inicial
+
+    # Parámetros de comportamiento
+    pob.edad[:] = np.clip(rng.normal(p.EDAD_MEDIA, p.EDAD_DESVIACION, n), p.EDAD_MINIMA, p.EDAD_MAXIMA)
+    pob.digitalizacion[:] = 1.0 - (pob.edad / p.EDAD_MAXIMA)
+    factor_generacional = (pob.edad / p.EDAD_MAXIMA) * 0.5
+    pob.aversion[:] = np.clip(rng.uniform(*p.RANGO_AVERSION, n) + factor_generacional, 0, 1)
+    pob.sexo[:] = rng.choice(len(p.DISTRIBUCION_SEXO), size=n, p=p.PROBABILIDADES_SEXO)
+    pob.fidelidad[:] = rng.uniform(p.RANGO_FIDELIDAD[0], p.RANGO_FIDELIDAD[1], n)
+    pob.protegido_fgd.asignar(pob.saldo_inicial / representacion_por_nodo <= p.UMBRAL_FGD)
+    return pob
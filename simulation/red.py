@@ -0,0 +1,367 @@
+# simulation/red.py
+import os
+from collections import OrderedDict
+
+import networkx as nx
+import numpy as np
+from scipy import sparse
+from scipy.sparse import csgraph
+
+# --- ADYACENCIA COMPACTA (CSR) ---
+# Los nodos de la red son enteros 0..n-1, así que el índice del nodo es también
+# el índice del agente en los arrays de estado.
+
+def grafo_a_csr(G):
+    n = G.number_of_nodes()
+    A = nx.to_scipy_sparse_array(G, nodelist=range(n), format="csr")
+    return A.indptr.astype(np.int64), A.indices.astype(np.int32)
+
+
+def holme_kim_csr(n, m=3, p=0.5, seed=None):
+    # Mismo proceso que nx.powerlaw_cluster_graph (Holme-Kim: enganche preferencial con
+    # cierre de triángulos con probabilidad p), pero sin grafo de networkx: las aristas se
+    # guardan en listas planas y se devuelven como CSR (indptr, indices) ordenado por filas.
+    # Los sorteos salen de un numpy.random.Generator sembrado (por bloques), así que la red
+    # no es la misma que la de networkx con la misma semilla, pero sí lo son la distribución
+    # de grados y el clustering.
+    if m < 1 or n < m:
+        raise ValueError(f"Holme-Kim necesita 1 <= m <= n (m={m}, n={n})")
+    if not 0 <= p <= 1:
+        raise ValueError(f"p debe estar en [0, 1] (p={p})")
+    rng = np.random.default_rng(seed)
+    bloque = []
+
+    def uniforme():
+        if not bloque:
+            bloque.extend(rng.random(65536).tolist())
+        return bloque.pop()
+
+    vecinos = [[] for _ in range(n)]
+    repetidos = list(range(m))  # Un elemento por extremo de arista: muestrear aquí es muestrear por grado
+    origenes, destinos = [], []
+
+    def enlazar(origen, destino):
+        vecinos[origen].append(destino)
+        vecinos[destino].append(origen)
+        origenes.append(origen)
+        destinos.append(destino)
+
+    for nuevo in range(m, n):
+        # m nodos distintos con probabilidad proporcional al grado. Como en networkx salen de
+        # un set: pop() devuelve antes los ids bajos (los nodos viejos, que son los hubs) y eso
+        # forma parte de la distribución de grados de referencia
+        candidatos = set()
+        while len(candidatos) < m:
+            candidatos.add(repetidos[int(uniforme() * len(repetidos))])
+        propios = vecinos[nuevo]
+
+        objetivo = candidatos.pop()
+        enlazar(nuevo, objetivo)
+        repetidos.append(objetivo)
+        enlazados = 1
+        while enlazados < m:
+            if uniforme() < p:
+                # Cierre de triángulo: un vecino del último objetivo que aún no sea vecino del nuevo
+                entorno = vecinos[objetivo]
+                elegido = None
+                for _ in range(8):
+                    v = entorno[int(uniforme() * len(entorno))]
+                    if v != nuevo and v not in propios:
+                        elegido = v
+                        break
+                else:
+                    validos = [v for v in entorno if v != nuevo and v not in propios]
+                    if validos:
+                        elegido = validos[int(uniforme() * len(validos))]
+                if elegido is not None:
+                    enlazar(nuevo, elegido)
+                    repetidos.append(elegido)
+                    enlazados += 1
+                    continue
+            objetivo = candidatos.pop()
+            if objetivo not in propios:  # En networkx repetir una arista no hace nada
+                enlazar(nuevo, objetivo)
+            repetidos.append(objetivo)
+            enlazados += 1
+        repetidos.extend([nuevo] * m)
+
+    del vecinos
+    filas = np.concatenate([np.array(origenes, dtype=np.int32), np.array(destinos, dtype=np.int32)])
+    columnas = np.concatenate([filas[len(origenes):], filas[:len(origenes)]])
+    orden = np.lexsort((columnas, filas))
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(filas, minlength=n))]).astype(np.int64)
+    return indptr, columnas[orden]
+
+
+def matriz_contagio(indptr, indices):
+    # Matriz normalizada por filas: (W @ x)[i] es la media de x entre los vecinos de i.
+    # Un nodo aislado tiene la fila vacía y su media vale 0, igual que en ClienteCaixa.step
+    n = len(indptr) - 1
+    grados = np.diff(indptr)
+    pesos = np.repeat(1.0 / np.maximum(grados, 1), grados)
+    return sparse.csr_matrix((pesos, indices, indptr), shape=(n, n))
+
+
+# --- PARTICIÓN DE LA RED ---
+# Para repartir una red muy grande entre procesos (model_particionado.py): partes de tamaño
+# parecido con pocas aristas entre ellas, porque cada arista cortada es un valor que hay que
+# intercambiar en cada turno.
+
+def aristas_cortadas(indptr, indices, parte):
+    origen = np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+    return int(np.count_nonzero(parte[origen] != parte[indices])) // 2
+
+
+def particionar(indptr, indices, partes, tolerancia=0.03, pasadas=8):
+    # Array con la parte (0..partes-1) de cada nodo.
+    # 1. Orden Cuthill-McKee inverso (recorrido en anchura que agrupa a los vecinos) cortado en
+    #    bloques consecutivos del mismo tamaño: cada parte es una región conexa de la red.
+    # 2. Refinamiento voraz tipo Kernighan-Lin: los nodos de la frontera se pasan a la parte
+    #    donde tienen más vecinos si eso reduce el corte, sin salirse de ±tolerancia del tamaño medio.
+    n = len(indptr) - 1
+    if partes <= 1 or n <= partes:
+        return (np.arange(n, dtype=np.int64) * max(partes, 1) // max(n, 1)).astype(np.int32)
+    A = sparse.csr_matrix((np.ones(len(indices), dtype=np.int8), indices, indptr), shape=(n, n))
+    orden = csgraph.reverse_cuthill_mckee(A, symmetric_mode=True)
+    parte = np.empty(n, dtype=np.int32)
+    parte[orden] = np.arange(n, dtype=np.int64) * partes // n
+
+    origen = np.repeat(np.arange(n), np.diff(indptr))
+    maximo = int(np.ceil(n / partes * (1 + tolerancia)))
+    minimo = int(np.floor(n / partes * (1 - tolerancia)))
+    corte = aristas_cortadas(indptr, indices, parte)
+    for pasada in range(pasadas):
+        # Vecinos de cada nodo en cada parte y la mejor parte para él
+        conteo = np.bincount(origen * partes + parte[indices], minlength=n * partes).reshape(n, partes)
+        destino = conteo.argmax(axis=1).astype(np.int32)
+        ganancia = conteo[np.arange(n), destino] - conteo[np.arange(n), parte]
+        # En cada pasada solo se mueve en un sentido (hacia partes mayores o menores): dos vecinos
+        # no pueden intercambiarse a la vez y deshacer mutuamente la mejora
+        sentido = destino > parte if pasada % 2 == 0 else destino < parte
+        candidatos = np.flatnonzero((ganancia > 0) & sentido)
+        if not len(candidatos):
+            if pasada % 2:
+                break
+            continue
+        candidatos = candidatos[np.argsort(-ganancia[candidatos], kind="stable")]
+
+        # Cupo de cada parte: los de más ganancia primero, sin pasar del máximo ni bajar del mínimo
+        tamanos = np.bincount(parte, minlength=partes)
+        aceptados = np.ones(len(candidatos), dtype=bool)
+        for grupo, limite in ((destino[candidatos], maximo - tamanos), (parte[candidatos], tamanos - minimo)):
+            rango = np.empty(len(candidatos), dtype=np.int64)
+            por_grupo = np.argsort(grupo, kind="stable")
+            inicio = np.searchsorted(grupo[por_grupo], grupo[por_grupo])
+            rango[por_grupo] = np.arange(len(candidatos)) - inicio
+            aceptados &= rango < limite[grupo]
+        movidos = candidatos[aceptados]
+
+        nueva = parte.copy()
+        nueva[movidos] = destino[movidos]
+        nuevo_corte = aristas_cortadas(indptr, indices, nueva)
+        if nuevo_corte >= corte:
+            if pasada % 2:
+                break
+            continue
+        parte, corte = nueva, nuevo_corte
+    return parte
+
+
+# --- TOPOLOGÍAS REUTILIZABLES ---
+# Generar la red y, sobre todo, calcular su disposición para dibujarla (spring_layout es
+# ~O(n²) por iteración) cuesta más que muchas réplicas. Una Topologia agrupa el grafo, su
+# CSR y las disposiciones ya calculadas para compartirlas entre réplicas y reruns de la app.
+# La simulación solo usa el CSR; el grafo de networkx se construye la primera vez que se
+# pide (disposición spring, dibujo clásico), así que una red grande nunca lo materializa.
+
+DISPOSICIONES = ("spring", "muestreado", "grados")
+
+
+class Topologia:
+    def __init__(self, G=None, indptr=None, indices=None, posiciones=None):
+        self._G = G
+        if indptr is None:
+            indptr, indices = grafo_a_csr(G)
+        self.indptr = indptr
+        self.indices = indices
+        self.posiciones_calculadas = dict(posiciones or {})
+        self.particiones_calculadas = {}
+
+    @property
+    def G(self):
+        if self._G is None:
+            G = nx.Graph()
+            G.add_nodes_from(range(self.n))
+            origen = np.repeat(np.arange(self.n), np.diff(self.indptr))
+            arriba = origen < self.indices
+            G.add_edges_from(zip(origen[arriba].tolist(), self.indices[arriba].tolist()))
+            self._G = G
+        return self._G
+
+    @property
+    def n(self):
+        return len(self.indptr) - 1
+
+    def posiciones(self, metodo="spring"):
+        # Array (n, 2) con la posición de cada nodo; se calcula una vez por método
+        if metodo not in self.posiciones_calculadas:
+            if metodo == "spring":
+                pos = nx.spring_layout(self.G, seed=42)
+                self.posiciones_calculadas[metodo] = np.array([pos[i] for i in range(self.n)])
+            elif metodo == "muestreado":
+                self.posiciones_calculadas[metodo] = disposicion_muestreada(self)
+            elif metodo == "grados":
+                self.posiciones_calculadas[metodo] = disposicion_por_grado(self)
+            else:
+                raise ValueError(f"Disposición desconocida: {metodo}")
+        return self.posiciones_calculadas[metodo]
+
+    def particion(self, partes):
+        # Parte de cada nodo al repartir la red en 'partes' procesos; se calcula una vez por nº de partes
+        if partes not in self.particiones_calculadas:
+            self.particiones_calculadas[partes] = particionar(self.indptr, self.indices, partes)
+        return self.particiones_calculadas[partes]
+
+
+def disposicion_por_grado(topologia):
+    # Disposición radial O(n log n): los hubs en el centro, los nodos periféricos fuera.
+    # Los ángulos siguen el ángulo áureo para repartir los nodos sin solaparlos.
+    grados = np.diff(topologia.indptr)
+    rango = np.empty(topologia.n)
+    rango[np.argsort(-grados, kind="stable")] = np.arange(topologia.n)
+    radio = np.sqrt((rango + 1) / topologia.n)
+    angulo = rango * np.pi * (3 - np.sqrt(5))
+    return np.column_stack([radio * np.cos(angulo), radio * np.sin(angulo)])
+
+
+def disposicion_muestreada(topologia, muestra=300, seed=42):
+    # spring_layout solo sobre los 'muestra' nodos de mayor grado; el resto se coloca en la
+    # media de sus vecinos ya colocados (más un pequeño ruido), avanzando en oleadas desde los hubs
+    n = topologia.n
+    rng = np.random.default_rng(seed)
+    grados = np.diff(topologia.indptr)
+    nucleo = np.argsort(-grados, kind="stable")[:min(muestra, n)]
+
+    # Subgrafo del núcleo desde el CSR, sin materializar el grafo completo
+    en_nucleo = np.zeros(n, dtype=bool)
+    en_nucleo[nucleo] = True
+    sub = nx.Graph()
+    sub.add_nodes_from(nucleo.tolist())
+    for i in nucleo.tolist():
+        vecinos = topologia.indices[topologia.indptr[i]:topologia.indptr[i + 1]]
+        sub.add_edges_from((i, j) for j in vecinos[en_nucleo[vecinos]].tolist())
+    pos_nucleo = nx.spring_layout(sub, seed=seed)
+    pos = np.zeros((n, 2))
+    colocado = np.zeros(n, dtype=bool)
+    pos[nucleo] = [pos_nucleo[i] for i in nucleo]
+    colocado[nucleo] = True
+
+    A = sparse.csr_matrix((np.ones(len(topologia.indices)), topologia.indices, topologia.indptr), shape=(n, n))
+    while not colocado.all():
+        vecinos_colocados = A @ colocado.astype(float)
+        frontera = ~colocado & (vecinos_colocados > 0)
+        if not frontera.any():
+            # Componentes sin conexión con el núcleo: posición aleatoria
+            frontera = ~colocado
+            pos[frontera] = rng.uniform(-1, 1, (frontera.sum(), 2))
+        else:
+            suma = A[frontera] @ (pos * colocado[:, None])
+            pos[frontera] = suma / vecinos_colocados[frontera, None] + rng.normal(0, 0.03, (frontera.sum(), 2))
+        colocado |= frontera
+    return pos
+
+
+# Directorio de las redes con disposición calculada y memoria máxima de la caché del proceso
+DIRECTORIO_REDES = os.path.join("resultados", "redes")
+MAX_BYTES_REDES = 256 * 1024 ** 2
+
+
+class CacheTopologias:
+    # Caché LRU en memoria, acotada en bytes (CSR y disposiciones), con copia en disco como .npz
+    # indexada por (n, m, p, seed). Sin semilla la red no es reproducible y no se guarda.
+    # Acotarla en bytes y no en nº de redes: las réplicas piden cada una su semilla y en un
+    # rerun las vuelven a pedir en el mismo orden, así que con menos huecos que réplicas una
+    # LRU fallaría siempre. Al disco solo va lo que se escribe con guardar(): regenerar el CSR
+    # cuesta lo mismo que leerlo, lo caro de rehacer es la disposición.
+    def __init__(self, max_bytes=MAX_BYTES_REDES, directorio=None):
+        self.max_bytes = max_bytes
+        self.directorio = directorio
+        self.elementos = OrderedDict()
+
+    def obtener(self, n, m=3, p=0.5, seed=None):
+        if seed is None:
+            return Topologia(None, *holme_kim_csr(n, m, p))
+
+        clave = (n, m, p, seed)
+        if clave in self.elementos:
+            self.elementos.move_to_end(clave)
+            return self.elementos[clave]
+
+        topologia = self._leer_disco(clave)
+        if topologia is None:
+            topologia = Topologia(None, *holme_kim_csr(n, m, p, seed=seed))
+
+        self.elementos[clave] = topologia
+        self._recortar()
+        return topologia
+
+    def guardar(self, topologia):
+        # Escribe en disco una topología de la caché con las disposiciones ya calculadas, para
+        # que el siguiente proceso (rerun de Streamlit, otra sesión) no las vuelva a calcular
+        for clave, elemento in list(self.elementos.items()):
+            if elemento is topologia:
+                self._escribir_disco(clave, topologia)
+                self._recortar()
+                return
+
+    def _recortar(self):
+        # Saca las menos usadas hasta caber en max_bytes (siempre queda al menos la última)
+        tamanos = [tamano_topologia(t) for t in list(self.elementos.values())]  # El hilo de la app también la usa
+        total = sum(tamanos)
+        for tamano in tamanos[:-1]:
+            if total <= self.max_bytes:
+                break
+            self.elementos.popitem(last=False)
+            total -= tamano
+
+    def _ruta(self, clave):
+        n, m, p, seed = clave
+        # 'hk': redes del generador nativo (las de networkx guardadas antes no se reutilizan)
+        return os.path.join(self.directorio, f"red_hk_n{n}_m{m}_p{p}_s{seed}.npz")
+
+    def _escribir_disco(self, clave, topologia):
+        if self.directorio is None:
+            return
+        os.makedirs(self.directorio, exist_ok=True)
+        posiciones = {f"pos_{metodo}": pos for metodo, pos in topologia.posiciones_calculadas.items()}
+        # Fichero temporal y renombrado: otro proceso nunca lee uno a medio escribir
+        temporal = self._ruta(clave) + f".{os.getpid()}.tmp"
+        with open(temporal, "wb") as f:
+            np.savez(f, indptr=topologia.indptr, indices=topologia.indices, **posiciones)
+        os.replace(temporal, self._ruta(clave))
+
+    def _leer_disco(self, clave):
+        if self.directorio is None or not os.path.exists(self._ruta(clave)):
+            return None
+        try:
+            with np.load(self._ruta(clave)) as datos:
+                indptr, indices = datos["indptr"], datos["indices"]
+                posiciones = {k[len("pos_"):]: datos[k] for k in datos.files if k.startswith("pos_")}
+        except (OSError, ValueError, KeyError):
+            # Fichero dañado: se regenera la red
+            return None
+        return Topologia(None, indptr, indices, posiciones)
+
+
+def tamano_topologia(topologia):
+    # Bytes de los arrays de la topología (el grafo de networkx, si se construyó, no se cuenta)
+    return topologia.indptr.nbytes + topologia.indices.nbytes + sum(pos.nbytes for pos in topologia.posiciones_calculadas.values())
+
+
+# Caché del proceso: sobrevive a los reruns de Streamlit y se reutiliza entre réplicas; las
+# disposiciones guardadas en resultados/redes sobreviven además al proceso
+CACHE_TOPOLOGIAS = CacheTopologias(directorio=DIRECTORIO_REDES)
+
+
+def obtener_topologia(n, m=3, p=0.5, seed=None):
+    return CACHE_TOPOLOGIAS.obtener(n, m, p, seed)
@@ -0,0 +1,270 @@
+# simulation/runner.py
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+
+import numpy as np
+
+from .model import BancoModel
+from .model_eventos import BancoModelEventos
+from .model_lotes import PARAMETROS_ESCENARIO, BancoModelLotes
+from .model_particionado import BancoModelParticionado
+from .model_vectorizado import BancoModelVectorizado
+from .perfilado import Perfilador
+from .red import obtener_topologia
+from .trayectorias import GrabadorTrayectoria
+
+MOTORES = {"mesa": BancoModel, "vectorizado": BancoModelVectorizado, "particionado": BancoModelParticionado,
+           "eventos": BancoModelEventos}
+SERIES = ("liquidez", "huidas", "informadas")
+
+
+def semillas_replicas(seed, n_replicas):
+    # Una semilla independiente por réplica a partir de una sola semilla maestra.
+    # La réplica i recibe siempre la misma semilla, se pidan 5 réplicas o 50.
+    hijos = np.random.SeedSequence(seed).spawn(n_replicas)
+    return [int(h.generate_state(1)[0]) for h in hijos]
+
+
+def plan_replicas(seed, n_replicas, sorteo_difusion=None):
+    # (semilla, argumentos extra del modelo) de cada réplica; el plan de n réplicas es siempre
+    # prefijo del de n+1, igual que semillas_replicas.
+    # Con sorteo_difusion="antitetico" las réplicas van por parejas que comparten el generador
+    # de la difusión (la primera usa u y la segunda 1-u) pero no la semilla del modelo: con
+    # la misma red, población y orden de activación las dos réplicas de la pareja acaban
+    # casi siempre igual y la pareja aportaría menos información que dos réplicas independientes.
+    semillas = semillas_replicas(seed, n_replicas)
+    if sorteo_difusion == "antitetico":
+        return [(s, {"sorteo_difusion": "comun" if i % 2 == 0 else "antitetico", "semilla_difusion": semillas[i - i % 2]})
+                for i, s in enumerate(semillas)]
+    extra = {"sorteo_difusion": sorteo_difusion} if sorteo_difusion else {}
+    return [(s, extra) for s in semillas]
+
+
+# Pool de procesos compartido entre llamadas (ejecutar_replicas, iterar_replicas_adaptativo):
+# sus procesos conservan la caché de topologías (red.py) entre reruns de Streamlit, que con un
+# pool nuevo por llamada se perdería cada vez
+POOL = None
+
+
+def pool_procesos(procesos):
+    # Se rehace si cambia el nº de procesos o si un proceso murió (pool roto)
+    global POOL
+    if POOL is not None and (POOL._max_workers != procesos or POOL._broken):
+        POOL.shutdown(wait=False, cancel_futures=True)
+        POOL = None
+    if POOL is None:
+        POOL = ProcessPoolExecutor(max_workers=procesos)
+    return POOL
+
+
+def ejecutar_replica(params, max_turnos, seed, motor="mesa", perfilar=False, grabar=None):
+    # Corre una réplica completa y devuelve solo series y resumen de agentes (nada de modelos)
+    # La red sale de la caché del proceso (misma semilla que la réplica): barridos que solo
+    # cambian parámetros de la noticia o del banco reutilizan la red ya generada.
+    # Con grabar=directorio se guarda además el estado de cada agente turno a turno (trayectorias.py)
+    perfilador = Perfilador() if perfilar else None
+    topologia = obtener_topologia(params["n"], seed=seed)
+    model = MOTORES[motor](**params, seed=seed, topologia=topologia, perfilador=perfilador)
+    series = {clave: [] for clave in SERIES}
+    grabador = GrabadorTrayectoria(grabar, model, params=params, seed=seed, motor=motor) if grabar else None
+
+    try:
+        for t in range(max_turnos):
+            model.step()
+            resumen = model.resumen_turno()
+            if grabador is not None:
+                grabador.grabar(model, resumen)
+            for clave in SERIES:
+                series[clave].append(resumen[clave])
+            if resumen["liquidez"] <= 0:
+                break
+            if not model.running:
+                # Punto fijo: el estado ya no cambia, se repite hasta max_turnos sin simular
+                for clave in SERIES:
+                    series[clave].extend([resumen[clave]] * (max_turnos - t - 1))
+                break
+    finally:
+        # También si step() falla: la grabación queda cerrada con los turnos ya escritos
+        if grabador is not None:
+            grabador.cerrar()
+        if hasattr(model, "cerrar"):  # Motor particionado: termina sus procesos
+            model.cerrar()
+
+    resultado = {clave: np.asarray(valores, dtype=float) for clave, valores in series.items()}
+    resultado["paso"] = np.arange(len(resultado["liquidez"]))
+    return {
+        "seed": seed,
+        "series": resultado,
+        "agentes": model.resumen_agentes(),
+        "poblacion_objetivo": model.poblacion_objetivo,
+        "perfil": perfilador.informe() if perfilar else None,
+    }
+
+
+def ejecutar_lote(tareas, max_turnos, motor="mesa", perfilar=False, pool=None, cache=None):
+    # tareas: lista de (params, seed). Devuelve los resultados en el mismo orden; con una
+    # CacheResultados solo se simulan las réplicas que no estén ya guardadas
+    claves = [cache.clave(params, max_turnos, seed, motor) for params, seed in tareas] if cache is not None else []
+    resultados = [cache.obtener(c) for c in claves] if cache is not None else [None] * len(tareas)
+    pendientes = [i for i, r in enumerate(resultados) if r is None]
+
+    if pool is None or len(pendientes) <= 1:
+        nuevos = [ejecutar_replica(tareas[i][0], max_turnos, tareas[i][1], motor, perfilar) for i in pendientes]
+    else:
+        nuevos = pool.map(ejecutar_replica, [tareas[i][0] for i in pendientes], [max_turnos] * len(pendientes),
+                          [tareas[i][1] for i in pendientes], [motor] * len(pendientes), [perfilar] * len(pendientes))
+    for i, resultado in zip(pendientes, nuevos):
+        resultados[i] = resultado
+        if cache is not None:
+            cache.guardar(claves[i], resultado)
+    return resultados
+
+
+def ejecutar_replicas(params, max_turnos, n_replicas, seed=None, motor="mesa", procesos=None, perfilar=False,
+                      sorteo_difusion=None, cache=None):
+    # params: argumentos de BancoModel (n, total_depositos, encaje, news_score, news_validez,
+    # news_difusion, p_no_clientes). Las réplicas se reparten en un pool de procesos.
+    tareas = [(dict(params, **extra), s) for s, extra in plan_replicas(seed, n_replicas, sorteo_difusion)]
+    procesos = procesos or os.cpu_count() or 1
+
+    if min(procesos, n_replicas) <= 1:
+        return ejecutar_lote(tareas, max_turnos, motor, perfilar, cache=cache)
+    return ejecutar_lote(tareas, max_turnos, motor, perfilar, pool_procesos(procesos), cache)
+
+
+def iterar_replicas_adaptativo(params, max_turnos, criterio, seed=None, motor="mesa", procesos=None, perfilar=False,
+                               sorteo_difusion=None, cache=None):
+    # Réplicas hasta que 'criterio' (estadisticas.CriterioPrecision) se da por satisfecho.
+    # Se lanzan por lotes de 'procesos' réplicas y se entregan y evalúan en el orden del plan,
+    # así el punto de parada no depende de qué proceso termine antes.
+    plan = plan_replicas(seed, criterio.max_replicas + criterio.max_replicas % criterio.tam_unidad, sorteo_difusion)
+    # Si se corta a mitad de lote, Executor.map cancela las réplicas que aún no han empezado
+    procesos = procesos or os.cpu_count() or 1
+    pool = pool_procesos(procesos) if procesos > 1 else None
+    for inicio in range(0, len(plan), procesos):
+        lote = [(dict(params, **extra), s) for s, extra in plan[inicio:inicio + procesos]]
+        for resultado in ejecutar_lote(lote, max_turnos, motor, perfilar, pool, cache):
+            criterio.agregar(resultado["series"])
+            yield resultado
+            if criterio.terminado():
+                return
+
+
+def iterar_replicas(tareas, max_turnos, motor="mesa", procesos=None, grabar=None):
+    # Versión en streaming para barridos largos: 'tareas' es un iterable (perezoso) de
+    # (etiqueta, params, seed). Se mantienen como mucho 2 tareas por proceso en vuelo y
+    # se devuelve (etiqueta, resultado) según terminan, así la memoria no crece con el barrido.
+    # grabar: función etiqueta -> directorio donde grabar la trayectoria de esa réplica
+    procesos = procesos or os.cpu_count() or 1
+
+    def directorio(etiqueta):
+        return grabar(etiqueta) if grabar is not None else None
+
+    if procesos <= 1:
+        for etiqueta, params, seed in tareas:
+            yield etiqueta, ejecutar_replica(params, max_turnos, seed, motor, grabar=directorio(etiqueta))
+        return
+
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        en_vuelo = {}
+        for etiqueta, params, seed in tareas:
+            en_vuelo[pool.submit(ejecutar_replica, params, max_turnos, seed, motor, grabar=directorio(etiqueta))] = etiqueta
+            if len(en_vuelo) >= 2 * procesos:
+                hechas, _ = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                for futuro in hechas:
+                    yield en_vuelo.pop(futuro), futuro.result()
+
+        for futuro in as_completed(list(en_vuelo)):
+            yield en_vuelo.pop(futuro), futuro.result()
+
+
+def ejecutar_escenarios(params, escenarios, max_turnos, seed, perfilar=False):
+    # Varios escenarios (dicts con claves de PARAMETROS_ESCENARIO) sobre la misma red y
+    # población en un solo BancoModelLotes. Devuelve un resultado por escenario con el mismo
+    # formato (y los mismos números) que ejecutar_replica(..., motor="vectorizado").
+    # Los escenarios que quiebran salen del lote, así el resto no paga por ellos.
+    perfilador = Perfilador() if perfilar else None
+    topologia = obtener_topologia(params["n"], seed=seed)
+    model = BancoModelLotes(**params, escenarios=escenarios, seed=seed, topologia=topologia, perfilador=perfilador)
+    series = [{clave: [] for clave in SERIES} for _ in escenarios]
+    agentes = [None] * len(escenarios)
+    activos = np.arange(len(escenarios))  # Escenario de cada fila del lote
+
+    for t in range(max_turnos):
+        model.step()
+        resumen = model.resumen_turno()
+        for fila, b in enumerate(activos):
+            for clave in SERIES:
+                series[b][clave].append(resumen[clave][fila])
+        quebrados = resumen["liquidez"] <= 0
+        if quebrados.any():
+            for fila in np.flatnonzero(quebrados):
+                agentes[activos[fila]] = model.resumen_agentes(fila)
+            model.conservar(~quebrados)
+            activos = activos[~quebrados]
+            if not len(activos):
+                break
+    for fila, b in enumerate(activos):
+        agentes[b] = model.resumen_agentes(fila)
+
+    resultados = []
+    for b in range(len(escenarios)):
+        resultado = {clave: np.asarray(valores, dtype=float) for clave, valores in series[b].items()}
+        resultado["paso"] = np.arange(len(resultado["liquidez"]))
+        resultados.append({
+            "seed": seed,
+            "series": resultado,
+            "agentes": agentes[b],
+            "poblacion_objetivo": model.poblacion_objetivo,
+            # El perfil es del lote entero: va en el primer resultado para no contarlo B veces
+            "perfil": perfilador.informe() if perfilar and b == 0 else None,
+        })
+    return resultados
+
+
+def agrupar_lotes(tareas, tam_lote):
+    # Agrupa tareas consecutivas (etiqueta, params, seed) con la misma semilla y los mismos
+    # parámetros comunes (todo salvo PARAMETROS_ESCENARIO) en lotes de hasta tam_lote
+    lote, clave_lote = [], None
+    for etiqueta, params, seed in tareas:
+        comunes = {k: v for k, v in params.items() if k not in PARAMETROS_ESCENARIO}
+        clave = (seed, sorted(comunes.items()))
+        if lote and (clave != clave_lote or len(lote) == tam_lote):
+            yield lote
+            lote = []
+        lote.append((etiqueta, params, seed))
+        clave_lote = clave
+    if lote:
+        yield lote
+
+
+def ejecutar_lote_escenarios(lote, max_turnos):
+    etiquetas = [etiqueta for etiqueta, _, _ in lote]
+    _, params, seed = lote[0]
+    comunes = {k: v for k, v in params.items() if k not in PARAMETROS_ESCENARIO}
+    escenarios = [{k: v for k, v in p.items() if k in PARAMETROS_ESCENARIO} for _, p, _ in lote]
+    return list(zip(etiquetas, ejecutar_escenarios(comunes, escenarios, max_turnos, seed)))
+
+
+def iterar_lotes(tareas, max_turnos, tam_lote=10, procesos=None):
+    # Como iterar_replicas con el motor vectorizado, pero las tareas consecutivas que solo
+    # difieren en la noticia o el encaje se avanzan juntas en un BancoModelLotes
+    procesos = procesos or os.cpu_count() or 1
+    lotes = agrupar_lotes(tareas, tam_lote)
+
+    if procesos <= 1:
+        for lote in lotes:
+            yield from ejecutar_lote_escenarios(lote, max_turnos)
+        return
+
+    with ProcessPoolExecutor(max_workers=procesos) as pool:
+        en_vuelo = set()
+        for lote in lotes:
+            en_vuelo.add(pool.submit(ejecutar_lote_escenarios, lote, max_turnos))
+            if len(en_vuelo) >= 2 * procesos:
+                hechas, en_vuelo = wait(en_vuelo, return_when=FIRST_COMPLETED)
+                for futuro in hechas:
+                    yield from futuro.result()
+
+        for futuro in as_completed(en_vuelo):
+            yield from futuro.result()
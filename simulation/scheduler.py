@@ -0,0 +1,76 @@
+from mesa.time import RandomActivation
+import numpy as np
+import parametros as p
+
+# Por debajo de este cambio (en fracción retirada o en fracción de la liquidez inicial)
+# se considera que el agente no se ha movido: evita que el redondeo del último decimal
+# mantenga despiertos a los vecinos para siempre.
+TOLERANCIA = 1e-9
+
+# Techo de la sigmoide del cliente (score_final recortado a 1): quien ya ha retirado esto no puede pedir más
+META_FUGA_MAXIMA = 1 / (1 + np.exp(-p.K_RUIDO_CLIENTE * (1 - p.x0_CLIENTE)))
+
+
+class ActivacionSelectiva(RandomActivation):
+    # Como RandomActivation, pero cada turno solo activa (en orden aleatorio) a los agentes que
+    # pueden cambiar:
+    #   - los que aún no conocen la noticia y tienen probabilidad de enterarse (sorteo pendiente),
+    #   - los que tienen algún vecino cuyo porcentaje_retirado cambió el turno anterior,
+    #   - los clientes informados y no saturados si la liquidez del banco cambió (miedo_banco).
+    # Con la caja a cero ningún cliente puede retirar, así que dejan de activarse.
+    # Cuando no queda nadie por activar el sistema está en un punto fijo y model.running pasa a False.
+
+    def __init__(self, model):
+        super().__init__(model)
+        self.activos = None
+        self.pendientes_noticia = set()
+        self.clientes_atentos = set()
+
+    def _inicializar(self):
+        self.activos = set(self._agents)
+        for clave, a in self._agents.items():
+            if a.alcance_noticia:
+                if a.tipo != "No-Cliente":
+                    self.clientes_atentos.add(clave)
+            elif self.model.noticia_difusion * a.digitalizacion > 0:
+                self.pendientes_noticia.add(clave)
+
+    def step(self):
+        if self.activos is None:
+            self._inicializar()
+
+        liquidez_antes = self.model.liquidez_banco
+        despertados = set()
+
+        claves = sorted(self.activos)
+        self.model.random.shuffle(claves)
+        for clave in claves:
+            a = self._agents[clave]
+            fuga_antes = a.porcentaje_retirado
+            a.step()
+
+            if clave in self.pendientes_noticia and a.alcance_noticia:
+                self.pendientes_noticia.discard(clave)
+                if a.tipo != "No-Cliente":
+                    self.clientes_atentos.add(clave)
+
+            if abs(a.porcentaje_retirado - fuga_antes) > TOLERANCIA:
+                despertados.update(v.unique_id for v in a.vecinos)
+                if a.tipo != "No-Cliente" and a.porcentaje_retirado >= META_FUGA_MAXIMA:
+                    self.clientes_atentos.discard(clave)
+
+        liquidez = self.model.liquidez_banco
+        if liquidez > 0 and abs(liquidez - liquidez_antes) > TOLERANCIA * self.model.liquidez_inicial:
+            despertados |= self.clientes_atentos
+
+        if liquidez <= 0:
+            # Caja vacía: los clientes informados ya no pueden mover nada
+            despertados = {c for c in despertados
+                           if self._agents[c].tipo == "No-Cliente" or not self._agents[c].alcance_noticia}
+
+        self.activos = despertados | self.pendientes_noticia
+        if not self.activos:
+            self.model.running = False
+
+        self.steps += 1
+        self.time += 1
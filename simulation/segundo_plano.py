@@ -0,0 +1,182 @@
+# simulation/segundo_plano.py
+import os
+import threading
+from collections import deque
+
+import numpy as np
+
+from .red import obtener_topologia
+from .runner import MOTORES
+from .trayectorias import GrabadorTrayectoria
+
+# --- SIMULACIÓN EN SEGUNDO PLANO ---
+# Un hilo corre las réplicas de la app a máxima velocidad y publica un fotograma por turno
+# (resumen agregado y estado de los nodos) en un buffer acotado. La interfaz lo lee a su
+# propio ritmo: la pausa entre fotogramas ya no frena el cálculo y el informe agregado
+# está listo en cuanto termina la última réplica.
+
+
+class BufferFotogramas:
+    # Cola acotada entre el hilo de simulación y el de la interfaz.
+    # bloquear=False: buffer circular; si la interfaz no da abasto se descartan los fotogramas
+    #   viejos y tomar() devuelve siempre el más reciente (el cálculo nunca espera).
+    # bloquear=True: el hilo de simulación espera a que haya hueco y tomar() devuelve los
+    #   fotogramas en orden, sin saltarse ninguno (animación turno a turno).
+    def __init__(self, capacidad=32, bloquear=False):
+        self.capacidad = capacidad
+        self.bloquear = bloquear
+        self.fotogramas = deque()
+        self.descartados = 0
+        self.condicion = threading.Condition()
+
+    def __len__(self):
+        return len(self.fotogramas)
+
+    def publicar(self, fotograma, detenida=None):
+        with self.condicion:
+            if self.bloquear:
+                while len(self.fotogramas) >= self.capacidad and not (detenida is not None and detenida.is_set()):
+                    self.condicion.wait(0.1)
+            elif len(self.fotogramas) >= self.capacidad:
+                self.fotogramas.popleft()
+                self.descartados += 1
+            self.fotogramas.append(fotograma)
+            self.condicion.notify_all()
+
+    def tomar(self, espera=0.1):
+        # Siguiente fotograma a mostrar, o None si no llega ninguno en 'espera' segundos
+        with self.condicion:
+            if not self.fotogramas:
+                self.condicion.wait(espera)
+            if not self.fotogramas:
+                return None
+            if self.bloquear:
+                fotograma = self.fotogramas.popleft()
+            else:
+                fotograma = self.fotogramas.pop()
+                self.descartados += len(self.fotogramas)
+                self.fotogramas.clear()
+            self.condicion.notify_all()
+            return fotograma
+
+
+class SimulacionEnSegundoPlano(threading.Thread):
+    # Réplicas del plan (runner.plan_replicas) una tras otra, plegadas en 'agregador' y, si
+    # los hay, en la caché de resultados y en el criterio de precisión. Solo este hilo toca
+    # los modelos; la interfaz recibe copias del estado en los fotogramas.
+    # Con grabar=directorio cada réplica simulada se graba en directorio/replica_XXX
+    # (las que salen de la caché no se simulan y no se graban).
+    def __init__(self, params, plan, max_turnos, buffer, agregador, criterio=None, cache=None, perfilador=None, motor="mesa",
+                 grabar=None):
+        super().__init__(daemon=True)
+        self.params = params
+        self.plan = plan
+        self.max_turnos = max_turnos
+        self.buffer = buffer
+        self.agregador = agregador
+        self.criterio = criterio
+        self.cache = cache
+        self.perfilador = perfilador
+        self.motor = motor
+        self.grabar = grabar
+        self.detenida = threading.Event()
+        self.poblacion_objetivo = None
+        self.desde_cache = 0
+        self.error = None
+
+    def detener(self):
+        self.detenida.set()
+
+    def terminada(self):
+        # Sin hilo vivo ni fotogramas pendientes de mostrar
+        return not self.is_alive() and not len(self.buffer)
+
+    def run(self):
+        try:
+            for replica, (semilla, extra) in enumerate(self.plan):
+                if self.detenida.is_set() or not self.simular_replica(replica, semilla, extra):
+                    break
+        except Exception as error:  # Se relanza en el hilo de la interfaz
+            self.error = error
+
+    def simular_replica(self, replica, semilla, extra):
+        # Devuelve False cuando no hay que seguir (criterio satisfecho o hilo detenido)
+        params = dict(self.params, **extra)
+        perf = self.perfilador
+
+        # Réplica ya simulada con los mismos parámetros, semilla y código: se incorpora sin simularla
+        if self.cache is not None:
+            clave = self.cache.clave(params, self.max_turnos, semilla, self.motor)
+            guardada = self.cache.obtener(clave)
+            if guardada is not None:
+                self.desde_cache += 1
+                self.poblacion_objetivo = guardada["poblacion_objetivo"]
+                return self.incorporar(guardada["series"], guardada["agentes"])
+
+        if perf is not None:
+            t_fase = perf.reloj()
+        topologia = obtener_topologia(params["n"], seed=semilla)
+        model = MOTORES[self.motor](**params, seed=semilla, topologia=topologia, perfilador=perf)
+        self.poblacion_objetivo = model.poblacion_objetivo
+        if perf is not None:
+            perf.marcar("construccion", t_fase)
+
+        grabador = None
+        if self.grabar is not None:
+            grabador = GrabadorTrayectoria(os.path.join(self.grabar, f"replica_{replica:03d}"), model,
+                                           params=params, seed=semilla, motor=self.motor)
+        try:
+            stats_data = self.simular_turnos(model, replica, topologia, grabador)
+        finally:
+            if grabador is not None:
+                grabador.cerrar()
+        if stats_data is None:
+            return False
+
+        resumen_agentes = model.resumen_agentes()
+        if self.cache is not None:
+            self.cache.guardar(clave, {"seed": semilla, "series": {k: np.asarray(v) for k, v in stats_data.items()},
+                                       "agentes": resumen_agentes, "poblacion_objetivo": self.poblacion_objetivo})
+        return self.incorporar(stats_data, resumen_agentes)
+
+    def simular_turnos(self, model, replica, topologia, grabador):
+        # Series de la réplica, o None si se detiene el hilo a mitad
+        # Las listas solo crecen: los fotogramas guardan una referencia y la longitud en su turno
+        stats_data = {"paso": [], "liquidez": [], "huidas": [], "informadas": []}
+        for t in range(self.max_turnos):
+            if self.detenida.is_set():
+                return None
+            model.step()
+            resumen = model.resumen_turno()
+            estado = model.estado_nodos()
+            if grabador is not None:
+                grabador.grabar(model, resumen, estado)
+            stats_data["paso"].append(t)
+            stats_data["liquidez"].append(resumen["liquidez"])
+            stats_data["huidas"].append(resumen["huidas"])
+            stats_data["informadas"].append(resumen["informadas"])
+
+            fin = resumen["liquidez"] <= 0 or not model.running or t == self.max_turnos - 1
+            self.buffer.publicar({
+                "replica": replica, "turno": t, "fin": fin, "resumen": resumen, "series": stats_data,
+                "estado": estado, "topologia": topologia,
+                "representacion_por_nodo": model.representacion_por_nodo,
+                "poblacion_objetivo": model.poblacion_objetivo, "liquidez_inicial": model.liquidez_inicial,
+            }, self.detenida)
+
+            if resumen["liquidez"] <= 0: break
+            if not model.running:
+                # Punto fijo: nada puede cambiar ya, completamos la serie sin seguir simulando
+                for t_resto in range(t + 1, self.max_turnos):
+                    stats_data["paso"].append(t_resto)
+                    for clave in ("liquidez", "huidas", "informadas"):
+                        stats_data[clave].append(stats_data[clave][-1])
+                break
+        return stats_data
+
+    def incorporar(self, series, agentes):
+        self.agregador.agregar(series, agentes)
+        if self.criterio is not None:
+            self.criterio.agregar(series)
+            return not self.criterio.terminado()
+        return True
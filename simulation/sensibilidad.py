@@ -0,0 +1,193 @@
+# simulation/sensibilidad.py
+import warnings
+
+import joblib
+import numpy as np
+from scipy.stats import qmc
+from sklearn.exceptions import ConvergenceWarning
+from sklearn.gaussian_process import GaussianProcessRegressor
+from sklearn.gaussian_process.kernels import ConstantKernel, Matern
+
+from .estadisticas import Welford
+from .runner import iterar_replicas, semillas_replicas
+
+# --- SUPERFICIE DE QUIEBRA (MODELO SUSTITUTO) ---
+# En vez de simular cada combinación de (noticia, banco) se simulan unos pocos puntos de un
+# diseño Latin hypercube / Sobol con pocas réplicas, se ajusta un proceso gaussiano a la
+# probabilidad de quiebra y al turno medio de colapso, y se añaden puntos donde el sustituto
+# está menos seguro. La superficie resultante se guarda en disco y se consulta al instante.
+
+# Dimensiones de la superficie y su rango (los de los sliders de app.py)
+ESPACIO = {
+    "news_score": (0.0, 1.0),
+    "news_validez": (0.0, 1.0),
+    "news_difusion": (0.0, 1.0),
+    "encaje": (0.01, 0.30),
+}
+DIMENSIONES = tuple(ESPACIO)
+
+
+def a_unitario(X):
+    inferior, superior = np.array(list(ESPACIO.values())).T
+    return (np.asarray(X, dtype=float) - inferior) / (superior - inferior)
+
+
+def desde_unitario(U):
+    inferior, superior = np.array(list(ESPACIO.values())).T
+    return inferior + np.asarray(U, dtype=float) * (superior - inferior)
+
+
+def diseno(n_puntos, metodo="lhs", seed=None):
+    # Puntos en el espacio de parámetros repartidos por un diseño de Latin hypercube o Sobol
+    if metodo == "lhs":
+        muestreador = qmc.LatinHypercube(d=len(ESPACIO), seed=seed)
+    elif metodo == "sobol":
+        muestreador = qmc.Sobol(d=len(ESPACIO), scramble=True, seed=seed)
+    else:
+        raise ValueError(f"Diseño desconocido: {metodo}")
+    return desde_unitario(muestreador.random(n_puntos))
+
+
+def evaluar_puntos(puntos, params_base, n_replicas, max_turnos, seed=None, motor="mesa", procesos=None):
+    # Para cada punto: nº de quiebras y media/varianza del turno de colapso de n_replicas.
+    # Todos los puntos usan las mismas semillas (números aleatorios comunes), así las
+    # diferencias entre puntos se deben a los parámetros y la superficie sale más suave.
+    semillas = semillas_replicas(seed, n_replicas)
+    quiebras = np.zeros(len(puntos), dtype=np.int64)
+    turnos = [Welford() for _ in puntos]
+
+    def tareas():
+        for i, punto in enumerate(puntos):
+            params = dict(params_base, **dict(zip(DIMENSIONES, map(float, punto))))
+            for s in semillas:
+                yield i, params, s
+
+    for i, resultado in iterar_replicas(tareas(), max_turnos, motor, procesos):
+        liquidez = resultado["series"]["liquidez"]
+        if len(liquidez) and liquidez[-1] <= 0:
+            quiebras[i] += 1
+            turnos[i].agregar(len(liquidez))
+
+    return quiebras, np.array([w.media if w.n else np.nan for w in turnos]), np.array([w.varianza() if w.n > 1 else np.nan for w in turnos])
+
+
+class SuperficieQuiebra:
+    # Observaciones (X, quiebras, turnos) y los dos procesos gaussianos ajustados sobre ellas
+    def __init__(self, params_base, n_replicas, max_turnos, motor="mesa"):
+        self.params_base = dict(params_base)
+        self.n_replicas = n_replicas
+        self.max_turnos = max_turnos
+        self.motor = motor
+        self.X = np.empty((0, len(DIMENSIONES)))
+        self.quiebras = np.empty(0, dtype=np.int64)
+        self.turno_medio = np.empty(0)
+        self.turno_var = np.empty(0)
+        self.gp_prob = None
+        self.gp_turno = None
+
+    def agregar(self, X, quiebras, turno_medio, turno_var):
+        self.X = np.vstack([self.X, X])
+        self.quiebras = np.concatenate([self.quiebras, quiebras])
+        self.turno_medio = np.concatenate([self.turno_medio, turno_medio])
+        self.turno_var = np.concatenate([self.turno_var, turno_var])
+
+    def ajustar(self):
+        # Una dimensión que apenas influye (p. ej. la difusión en la probabilidad de quiebra) lleva
+        # su length_scale al límite superior: es el resultado esperado, no un fallo del ajuste
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", ConvergenceWarning)
+            return self._ajustar()
+
+    def _ajustar(self):
+        U = a_unitario(self.X)
+        kernel = ConstantKernel(1.0) * Matern(length_scale=np.full(len(DIMENSIONES), 0.3), length_scale_bounds=(0.02, 100), nu=2.5)
+
+        # Probabilidad de quiebra: el ruido de cada punto es el binomial de n_replicas réplicas
+        # (con la proporción suavizada para que 0/n y n/n no digan "ruido cero")
+        prob = self.quiebras / self.n_replicas
+        suavizada = (self.quiebras + 0.5) / (self.n_replicas + 1)
+        ruido = suavizada * (1 - suavizada) / self.n_replicas
+        self.gp_prob = GaussianProcessRegressor(kernel, alpha=ruido / max(prob.var(), 1e-6), normalize_y=True,
+                                                n_restarts_optimizer=2, random_state=0).fit(U, prob)
+
+        # Turno de colapso: solo existe donde hubo alguna quiebra. Crece de forma multiplicativa
+        # con el encaje (de 1-2 turnos a decenas), así que se ajusta su logaritmo; el ruido es
+        # el de la media de las réplicas quebradas llevado a escala logarítmica
+        hubo = self.quiebras > 0
+        if hubo.sum() >= 3:
+            var_tipica = np.nanmedian(self.turno_var[hubo]) if np.isfinite(self.turno_var[hubo]).any() else 1.0
+            var = np.where(np.isfinite(self.turno_var[hubo]), self.turno_var[hubo], var_tipica)
+            turnos = self.turno_medio[hubo]
+            log_turnos = np.log(turnos)
+            ruido = np.maximum(var, 1.0) / self.quiebras[hubo] / turnos ** 2
+            self.gp_turno = GaussianProcessRegressor(kernel, alpha=ruido / max(log_turnos.var(), 1e-6), normalize_y=True,
+                                                     n_restarts_optimizer=2, random_state=0).fit(U[hubo], log_turnos)
+        return self
+
+    def predecir(self, X):
+        # Arrays (prob, prob_std, turno, turno_std) para una matriz de puntos (una fila por punto)
+        U = a_unitario(np.atleast_2d(X))
+        prob, prob_std = self.gp_prob.predict(U, return_std=True)
+        if self.gp_turno is not None:
+            log_turno, log_std = self.gp_turno.predict(U, return_std=True)
+            turno = np.clip(np.exp(log_turno), 1, self.max_turnos)
+            turno_std = turno * log_std
+        else:
+            turno = turno_std = np.full(len(U), np.nan)
+        return np.clip(prob, 0, 1), prob_std, turno, turno_std
+
+    def consultar(self, news_score, news_validez, news_difusion, encaje):
+        prob, prob_std, turno, turno_std = self.predecir([[news_score, news_validez, news_difusion, encaje]])
+        return {"prob_quiebra": float(prob[0]), "prob_std": float(prob_std[0]),
+                "turno_colapso": float(turno[0]), "turno_std": float(turno_std[0])}
+
+    def compatible(self, params, motor=None):
+        # La superficie solo vale para la población, el banco y el motor con que se construyó
+        # (mesa y vectorizado no dan los mismos resultados)
+        if motor is not None and motor != self.motor:
+            return False
+        return all(params.get(clave) == valor for clave, valor in self.params_base.items())
+
+    def guardar(self, ruta):
+        joblib.dump(self, ruta)
+
+    @staticmethod
+    def cargar(ruta):
+        return joblib.load(ruta)
+
+
+def puntos_mas_inciertos(superficie, n_puntos, candidatos=2048, seed=None):
+    # Elige entre muchos candidatos los de mayor desviación del sustituto, sin repetir
+    # zona: cada elegido descarta a los candidatos más cercanos que un radio mínimo
+    U = qmc.Sobol(d=len(DIMENSIONES), scramble=True, seed=seed).random(candidatos)
+    _, std, _, _ = superficie.predecir(desde_unitario(U))
+    radio = 0.5 / n_puntos ** (1 / len(DIMENSIONES))
+
+    elegidos = []
+    for i in np.argsort(-std):
+        if all(np.linalg.norm(U[i] - U[j]) >= radio for j in elegidos):
+            elegidos.append(i)
+            if len(elegidos) == n_puntos:
+                break
+    return desde_unitario(U[elegidos])
+
+
+def construir_superficie(params_base, n_inicial=40, rondas=4, por_ronda=10, n_replicas=10, max_turnos=150,
+                         seed=None, metodo="lhs", motor="mesa", procesos=None, informar=print):
+    # params_base: resto de argumentos del modelo (n, total_depositos, p_no_clientes...)
+    superficie = SuperficieQuiebra(params_base, n_replicas, max_turnos, motor)
+    semillas_diseno = [np.random.default_rng(s) for s in np.random.SeedSequence(seed).spawn(rondas + 1)]
+
+    # Puntos fijos de control para seguir cómo baja la incertidumbre ronda a ronda
+    control = qmc.Sobol(d=len(DIMENSIONES), scramble=True, seed=0).random(512)
+
+    X = diseno(n_inicial, metodo, seed=semillas_diseno[0])
+    for ronda in range(rondas + 1):
+        superficie.agregar(X, *evaluar_puntos(X, params_base, n_replicas, max_turnos, seed, motor, procesos))
+        superficie.ajustar()
+        if informar:
+            _, std, _, _ = superficie.predecir(desde_unitario(control))
+            informar(f"Ronda {ronda}: {len(superficie.X)} puntos, desviación media de la prob. de quiebra {std.mean():.3f}")
+        if ronda < rondas:
+            X = puntos_mas_inciertos(superficie, por_ronda, seed=semillas_diseno[ronda + 1])
+    return superficie
@@ -0,0 +1,132 @@
+# simulation/trayectorias.py
+import glob
+import json
+import os
+
+import numpy as np
+
+from .red import Topologia
+
+# --- TRAYECTORIAS GRABADAS (TURNO × AGENTE) ---
+# Una grabación es un directorio con un fichero binario crudo por campo de los agentes: una
+# fila de n valores por turno, en orden C, que solo crece por el final. meta.json describe
+# el dtype y el fichero de cada campo, así cualquier herramienta los abre sin copiarlos con
+# np.memmap (u otro lector de arrays planos). El nº de turnos sale del tamaño de los
+# ficheros: un lector ve los turnos ya escritos aunque la grabación siga en curso o se cortara.
+
+DIRECTORIO_TRAYECTORIAS = os.path.join("resultados", "trayectorias")
+# Campo grabado: (clave en estado_nodos(), dtype en disco)
+CAMPOS_TRAYECTORIA = {
+    "porcentaje_retirado": ("fuga", "<f4"),
+    "saldo": ("saldo", "<f8"),
+    "alcance_noticia": ("alcance", "|u1"),
+}
+# Resumen de cada turno (resumen_turno()), una fila de float64 por turno
+SERIES_TRAYECTORIA = ("liquidez", "huidas", "informadas", "intensidad_rumor")
+
+
+class GrabadorTrayectoria:
+    # Se crea con el modelo ya construido (turno 0 sin simular) y recibe grabar() tras cada step
+    def __init__(self, directorio, model, **info):
+        os.makedirs(directorio, exist_ok=True)
+        self.directorio = directorio
+        topologia = model.topologia
+        self.n = topologia.n
+
+        # Lo que no cambia durante la corrida: red y tipo de cada nodo
+        np.savez(os.path.join(directorio, "estatico.npz"), indptr=topologia.indptr, indices=topologia.indices,
+                 tipo=np.asarray(model.estado_nodos()["tipo"], dtype=np.uint8))
+        meta = {
+            "n": self.n,
+            "campos": {campo: {"fichero": f"{campo}.bin", "dtype": dtype} for campo, (_, dtype) in CAMPOS_TRAYECTORIA.items()},
+            "series": {"fichero": "series.bin", "dtype": "<f8", "columnas": list(SERIES_TRAYECTORIA)},
+            "representacion_por_nodo": float(model.representacion_por_nodo),
+            "poblacion_objetivo": int(model.poblacion_objetivo),
+            "liquidez_inicial": float(model.liquidez_inicial),
+            **info,
+        }
+        with open(os.path.join(directorio, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2, ensure_ascii=False)
+
+        self.ficheros = {campo: open(os.path.join(directorio, f"{campo}.bin"), "wb") for campo in CAMPOS_TRAYECTORIA}
+        self.fichero_series = open(os.path.join(directorio, "series.bin"), "wb")
+        self.turnos = 0
+
+    def grabar(self, model, resumen=None, estado=None):
+        # resumen y estado se pueden pasar si ya se han calculado para este turno
+        estado = estado or model.estado_nodos()
+        resumen = resumen or model.resumen_turno()
+        for campo, (clave, dtype) in CAMPOS_TRAYECTORIA.items():
+            self.ficheros[campo].write(np.ascontiguousarray(estado[clave], dtype=dtype).tobytes())
+        # Las series van al final: un turno cuenta como escrito cuando lo está su fila de series
+        for f in self.ficheros.values():
+            f.flush()
+        self.fichero_series.write(np.array([resumen[clave] for clave in SERIES_TRAYECTORIA], dtype="<f8").tobytes())
+        self.fichero_series.flush()
+        self.turnos += 1
+
+    def cerrar(self):
+        for f in self.ficheros.values():
+            f.close()
+        self.fichero_series.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excepcion):
+        self.cerrar()
+
+
+class TrayectoriaGrabada:
+    # Lectura sin copia: cada campo es un np.memmap (turnos, n) de solo lectura
+    def __init__(self, directorio):
+        self.directorio = directorio
+        with open(os.path.join(directorio, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.n = self.meta["n"]
+        with np.load(os.path.join(directorio, "estatico.npz")) as datos:
+            self.indptr, self.indices, self.tipo = datos["indptr"], datos["indices"], datos["tipo"]
+        self._topologia = None
+
+        columnas = len(SERIES_TRAYECTORIA)
+        self.turnos = self._filas(self.meta["series"], columnas)
+        for info in self.meta["campos"].values():
+            self.turnos = min(self.turnos, self._filas(info, self.n))
+        self.campos = {campo: self._abrir(info, self.n) for campo, info in self.meta["campos"].items()}
+        series = self._abrir(self.meta["series"], columnas)
+        self.series = {clave: series[:, j] for j, clave in enumerate(SERIES_TRAYECTORIA)}
+        self.series["paso"] = np.arange(self.turnos)
+
+    def _filas(self, info, ancho):
+        return os.path.getsize(os.path.join(self.directorio, info["fichero"])) // (ancho * np.dtype(info["dtype"]).itemsize)
+
+    def _abrir(self, info, ancho):
+        if self.turnos == 0:  # np.memmap no admite ficheros vacíos
+            return np.empty((0, ancho), dtype=info["dtype"])
+        return np.memmap(os.path.join(self.directorio, info["fichero"]), dtype=info["dtype"], mode="r", shape=(self.turnos, ancho))
+
+    def __len__(self):
+        return self.turnos
+
+    def topologia(self):
+        if self._topologia is None:
+            self._topologia = Topologia(None, self.indptr, self.indices)
+        return self._topologia
+
+    def estado(self, t):
+        # Mismo formato que estado_nodos() de los modelos, para dibujar el turno t
+        return {
+            "tipo": self.tipo,
+            "alcance": self.campos["alcance_noticia"][t].view(bool),
+            "fuga": self.campos["porcentaje_retirado"][t].astype(float),
+            "saldo": self.campos["saldo"][t],
+        }
+
+    def resumen(self, t):
+        return {clave: float(self.series[clave][t]) for clave in SERIES_TRAYECTORIA}
+
+
+def listar_trayectorias(directorio=DIRECTORIO_TRAYECTORIAS):
+    # Grabaciones (directorios con meta.json) bajo 'directorio', de la más reciente a la más antigua
+    metas = glob.glob(os.path.join(directorio, "**", "meta.json"), recursive=True)
+    return [os.path.dirname(m) for m in sorted(metas, key=os.path.getmtime, reverse=True)]